@@ -62,6 +62,7 @@ class Benchmark:
         self.benchmark_sent_reqs = []
         self.benchmark_sent = []
         self.benchmark_model_sla = []
+        self.benchmark_rejected = []
         self.benchmark_data_i = 0
         self.benchmark_updates_count = 0
         self.benchmark_updates_count_max = 0
@@ -141,6 +142,9 @@ class Benchmark:
 
     def post_request(self, json_request):
         response = requests.post(self.endpoint, json=json_request)
+        if self.mode == Mode.BENCHMARK and response.status_code in (429, 503):
+            # the request was rejected by the admission control of the dispatcher
+            return response
         response.raise_for_status()
         return response
 
@@ -180,6 +184,7 @@ class Benchmark:
         self.logger.info("req %s", self.benchmark_req)
         self.logger.info("reqs sent %s", self.benchmark_sent)
         self.logger.info("model sla %s", self.benchmark_model_sla)
+        self.logger.info("reqs rejected %s", self.benchmark_rejected)
         self.logger.info("containers %s", self.benchmark_containers)
 
         plt.plot(x_val, self.benchmark_rt, '--', label="avg RT")
@@ -197,13 +202,16 @@ class Benchmark:
         plt.plot(x_val, self.benchmark_model_sla, label="Model SLA")
         plt.title("model SLA")
         plt.show()
+        plt.plot(x_val, self.benchmark_rejected, label="# reqs rejected")
+        plt.title("# reqs rejected")
+        plt.show()
 
     def save_results_benchmark(self):
         if self.benchmark_result_file is not None:
             self.logger.info("Saving to file...")
             benchmark_data = [self.benchmark_rt, self.benchmark_rt_process, self.benchmark_req, self.benchmark_sent,
                               self.benchmark_model_sla,
-                              self.benchmark_containers]
+                              self.benchmark_containers, self.benchmark_rejected]
             with open(self.benchmark_result_file + self.model.name + ".out", 'wb') as f:
                 pickle.dump(benchmark_data, f)
             self.logger.info("Saved")
@@ -222,6 +230,7 @@ class Benchmark:
                     self.benchmark_rt_process.append(metric["metrics_from_ts"]["avg_process"])
                     self.benchmark_req.append(
                         metric["metrics_from_ts"]["created"] + metric["metrics_from_ts"]["completed"])
+                    self.benchmark_rejected.append(metric["metrics_from_ts"].get("rejected", 0))
             sent_list = []
             for i in range(len(self.bench_data)):
                 sent_list.append(self.benchmark_sent_reqs[i] - old_sent[i])
@@ -76,13 +76,32 @@ class ContainersManagerConfiguration:
 
 
 class RequestsStoreConfiguration:
+    retention_time = 600
+    max_requests = 1000000
+    downsample_width = 60
+    aggregates_retention_time = 86400
+    log_dir = None
+    log_fsync_interval = 1
+
     def __init__(self,
                  containers_manager=None,
+                 retention_time=600,
+                 max_requests=1000000,
+                 downsample_width=60,
+                 aggregates_retention_time=86400,
+                 log_dir=None,
+                 log_fsync_interval=1,
                  json_data=None):
         if json_data:
             self.__dict__ = json_data
         else:
             self.containers_manager = containers_manager
+            self.retention_time = retention_time
+            self.max_requests = max_requests
+            self.downsample_width = downsample_width
+            self.aggregates_retention_time = aggregates_retention_time
+            self.log_dir = log_dir
+            self.log_fsync_interval = log_fsync_interval
         self.models_endpoint = self.containers_manager + "/models"
         self.containers_endpoint = self.containers_manager + "/containers"
 
@@ -116,6 +135,30 @@ class ControllerConfiguration:
 
 
 class DispatcherConfiguration:
+    # optional settings, the defaults are used when missing from the json configuration
+    pool_maxsize = None
+    pool_block = False
+    sync_timeout = 30
+    max_batch_size = 1
+    max_batch_wait = 0
+    log_batch_size = 100
+    log_flush_interval = 1
+    log_max_pending = 100000
+    log_spill_file = None
+    log_payloads_sample = 0
+    max_queue_size = 0
+    admission_sla_factor = 0
+    dispatching_policy = 0
+    containers_refresh_interval = 5
+    deadline_sla_factor = 0
+    request_timeout = 0
+    hedge_percentile = 0
+    max_retries = 0
+    breaker_threshold = 5
+    breaker_open_time = 5
+    breaker_latency_factor = 0
+    drop_late_requests = False
+
     def __init__(self,
                  containers_manager=None,
                  requests_store=None,
@@ -125,6 +168,28 @@ class DispatcherConfiguration:
                  max_polling_threads=None,
                  max_consumers_cpu=None,
                  max_consumers_gpu=None,
+                 pool_maxsize=None,
+                 pool_block=False,
+                 sync_timeout=30,
+                 max_batch_size=1,
+                 max_batch_wait=0,
+                 log_batch_size=100,
+                 log_flush_interval=1,
+                 log_max_pending=100000,
+                 log_spill_file=None,
+                 log_payloads_sample=0,
+                 max_queue_size=0,
+                 admission_sla_factor=0,
+                 dispatching_policy=0,
+                 containers_refresh_interval=5,
+                 deadline_sla_factor=0,
+                 request_timeout=0,
+                 hedge_percentile=0,
+                 max_retries=0,
+                 breaker_threshold=5,
+                 breaker_open_time=5,
+                 breaker_latency_factor=0,
+                 drop_late_requests=False,
                  json_data=None):
         if json_data:
             self.__dict__ = json_data
@@ -138,8 +203,31 @@ class DispatcherConfiguration:
             self.max_polling_threads = max_polling_threads
             self.max_consumers_cpu = max_consumers_cpu
             self.max_consumers_gpu = max_consumers_gpu
+            self.pool_maxsize = pool_maxsize
+            self.pool_block = pool_block
+            self.sync_timeout = sync_timeout
+            self.max_batch_size = max_batch_size
+            self.max_batch_wait = max_batch_wait
+            self.log_batch_size = log_batch_size
+            self.log_flush_interval = log_flush_interval
+            self.log_max_pending = log_max_pending
+            self.log_spill_file = log_spill_file
+            self.log_payloads_sample = log_payloads_sample
+            self.max_queue_size = max_queue_size
+            self.admission_sla_factor = admission_sla_factor
+            self.dispatching_policy = dispatching_policy
+            self.containers_refresh_interval = containers_refresh_interval
+            self.deadline_sla_factor = deadline_sla_factor
+            self.request_timeout = request_timeout
+            self.hedge_percentile = hedge_percentile
+            self.max_retries = max_retries
+            self.breaker_threshold = breaker_threshold
+            self.breaker_open_time = breaker_open_time
+            self.breaker_latency_factor = breaker_latency_factor
+            self.drop_late_requests = drop_late_requests
 
         self.models_endpoint = self.containers_manager + "/models"
         self.containers_endpoint = self.containers_manager + "/containers"
         self.requests_store_endpoint = self.requests_store + "/requests"
+        self.requests_store_bulk_endpoint = self.requests_store + "/requests/bulk"
 
@@ -1,7 +1,8 @@
-from flask import Flask, jsonify
+from flask import Flask, jsonify, Response
 from flask import request
 import logging
 import requests
+import uuid
 from flask_cors import CORS
 from models.device import Device
 from models.model import Model
@@ -14,6 +15,10 @@ CORS(app)
 config = None
 models = []
 containers = []
+# the ETag of GET /containers: the id of this start of the containers manager and the version of the containers,
+# incremented at every change, so a client never gets 304 for the containers read before a restart
+containers_boot = uuid.uuid4().hex
+containers_version = 0
 
 
 @app.route('/', methods=['GET'])
@@ -21,10 +26,22 @@ def get_status():
     return {"status": status}
 
 
+def containers_changed():
+    global containers_version
+    containers_version += 1
+
+
 @app.route('/containers', methods=['GET', 'PATCH'])
 def get_update_containers():
     if request.method == 'GET':
-        return jsonify([container.to_json() for container in containers])
+        # the containers are not sent again if the client has the last version
+        etag = containers_boot + "-" + str(containers_version)
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+        else:
+            response = jsonify([container.to_json() for container in containers])
+        response.set_etag(etag)
+        return response
     elif request.method == 'PATCH':
         data = request.get_json()
         app.logger.info("Request: " + str(data))
@@ -36,6 +53,7 @@ def get_update_containers():
         for container in containers:
             if container.container_id == data["container_id"] or container.container_id[:12] == data["container_id"]:
                 container.quota = data["cpu_quota"]
+                containers_changed()
                 app.logger.info("Container %s updated")
                 break
         return {"response": "ok"}
@@ -134,7 +152,8 @@ def configure():
                       sla=model["sla"],
                       alpha=model["alpha"],
                       tfs_model_url=model["tfs_model_url"],
-                      initial_replicas=model["initial_replicas"])
+                      initial_replicas=model["initial_replicas"],
+                      weight=model.get("weight", 1))
             if "profiled_rt" in model:
                 m.profiled_rt = model["profiled_rt"]
             models.append(m)
@@ -157,6 +176,7 @@ def configure():
     logging.info("+ %d CPU containers", len(list(filter(lambda m: m.device == Device.CPU, containers))))
     logging.info("+ %d GPU containers", len(list(filter(lambda m: m.device == Device.GPU, containers))))
     logging.info([container.to_json() for container in containers])
+    containers_changed()
 
     status = "configured"
     logging.info(status)
@@ -177,6 +197,7 @@ def start():
     status = "quota reset"
     logging.info(status)
     quota_reset()
+    containers_changed()
 
     status = "active"
     logging.info(status)
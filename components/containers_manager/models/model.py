@@ -1,6 +1,8 @@
 import uuid
 
 class Model:
+    # default of the models read from JSON without it
+    weight = 1
 
     def __init__(self,
                  name: str = None,
@@ -10,6 +12,7 @@ class Model:
                  profiled_rt: float = None,
                  tfs_model_url: str = None,
                  initial_replicas: int = None,
+                 weight: float = 1,
                  json_data=None):
         if json_data:
             self.__dict__ = json_data
@@ -21,6 +24,7 @@ class Model:
             self.profiled_rt = profiled_rt
             self.tfs_model_url = tfs_model_url
             self.initial_replicas = initial_replicas
+            self.weight = weight
 
     def to_json(self):
         return {
@@ -28,5 +32,6 @@ class Model:
             "version": self.version,
             "sla": self.sla,
             "alpha": self.alpha,
-            "profiled_rt": self.profiled_rt
+            "profiled_rt": self.profiled_rt,
+            "weight": self.weight
         }
@@ -10,19 +10,49 @@ class ReqState(IntEnum):
     WAITING = 1
     COMPLETED = 2
     ERROR = 3
+    REJECTED = 4
 
 
 class Req:
+    """
+    Record of a request.
+
+    The attributes are slots, so that a stored request takes no dict: the id is a string computed once and
+    the state and the device are small ints (IntEnum).
+    """
+    # summary of a request, in the order of to_json
+    FIELDS = ("id", "model", "version", "node", "container", "container_id", "device", "ts_in", "ts_wait", "ts_out",
+              "process_time", "resp_time", "state")
+    # payloads, included in the json with verbose
+    PAYLOADS = ("instances", "response")
+    __slots__ = FIELDS + PAYLOADS + ("keep_payloads",)
 
     def __init__(self,
                  model: str = None,
                  version: int = None,
                  instances: list = None,
                  json_data=None) -> None:
+        # the payloads of a sampled request are kept to be logged with verbose
+        self.keep_payloads = False
         if json_data:
-            self.__dict__ = json_data
+            get = json_data.get
+            self.id = get("id")
+            self.model = get("model")
+            self.version = get("version")
+            self.instances = get("instances")
+            self.ts_in = get("ts_in")
+            self.ts_wait = get("ts_wait")
+            self.ts_out = get("ts_out")
+            self.process_time = get("process_time")
+            self.resp_time = get("resp_time")
+            self.node = get("node")
+            self.container = get("container")
+            self.container_id = get("container_id")
+            self.device = get("device")
+            self.response = get("response")
+            self.state = get("state", ReqState.CREATED)
         else:
-            self.id = uuid.uuid4()
+            self.id = str(uuid.uuid4())
             self.model = model
             self.version = version
             self.instances = instances
@@ -38,12 +68,12 @@ class Req:
             self.response = None
             self.state = ReqState.CREATED
 
-    def set_waiting(self):
-        self.ts_wait = time.time()
+    def set_waiting(self, ts=None):
+        self.ts_wait = ts if ts is not None else time.time()
         self.state = ReqState.WAITING
 
-    def set_completed(self, response):
-        self.ts_out = time.time()
+    def set_completed(self, response, ts=None):
+        self.ts_out = ts if ts is not None else time.time()
         self.resp_time = self.ts_out - self.ts_in
         self.process_time = self.ts_out - self.ts_wait
         self.response = response
@@ -53,9 +83,23 @@ class Req:
         self.response = response
         self.state = ReqState.ERROR
 
+    def set_rejected(self, response):
+        self.response = response
+        self.state = ReqState.REJECTED
+
+    def release_payloads(self, response=True):
+        """
+        Drop the instances and, if response is True, the response: only the summary of the request is kept
+        """
+        if self.keep_payloads:
+            return
+        self.instances = None
+        if response:
+            self.response = None
+
     def to_json(self, verbose=False):
         req_json = {
-            "id": str(self.id),
+            "id": self.id,
             "model": self.model,
             "version": self.version,
             "node": self.node,
@@ -76,10 +120,19 @@ class Req:
 
         return req_json
 
+    @staticmethod
+    def to_json_list(reqs, verbose=False):
+        return [req.to_json(verbose) for req in reqs]
+
+    @staticmethod
+    def from_json_list(reqs_json):
+        return [Req(json_data=req_json) for req_json in reqs_json]
+
     @staticmethod
     def metrics(reqs, from_ts = 0):
         created = list(filter(lambda r: r.ts_in > float(from_ts), reqs))
         completed = list(filter(lambda r: r.ts_out is not None and r.ts_out > float(from_ts), reqs))
+        rejected = list(filter(lambda r: r.state == ReqState.REJECTED, created))
         resp_times = list(map(lambda r: r.resp_time, completed))
         process_time = list(map(lambda r: r.process_time, completed))
         on_gpu = list(filter(lambda r: r.device == Device.GPU, completed))
@@ -98,6 +151,7 @@ class Req:
         return {
             "completed": len(completed),
             "created": len(created),
+            "rejected": len(rejected),
             "on_gpu": len(on_gpu),
             "on_cpu": len(on_cpu),
             "avg": mean_resp_time,
@@ -0,0 +1,62 @@
+from enum import Enum
+
+from models.device import Device
+
+
+class Rejection(Enum):
+    QUEUE_FULL = (503, "queue full")
+    SLA = (429, "predicted response time over the SLA")
+
+    def __init__(self, status_code, message):
+        self.status_code = status_code
+        self.message = message
+
+
+class AdmissionControl:
+    """
+    Decides if a new request can be queued.
+
+    A request is rejected when the queue of its model is full or, if sla_factor > 0, when the response time
+    predicted from the queue depth and the profiled response time of the model is over sla_factor * SLA.
+    The queued requests are shared by all the containers that serve the model.
+    """
+
+    def __init__(self, models, containers, sla_factor: float = 0) -> None:
+        self.sla_factor = sla_factor
+        self.models = {model.name: model for model in models}
+        self.update_containers(containers)
+
+        # counters of the rejected requests by model
+        self.rejected = {model.name: {rejection.name.lower(): 0 for rejection in Rejection} for model in models}
+
+    def update_containers(self, containers):
+        # containers that can serve each model, the GPU containers serve all the models
+        self.servers = {model: max(1, len([c for c in containers
+                                           if c.active and (c.model == model or c.device == Device.GPU)]))
+                        for model in self.models}
+
+    def predicted_rt(self, model, queue_depth):
+        profiled_rt = self.models[model].profiled_rt
+        if profiled_rt is None:
+            return None
+        # the new request waits the queued requests and then it is processed
+        return (queue_depth / self.servers[model] + 1) * profiled_rt
+
+    def check(self, model, reqs_queue):
+        """
+        Return None if the request is admitted, the Rejection otherwise
+        """
+        rejection = None
+        if reqs_queue.full():
+            rejection = Rejection.QUEUE_FULL
+        elif self.sla_factor > 0 and self.models[model].sla is not None:
+            predicted_rt = self.predicted_rt(model, reqs_queue.qsize())
+            if predicted_rt is not None and predicted_rt > self.sla_factor * self.models[model].sla:
+                rejection = Rejection.SLA
+
+        if rejection is not None:
+            self.rejected[model][rejection.name.lower()] += 1
+        return rejection
+
+    def metrics(self):
+        return self.rejected
@@ -0,0 +1,109 @@
+"""
+Dispatching policies with containers of different speed.
+
+Local stubs of TF Serving (half_plus_two) that serve one request at a time with different service times are started,
+the same predict requests are forwarded with every dispatching policy and the response times and the share of the
+containers are compared.
+
+Run from the dispatcher folder:
+    python -m benchmarks.dispatching_policies_benchmark --requests 2000 --threads 8 --delays 0.002 0.01
+"""
+import argparse
+import json
+import logging
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from dispatcher import Dispatcher, DispatchingPolicy
+from models.container import Container
+from models.device import Device
+from models.model import Model
+from models.req import Req
+
+MODEL = "half_plus_two"
+INSTANCES = [1.0, 2.0, 5.0]
+
+
+def stub_handler(delay):
+    # the stub serves one request at a time, as a container with a single core quota
+    busy = threading.Lock()
+
+    class TFServingStub(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def do_POST(self):
+            data = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            with busy:
+                time.sleep(delay)
+            body = json.dumps({"predictions": [x / 2 + 2 for x in data["instances"]]}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return TFServingStub
+
+
+def start_stub(delay):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), stub_handler(delay))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def run(dispatcher, num_requests, threads):
+    def send(_):
+        req = Req(MODEL, 1, INSTANCES)
+        dispatcher.compute(req)
+        return req
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        reqs = list(pool.map(send, range(num_requests)))
+    elapsed = time.perf_counter() - start
+
+    resp_times = sorted(req.resp_time for req in reqs)
+    shares = {container_id: sum(1 for req in reqs if req.container_id == container_id) / num_requests
+              for container_id in dispatcher.stats}
+    return {"req/s": num_requests / elapsed,
+            "avg [ms]": statistics.mean(resp_times) * 1000,
+            "p99 [ms]": resp_times[int(len(resp_times) * 0.99)] * 1000,
+            "share": shares}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--delays', type=float, nargs='+', default=[0.002, 0.01])
+    args = parser.parse_args()
+
+    logging.basicConfig(level='INFO', format="%(message)s")
+
+    servers = [start_stub(delay) for delay in args.delays]
+    containers = []
+    for i, server in enumerate(servers):
+        container = Container(MODEL, 1, True, "tfserving-cpu-" + str(i), "127.0.0.1", server.server_address[1],
+                              Device.CPU, 1)
+        container.container_id = "stub-" + str(i) + " (" + str(args.delays[i] * 1000) + " ms)"
+        containers.append(container)
+
+    for policy in DispatchingPolicy:
+        dispatcher = Dispatcher(logging.getLogger("dispatcher"), [Model(MODEL, 1, 1)], containers,
+                                policy, Device.CPU, max_consumers=args.threads)
+        dispatcher.logger.setLevel(logging.WARNING)
+        result = run(dispatcher, args.requests, args.threads)
+        logging.info("%-28s %s", policy.name, ", ".join("%s: %s" % (k, "%.3f" % v if isinstance(v, float) else
+                                                                    {c: "%.2f" % s for c, s in v.items()})
+                                                         for k, v in result.items()))
+
+    for server in servers:
+        server.shutdown()
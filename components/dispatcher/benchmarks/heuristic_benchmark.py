@@ -0,0 +1,127 @@
+"""
+Heuristic 1 queues policy with long queues.
+
+The queues of the models are filled with requests that arrived in the last seconds and some completed requests are
+recorded for every model, then the picks per second of the heuristic are measured, compared with the previous
+heuristic that copied the queued requests and computed the means at every pick.
+The decisions of the two heuristics are compared on random queues, with the same clock: the previous heuristic read
+the clock for every queued request.
+
+Run from the dispatcher folder:
+    python -m benchmarks.heuristic_benchmark --models 10 --requests 10000
+"""
+import argparse
+import logging
+import queue
+import random
+import statistics
+import time
+from unittest import mock
+
+from models.model import Model
+from models.queues_policies import QueuesPolicies
+from models.req import Req
+from queues_scheduler import QueuesScheduler
+
+
+def scan_heuristic_1(reqs_queues, responses_list, models, max_sample_size=QueuesPolicies.MAX_SAMPLE_SIZE):
+    # the previous heuristic, that scans the queued requests and the last responses at every pick
+    models = {model.name: model for model in models}
+
+    def policy():
+        queue_lengths = {}
+        needs = {}
+        total_queues_length = 0
+        for model in reqs_queues:
+            queue_lengths[model] = reqs_queues[model].qsize()
+            total_queues_length += queue_lengths[model]
+            if queue_lengths[model] == 0:
+                needs[model] = 0
+                continue
+            profiled_rt = models[model].profiled_rt if models[model].profiled_rt is not None else 0
+            response_times = [time.time() - req.ts_in + profiled_rt for req in list(reqs_queues[model].queue)]
+            log_response_time = [req.ts_out - req.ts_in for req in responses_list[model][-max_sample_size:]]
+            if not log_response_time:
+                avg_response_time = statistics.mean(response_times)
+            else:
+                avg_response_time = statistics.mean(response_times) * 0.5 + statistics.mean(log_response_time) * 0.5
+            sla = models[model].sla
+            alpha = models[model].alpha
+            if avg_response_time < sla * (1 - alpha):
+                needs[model] = 0
+            else:
+                needs[model] = avg_response_time - sla + (alpha * sla)
+
+        if total_queues_length == 0:
+            return random.choice(list(reqs_queues.keys()))
+        if max(needs.values()) == 0:
+            return max(queue_lengths, key=queue_lengths.get)
+        return max(needs, key=needs.get)
+
+    return policy
+
+
+def fill(num_models, num_requests, num_responses):
+    # models with different SLAs, the requests arrived in the last two seconds
+    now = time.time()
+    models = [Model("model-" + str(i), 1, random.uniform(0.5, 3), random.uniform(0, 1), random.uniform(0.01, 0.1))
+              for i in range(num_models)]
+    reqs_queues = {model.name: queue.Queue() for model in models}
+    responses_list = {model.name: [] for model in models}
+    queues_policies = QueuesPolicies(reqs_queues, models)
+    scheduler = QueuesScheduler(reqs_queues, queues_policies=queues_policies)
+    for _ in range(num_requests):
+        model = random.choice(models).name
+        req = Req(model, 1, [1])
+        req.ts_in = now - random.uniform(0, 2)
+        scheduler.put(model, req)
+    for model in random.sample(models, len(models) // 2):
+        for _ in range(num_responses):
+            req = Req(model.name, 1, [1])
+            req.ts_in = now - random.uniform(0, 2)
+            req.ts_out = req.ts_in + random.uniform(0.01, 2)
+            responses_list[model.name].append(req)
+            queues_policies.completed(req)
+    return models, reqs_queues, responses_list, queues_policies, scheduler
+
+
+def picks_per_second(policy, duration):
+    picks = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < duration:
+        policy()
+        picks += 1
+    return picks / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--models', type=int, default=10)
+    parser.add_argument('--requests', type=int, default=10000)
+    parser.add_argument('--responses', type=int, default=100)
+    parser.add_argument('--duration', type=float, default=1)
+    parser.add_argument('--checks', type=int, default=200)
+    args = parser.parse_args()
+
+    logging.basicConfig(level='INFO', format="%(message)s")
+
+    models, reqs_queues, responses_list, queues_policies, _ = fill(args.models, args.requests, args.responses)
+    indexed = picks_per_second(queues_policies.policy_heuristic_1, args.duration)
+    scan = picks_per_second(scan_heuristic_1(reqs_queues, responses_list, models), args.duration)
+    logging.info("models: %d, queued requests: %d, picks/s running sums: %.0f, scan: %.0f (x%.1f)",
+                 args.models, args.requests, indexed, scan, indexed / scan)
+
+    # same decisions on random queues, some of them drained
+    same = 0
+    for _ in range(args.checks):
+        models, reqs_queues, responses_list, queues_policies, scheduler = \
+            fill(args.models, random.randint(0, 200), random.randint(0, 100))
+        for _ in range(random.randint(0, 100)):
+            if scheduler.pending:
+                scheduler.get(queues_policies.policy_longest_queue)
+        if sum(reqs_queues[model].qsize() for model in reqs_queues) == 0:
+            same += 1
+            continue
+        with mock.patch("time.time", return_value=time.time()):
+            same += queues_policies.policy_heuristic_1() == scan_heuristic_1(reqs_queues, responses_list, models)()
+    logging.info("same decisions: %d/%d", same, args.checks)
@@ -0,0 +1,101 @@
+"""
+Per-request overhead of the HTTP transport used by the dispatcher.
+
+A local stub of TF Serving (half_plus_two) is started and the same predict request is sent:
+- with the module-level requests.post (a new TCP connection for every request)
+- with Dispatcher.compute, that reuses the keep-alive connections of the container session
+
+Run from the dispatcher folder:
+    python -m benchmarks.http_pool_benchmark --requests 2000 --threads 8
+"""
+import argparse
+import json
+import logging
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from dispatcher import Dispatcher, DispatchingPolicy
+from models.container import Container
+from models.device import Device
+from models.model import Model
+from models.req import Req
+
+MODEL = "half_plus_two"
+INSTANCES = [1.0, 2.0, 5.0]
+
+
+class TFServingStub(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        data = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        body = json.dumps({"predictions": [x / 2 + 2 for x in data["instances"]]}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), TFServingStub)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def run(send, num_requests, threads):
+    def timed(_):
+        start = time.perf_counter()
+        send()
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        latencies = list(pool.map(timed, range(num_requests)))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {"req/s": num_requests / elapsed,
+            "avg [ms]": statistics.mean(latencies) * 1000,
+            "p50 [ms]": latencies[len(latencies) // 2] * 1000,
+            "p99 [ms]": latencies[int(len(latencies) * 0.99)] * 1000}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--threads', type=int, default=8)
+    args = parser.parse_args()
+
+    logging.basicConfig(level='INFO', format="%(message)s")
+
+    server = start_stub()
+    port = server.server_address[1]
+    endpoint = "http://127.0.0.1:" + str(port) + "/v1/models/" + MODEL + ":predict"
+
+    container = Container(MODEL, 1, True, "tfserving-cpu-0", "127.0.0.1", port, Device.CPU, 100000)
+    container.container_id = "stub"
+    dispatcher = Dispatcher(logging.getLogger("dispatcher"), [Model(MODEL, 1, 1)], [container],
+                            DispatchingPolicy.ROUND_ROBIN, Device.CPU, max_consumers=args.threads)
+
+    results = {
+        "requests.post (no keep-alive)": run(lambda: requests.post(endpoint, json={"instances": INSTANCES}),
+                                             args.requests, args.threads),
+        "Dispatcher.compute (pooled)": run(lambda: dispatcher.compute(Req(MODEL, 1, INSTANCES)),
+                                           args.requests, args.threads)
+    }
+
+    for name, result in results.items():
+        logging.info("%-32s %s", name, ", ".join("%s: %.3f" % (k, v) for k, v in result.items()))
+
+    server.shutdown()
@@ -0,0 +1,100 @@
+"""
+Memory of the dispatcher under sustained load, when the requests store is slower than the incoming requests.
+
+The requests arrive at a constant rate, are completed with a response of the model of the same size and are logged:
+the requests logger sends them slower than they arrive, so log_max_pending requests wait to be sent.
+The RSS of the process is sampled while:
+- retained: the requests keep the instances and the whole requests.Response (the previous dispatcher)
+- released: the payloads are released as soon as the call returns
+- sampled: as released, but a sample of the requests keeps its payloads to be logged with verbose
+Every mode runs in a new process.
+
+Run from the dispatcher folder:
+    python -m benchmarks.memory_benchmark --size 150 --rate 1000 --duration 10
+"""
+import argparse
+import logging
+import multiprocessing
+import random
+import threading
+import time
+
+import requests
+
+from dispatcher import Dispatcher
+from models.req import Req
+from requests_logger import RequestsLogger
+
+MODES = ["retained", "released", "sampled"]
+
+
+def rss_mb():
+    with open("/proc/self/statm") as statm:
+        return int(statm.read().split()[1]) * 4096 / 2 ** 20
+
+
+def model_response(content):
+    response = requests.Response()
+    response.status_code = 200
+    response._content = content
+    response.headers["Content-Type"] = "application/json"
+    return response
+
+
+def run(mode, args, results):
+    instances = ("[" + ",".join(str(random.random()) for _ in range(args.size * 1024 // 20)) + "]").encode()
+    content = b'{"predictions":' + instances + b'}'
+
+    requests_logger = RequestsLogger(None, args.batch_size, 1, args.max_pending)
+    # the requests store takes send_time seconds for every batch
+    requests_logger.send = lambda payload: time.sleep(args.send_time)
+    threading.Thread(target=requests_logger.flush_loop, daemon=True).start()
+
+    samples = []
+    start = time.perf_counter()
+    sent = 0
+    while time.perf_counter() - start < args.duration:
+        # every request has its own payloads, as the requests read from the sockets
+        req = Req("model", 1, bytes(bytearray(instances)))
+        req.keep_payloads = mode == "sampled" and random.random() < args.sample
+        requests_logger.log(req)
+        req.set_waiting()
+        response = model_response(bytes(bytearray(content)))
+        if mode == "retained":
+            req.set_completed(response)
+        else:
+            Dispatcher.set_completed([req], response)
+            req.release_payloads()
+        requests_logger.log(req)
+
+        sent += 1
+        if sent % args.rate == 0:
+            samples.append(rss_mb())
+        # constant rate
+        time.sleep(max(0, start + sent / args.rate - time.perf_counter()))
+
+    results.put((mode, samples, requests_logger.metrics()))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--size', type=int, default=150, help="KB of the instances and of the predictions")
+    parser.add_argument('--rate', type=int, default=1000, help="requests per second")
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--max-pending', type=int, default=2000)
+    parser.add_argument('--batch-size', type=int, default=100)
+    parser.add_argument('--send-time', type=float, default=0.2)
+    parser.add_argument('--sample', type=float, default=0.01)
+    args = parser.parse_args()
+
+    logging.basicConfig(level='INFO', format="%(message)s")
+
+    results = multiprocessing.Queue()
+    for mode in MODES:
+        process = multiprocessing.Process(target=run, args=(mode, args, results))
+        process.start()
+        mode, samples, metrics = results.get()
+        process.join()
+        steady = samples[len(samples) // 2:]
+        logging.info("%-8s RSS MB steady: %7.0f, max: %7.0f, pending: %d, dropped: %d",
+                     mode, sum(steady) / len(steady), max(samples), metrics["pending"], metrics["dropped"])
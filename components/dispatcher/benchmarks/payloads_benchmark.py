@@ -0,0 +1,69 @@
+"""
+Cost of reading a predict request and writing the predict call of the container.
+
+For every kind of payload the body of a request is read and the body of the predict call is written:
+- json: the body is parsed and the instances serialized with the json module (the previous dispatcher)
+- orjson: the body is parsed and the instances serialized with orjson
+- raw: only the envelope is parsed, the raw instances are copied in the predict call
+
+Run from the dispatcher folder:
+    python -m benchmarks.payloads_benchmark --requests 50
+"""
+import argparse
+import base64
+import json
+import logging
+import os
+import random
+import time
+
+import orjson
+
+from payloads import parse_envelope, predict_body
+
+
+def payloads():
+    # a b64 JPEG image as resnet, a nested float image as vgg16 and a small float list
+    image = base64.b64encode(os.urandom(150000)).decode()
+    nested = [[[random.random() for _ in range(3)] for _ in range(224)] for _ in range(224)]
+    return {"b64 image (resnet)": json.dumps({"version": 1, "instances": [{"b64": image}]}).encode(),
+            "224x224x3 floats (vgg16)": json.dumps({"version": 1, "instances": [nested]}).encode(),
+            "1000 floats": json.dumps({"version": 1,
+                                       "instances": [random.random() for _ in range(1000)]}).encode()}
+
+
+def with_json(body):
+    data = json.loads(body)
+    return json.dumps({"instances": data["instances"]}).encode()
+
+
+def with_orjson(body):
+    data = orjson.loads(body)
+    return orjson.dumps({"instances": data["instances"]})
+
+
+def with_raw(body):
+    data, instances = parse_envelope(body)
+    return predict_body(instances)
+
+
+def ms_per_request(function, body, num_requests):
+    start = time.perf_counter()
+    for _ in range(num_requests):
+        function(body)
+    return (time.perf_counter() - start) / num_requests * 1000
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=50)
+    args = parser.parse_args()
+
+    logging.basicConfig(level='INFO', format="%(message)s")
+
+    for name, body in payloads().items():
+        assert orjson.loads(with_raw(body)) == orjson.loads(with_json(body))
+        times = {function.__name__[5:]: ms_per_request(function, body, args.requests)
+                 for function in (with_json, with_orjson, with_raw)}
+        logging.info("%-26s %8.0f KB, ms/req %s", name, len(body) / 1024,
+                     ", ".join("%s: %.3f" % (k, v) for k, v in times.items()))
@@ -0,0 +1,103 @@
+"""
+Queues policies with many models.
+
+The queues of the models are filled through the QueuesScheduler, that keeps the index of the queues policies updated,
+and the picks per second of every policy are measured, compared with the previous policies that scanned the queues
+at every pick (the earliest deadline and weighted fair policies have no previous version).
+Then the scheduler is measured taking all the requests with every policy.
+
+Run from the dispatcher folder:
+    python -m benchmarks.queues_policies_benchmark --models 10 100 1000 5000
+"""
+import argparse
+import logging
+import queue
+import random
+import time
+
+from models.model import Model
+from models.queues_policies import QueuesPolicies, QueuesPolicy
+from models.req import Req
+from queues_scheduler import QueuesScheduler
+
+POLICIES = [QueuesPolicy.RANDOM, QueuesPolicy.ROUND_ROBIN, QueuesPolicy.LONGEST_QUEUE,
+            QueuesPolicy.EARLIEST_DEADLINE, QueuesPolicy.WEIGHTED_FAIR]
+
+
+def scan_policies(reqs_queues):
+    # the previous policies, that build the list of the models or scan the queues at every pick
+    state = {"index": 0}
+
+    def round_robin():
+        state["index"] = (state["index"] + 1) % len(reqs_queues)
+        return list(reqs_queues.keys())[state["index"]]
+
+    def random_queue():
+        return random.choice(list(reqs_queues.keys()))
+
+    def longest_queue():
+        max_length = -1
+        selected_model = list(reqs_queues.keys())[0]
+        for model in reqs_queues:
+            if reqs_queues[model].qsize() > max_length:
+                max_length = reqs_queues[model].qsize()
+                selected_model = model
+        return selected_model
+
+    return {QueuesPolicy.RANDOM: random_queue,
+            QueuesPolicy.ROUND_ROBIN: round_robin,
+            QueuesPolicy.LONGEST_QUEUE: longest_queue}
+
+
+def fill(num_models, num_requests, busy_share):
+    # the requests are spread over busy_share of the models
+    models = [Model("model-" + str(i), 1, 1, 1, 0.01) for i in range(num_models)]
+    reqs_queues = {model.name: queue.Queue() for model in models}
+    queues_policies = QueuesPolicies(reqs_queues, models)
+    scheduler = QueuesScheduler(reqs_queues, queues_policies=queues_policies)
+    busy = random.sample(models, max(1, int(num_models * busy_share)))
+    for _ in range(num_requests):
+        model = random.choice(busy).name
+        scheduler.put(model, Req(model, 1, [1]))
+    return reqs_queues, queues_policies, scheduler
+
+
+def picks_per_second(policy, duration):
+    picks = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < duration:
+        for _ in range(100):
+            policy()
+        picks += 100
+    return picks / (time.perf_counter() - start)
+
+
+def drain_per_second(scheduler, policy, num_requests):
+    # the scheduler asks the policy until it selects a non empty queue
+    start = time.perf_counter()
+    for _ in range(num_requests):
+        scheduler.get(policy)
+    return num_requests / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--models', type=int, nargs='+', default=[10, 100, 1000, 5000])
+    parser.add_argument('--requests', type=int, default=10000)
+    parser.add_argument('--busy-share', type=float, default=0.1)
+    parser.add_argument('--duration', type=float, default=0.5)
+    args = parser.parse_args()
+
+    logging.basicConfig(level='INFO', format="%(message)s")
+
+    for num_models in args.models:
+        reqs_queues, queues_policies, _ = fill(num_models, args.requests, args.busy_share)
+        scans = scan_policies(reqs_queues)
+        for policy in POLICIES:
+            indexed = picks_per_second(queues_policies.policies[policy], args.duration)
+            scan = picks_per_second(scans[policy], args.duration) if policy in scans else None
+            _, drain_policies, scheduler = fill(num_models, args.requests, args.busy_share)
+            drain = drain_per_second(scheduler, drain_policies.policies[policy], args.requests)
+            logging.info("models: %5d %-17s picks/s indexed: %10.0f scan: %18s, scheduler gets/s: %8.0f",
+                         num_models, policy.name, indexed,
+                         "%10.0f (x%.1f)" % (scan, indexed / scan) if scan else "-", drain)
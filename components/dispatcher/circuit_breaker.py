@@ -0,0 +1,71 @@
+import time
+from enum import IntEnum
+from threading import Lock
+
+
+class BreakerState(IntEnum):
+    CLOSED = 0
+    OPEN = 1
+    HALF_OPEN = 2
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker of a container.
+
+    After threshold consecutive failures the breaker opens and the container is ejected for open_time seconds.
+    Then a single request probes the container (half open): if it succeeds the container is readmitted,
+    otherwise it is ejected again for twice the time (at most max_open_time seconds).
+    A probe that does not complete within the open time is replaced by a new probe.
+    """
+
+    def __init__(self, threshold: int = 5, open_time: float = 5, max_open_time: float = 60) -> None:
+        self.threshold = threshold
+        self.open_time = open_time
+        self.max_open_time = max_open_time
+        self.lock = Lock()
+        self.state = BreakerState.CLOSED
+        self.failures = 0
+        self.current_open_time = open_time
+        self.open_until = 0
+        self.ejections = 0
+
+    def record(self, failed):
+        """
+        Record the result of a predict call, return True if the container was ejected or readmitted
+        """
+        with self.lock:
+            if not failed:
+                self.failures = 0
+                if self.state == BreakerState.HALF_OPEN:
+                    # the probe succeeded
+                    self.state = BreakerState.CLOSED
+                    self.current_open_time = self.open_time
+                    return True
+                return False
+
+            self.failures += 1
+            if self.state == BreakerState.HALF_OPEN:
+                # the probe failed
+                self.current_open_time = min(2 * self.current_open_time, self.max_open_time)
+            elif self.state == BreakerState.OPEN or self.failures < self.threshold:
+                return False
+            self.state = BreakerState.OPEN
+            self.open_until = time.time() + self.current_open_time
+            self.ejections += 1
+            return True
+
+    def try_probe(self):
+        """
+        Return True if the caller can send a probe to the ejected container
+        """
+        with self.lock:
+            if self.state == BreakerState.CLOSED or time.time() < self.open_until:
+                return False
+            self.state = BreakerState.HALF_OPEN
+            self.open_until = time.time() + self.current_open_time
+            return True
+
+    def to_json(self):
+        return {"breaker": self.state.name.lower(),
+                "ejections": self.ejections}
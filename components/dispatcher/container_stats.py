@@ -0,0 +1,52 @@
+from threading import Lock
+
+
+class ContainerStats:
+    """
+    Live statistics of a container, updated by the consumers that forward requests to it.
+    Every container has its own lock, so the consumers contend only when they use the same container.
+    The dispatching policies read the statistics without locking: a value can be one request old.
+    """
+
+    def __init__(self, ewma_alpha: float = 0.2) -> None:
+        self.ewma_alpha = ewma_alpha
+        self.lock = Lock()
+        self.in_flight = 0
+        self.completed = 0
+        self.errors = 0
+        self.ewma_rt = None
+
+    def start(self):
+        with self.lock:
+            self.in_flight += 1
+
+    def end(self, rt=None, error=True):
+        """
+        Record the end of a predict call, rt is the response time or None if the call failed or was cancelled
+        """
+        with self.lock:
+            self.in_flight -= 1
+            if rt is None:
+                if error:
+                    self.errors += 1
+                return
+            self.completed += 1
+            if self.ewma_rt is None:
+                self.ewma_rt = rt
+            else:
+                self.ewma_rt = self.ewma_alpha * rt + (1 - self.ewma_alpha) * self.ewma_rt
+
+    def expected_rt(self):
+        """
+        Expected response time of a new request: the queued requests of the container and the new one.
+        A container without measures is expected to be free, so that it is tried.
+        """
+        if self.ewma_rt is None:
+            return 0
+        return self.ewma_rt * (self.in_flight + 1)
+
+    def to_json(self):
+        return {"in_flight": self.in_flight,
+                "completed": self.completed,
+                "errors": self.errors,
+                "ewma_rt": self.ewma_rt}
@@ -0,0 +1,96 @@
+import asyncio
+import logging
+import time
+
+import requests
+
+from models.container import Container
+
+
+class ContainersWatcher:
+    """
+    Reads the containers from the containers manager every interval seconds and calls on_change with the new
+    containers when they change.
+    The ETag of the last containers is sent with If-None-Match: while the containers do not change the containers
+    manager answers 304 without a body. Without an ETag the response is compared with the last one.
+    """
+
+    def __init__(self, endpoint, interval: float, on_change, session=None, logger=None) -> None:
+        self.endpoint = endpoint
+        self.interval = interval
+        self.on_change = on_change
+        self.logger = logger if logger else logging
+        self.etag = None
+        self.last_data = None
+        self.session = session if session else requests.Session()
+
+        # counters
+        self.polls = 0
+        self.updates = 0
+        self.errors = 0
+
+    def headers(self):
+        return {"If-None-Match": self.etag} if self.etag else {}
+
+    def changed(self, status_code, etag, data=None):
+        """
+        Process a response of the containers manager, return True if on_change was called
+        """
+        self.polls += 1
+        if status_code == 304 or data == self.last_data:
+            return False
+        self.etag = etag
+        self.last_data = data
+        self.updates += 1
+        containers = [Container(json_data=json_container) for json_container in data]
+        self.logger.info("Containers changed (version: %s), updating %d containers", etag, len(containers))
+        self.on_change(containers)
+        return True
+
+    def error(self, e):
+        self.errors += 1
+        self.logger.warning("Containers not updated: %s", e)
+
+    def poll(self):
+        try:
+            response = self.session.get(self.endpoint, headers=self.headers(), timeout=self.interval)
+            if response.status_code == 304:
+                return self.changed(304, self.etag)
+            response.raise_for_status()
+            return self.changed(response.status_code, response.headers.get("ETag"), response.json())
+        except Exception as e:
+            self.error(e)
+            return False
+
+    def watch(self):
+        while True:
+            time.sleep(self.interval)
+            self.poll()
+
+    def metrics(self):
+        return {"version": self.etag,
+                "polls": self.polls,
+                "updates": self.updates,
+                "errors": self.errors}
+
+
+class AsyncContainersWatcher(ContainersWatcher):
+    """
+    Asyncio version of the ContainersWatcher, the session must be an aiohttp session
+    """
+
+    async def poll(self):
+        try:
+            async with self.session.get(self.endpoint, headers=self.headers()) as response:
+                if response.status == 304:
+                    return self.changed(304, self.etag)
+                response.raise_for_status()
+                return self.changed(response.status, response.headers.get("ETag"), await response.json())
+        except Exception as e:
+            self.error(e)
+            return False
+
+    async def watch(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.poll()
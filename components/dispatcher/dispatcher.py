@@ -2,8 +2,15 @@ import time
 
 from models.req import Req, ReqState
 from models.device import Device
+from container_stats import ContainerStats
+from circuit_breaker import CircuitBreaker, BreakerState
+from payloads import predict_body
+from collections import namedtuple, deque
+from concurrent.futures import Future, ThreadPoolExecutor, wait, FIRST_COMPLETED
 import random
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
 import logging
 from enum import IntEnum
 from threading import Lock
@@ -13,17 +20,46 @@ from threading import Lock
 class DispatchingPolicy(IntEnum):
     ROUND_ROBIN = 0
     RANDOM = 1
+    LEAST_IN_FLIGHT = 2
+    POWER_OF_TWO = 3
+    EWMA_LATENCY = 4
+
+
+# Response of a container, with the same attributes of the requests.Response used by the dispatcher
+Response = namedtuple("Response", ["status_code", "content"])
+
+JSON_HEADERS = {"Content-Type": "application/json"}
 
 
 class Dispatcher:
+    # response times of the last predict calls of every model, used to compute the hedging delay
+    HEDGE_WINDOW = 100
+    HEDGE_MIN_SAMPLES = 20
+    # timeout of the predict calls without request_timeout: a factor of the SLA of the model, or seconds without SLA
+    TIMEOUT_SLA_FACTOR = 10
+    DEFAULT_TIMEOUT = 30
+
     def __init__(self,
                  logger,
                  models,
                  containers,
                  policy: int = DispatchingPolicy.ROUND_ROBIN,
-                 device=None) -> None:
+                 device=None,
+                 max_consumers: int = None,
+                 pool_maxsize: int = None,
+                 pool_block: bool = False,
+                 deadline_sla_factor: float = 0,
+                 request_timeout: float = 0,
+                 hedge_percentile: float = 0,
+                 max_retries: int = 0,
+                 breaker_threshold: int = 5,
+                 breaker_open_time: float = 5,
+                 breaker_latency_factor: float = 0,
+                 drop_late_requests: bool = False) -> None:
+        self.check_attempts(deadline_sla_factor, request_timeout, hedge_percentile, max_retries)
         self.logger = logger
         self.models = models
+        self.models_by_name = {model.name: model for model in models}
         self.containers = containers
         self.policy = policy
         self.device = device
@@ -31,72 +67,519 @@ class Dispatcher:
 
         # Group containers by model selecting the given type of device
         self.logger.info("Grouping containers for device type: %s", self.device)
+        self.grouped_containers = self.group_containers(containers)
+        self.available_containers = self.grouped_containers
+        self.log_available_containers()
+
+        self.dev_indexes = {model.name: 0 for model in models}
+
+        # Keep-alive sessions, one per container: at most max_consumers requests are in flight at the same time,
+        # so the connection pool of every container is sized to reuse a connection for each of them
+        if pool_maxsize is None:
+            pool_maxsize = max_consumers if max_consumers else requests.adapters.DEFAULT_POOLSIZE
+            if hedge_percentile > 0:
+                # a consumer can have a hedged request in flight to the same container
+                pool_maxsize *= 2
+        self.pool_maxsize = pool_maxsize
+        self.pool_block = pool_block
+        self.sessions = {}
+        for containers_list in self.available_containers.values():
+            for container in containers_list:
+                if container.container_id not in self.sessions:
+                    self.sessions[container.container_id] = self.create_session()
+        self.logger.info("Created %d sessions with pool size: %d", len(self.sessions), self.pool_maxsize)
+
+        # Requests in flight and response times of every container
+        self.stats = {container_id: ContainerStats() for container_id in self.sessions}
+
+        # Circuit breakers: the containers that fail breaker_threshold times in a row are ejected
+        self.breaker_threshold = breaker_threshold
+        self.breaker_open_time = breaker_open_time
+        self.breaker_latency_factor = breaker_latency_factor
+        self.breakers = {container_id: self.create_breaker() for container_id in self.sessions}
+        self.ejected = set()
+        self.containers_lock = Lock()
 
-        self.available_containers = {}
+        # Deadlines, timeouts, hedged requests and retries
+        self.deadline_sla_factor = deadline_sla_factor
+        self.timeouts = {model.name: request_timeout if request_timeout > 0 else
+                         self.TIMEOUT_SLA_FACTOR * model.sla if model.sla else self.DEFAULT_TIMEOUT
+                         for model in models}
+        self.hedge_percentile = hedge_percentile
+        self.max_retries = max_retries
+        self.drop_late_requests = drop_late_requests
+        self.model_rts = {model.name: deque(maxlen=self.HEDGE_WINDOW) for model in models}
+        self.counters_lock = Lock()
+        self.counters = {"hedges": 0, "hedge_wins": 0, "retries": 0, "deadline_exceeded": 0, "dropped": 0}
+        # with hedged requests or retries the predict calls run in the pool, so that a hedged request can be sent
+        # while the first one is in flight, otherwise they are called by the consumers
+        self.attempts_pool = self.create_attempts_pool(max_consumers) \
+            if hedge_percentile > 0 or max_retries > 0 else None
+
+        # set urllib3 logging level
+        logging.getLogger("urllib3").setLevel(logging.WARNING)
+
+    @staticmethod
+    def check_attempts(deadline_sla_factor, request_timeout, hedge_percentile, max_retries):
+        """
+        Raise ValueError if the hedged requests or the retries are enabled without a deadline or a request timeout
+        """
+        if (hedge_percentile > 0 or max_retries > 0) and deadline_sla_factor <= 0 and request_timeout <= 0:
+            raise ValueError("hedge_percentile and max_retries need deadline_sla_factor or request_timeout")
+
+    def group_containers(self, containers):
+        available_containers = {}
         if self.device is None:  # select all type of device
-            for model in models:
-                self.available_containers[model.name] = list(
-                    filter(lambda c: (c.model == model.name or c.model == "all") and c.active, self.containers))
+            for model in self.models:
+                available_containers[model.name] = list(
+                    filter(lambda c: (c.model == model.name or c.model == "all") and c.active, containers))
         elif self.device == Device.CPU:  # CPU containers serve only one model
-            for model in models:
-                self.available_containers[model.name] = list(
-                    filter(lambda c: c.model == model.name and c.device == Device.CPU and c.active, self.containers))
+            for model in self.models:
+                available_containers[model.name] = list(
+                    filter(lambda c: c.model == model.name and c.device == Device.CPU and c.active, containers))
         elif self.device == Device.GPU:  # GPU containers serve all models
-            for model in models:
-                self.available_containers[model.name] = list(
-                    filter(lambda c: c.device == Device.GPU and c.active, self.containers))
+            for model in self.models:
+                available_containers[model.name] = list(
+                    filter(lambda c: c.device == Device.GPU and c.active, containers))
+        return available_containers
 
+    def log_available_containers(self):
         self.logger.info("Available containers are: %s",
                          {ac: [str(c.container_id) + ", Dev: " + str(c.device) for c in self.available_containers[ac]]
                           for ac in self.available_containers})
 
-        self.dev_indexes = {model.name: 0 for model in models}
+    def update_containers(self, containers):
+        """
+        Replace the containers with the ones read from the containers manager.
+        The new lists are built aside and swapped with a single assignment: the consumers keep dispatching to the
+        lists they already read, the lists are never changed in place.
+        """
+        grouped_containers = self.group_containers(containers)
+        for containers_list in grouped_containers.values():
+            for container in containers_list:
+                if container.container_id not in self.sessions:
+                    # new container, the sessions and stats of the removed containers are kept for the requests
+                    # in flight to them
+                    self.sessions[container.container_id] = self.create_session()
+                    self.stats[container.container_id] = ContainerStats()
+                    self.breakers[container.container_id] = self.create_breaker()
+        with self.containers_lock:
+            self.containers = containers
+            self.grouped_containers = grouped_containers
+            self.available_containers = self.admitted_containers()
+        self.log_available_containers()
 
-        # set urllib3 logging level
-        logging.getLogger("urllib3").setLevel(logging.WARNING)
+    def admitted_containers(self):
+        """
+        Return the grouped containers without the ejected ones.
+        If all the containers of a model are ejected they are all kept: the requests are still tried on them.
+        """
+        self.ejected = {container_id for container_id, breaker in list(self.breakers.items())
+                        if breaker.state != BreakerState.CLOSED}
+        if not self.ejected:
+            return self.grouped_containers
+        available_containers = {}
+        for model, containers_list in self.grouped_containers.items():
+            admitted = [c for c in containers_list if c.container_id not in self.ejected]
+            available_containers[model] = admitted if admitted else containers_list
+        return available_containers
 
-    def compute(self, req: Req):
-        if req.model not in self.dev_indexes:
-            # the model is not available
-            return 400, "Error: model not available"
+    def create_breaker(self):
+        return CircuitBreaker(self.breaker_threshold, self.breaker_open_time)
+
+    def is_outlier(self, model, rt):
+        # if breaker_latency_factor > 0, a response time over breaker_latency_factor * SLA of the model is a failure
+        sla = self.models_by_name[model].sla
+        return self.breaker_latency_factor > 0 and sla is not None and rt > self.breaker_latency_factor * sla
+
+    def record_breaker(self, container, failed):
+        """
+        Record the result of a predict call in the breaker of the container
+        """
+        breaker = self.breakers[container.container_id]
+        if breaker.record(failed):
+            # the container was ejected or readmitted
+            self.logger.warning("Container %s %s", container.container_id,
+                                "ejected" if breaker.state == BreakerState.OPEN else "readmitted")
+            with self.containers_lock:
+                self.available_containers = self.admitted_containers()
+
+    def probe_container(self, model, exclude=()):
+        """
+        Return an ejected container of the model that can be probed with the next request, None otherwise
+        """
+        for container in self.grouped_containers[model]:
+            if container.container_id in self.ejected and container not in exclude \
+                    and self.breakers[container.container_id].try_probe():
+                self.logger.info("Probing container %s", container.container_id)
+                return container
+        return None
+
+    def create_session(self):
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_maxsize, pool_block=self.pool_block)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    @staticmethod
+    def create_attempts_pool(max_consumers):
+        # every consumer has a predict call and a hedged or retried call in flight
+        return ThreadPoolExecutor(max_workers=2 * max_consumers if max_consumers else None)
+
+    def select_container(self, model, exclude=()):
+        """
+        Select the container for the model using the dispatching policy, the excluded containers are not selected
+        Return the selected container or None if there are no available containers for the model
+        """
+        if self.ejected:
+            # the ejected containers are probed once their breaker open time is over
+            probe = self.probe_container(model, exclude)
+            if probe is not None:
+                return probe
 
         # get the available containers for the model
-        available_containers = self.available_containers[req.model]
+        available_containers = self.available_containers[model]
+        if exclude:
+            available_containers = [c for c in available_containers if c not in exclude]
 
         if len(available_containers) == 0:
             # no available containers
-            return 400, "Error: no available container"
+            return None
 
         # select the container
         if self.policy == DispatchingPolicy.ROUND_ROBIN:
             # select the next available container for the model
-            with self.lock[req.model]:
-                self.dev_indexes[req.model] = (self.dev_indexes[req.model] + 1) % len(available_containers)
-            dev_index = self.dev_indexes[req.model]
+            dev_index = self.next_index(model, len(available_containers))
         elif self.policy == DispatchingPolicy.RANDOM:
             # select a random container
             dev_index = random.randint(0, len(available_containers) - 1)
+        elif self.policy == DispatchingPolicy.LEAST_IN_FLIGHT:
+            # select the container with less requests in flight, the ties are broken with round robin
+            start = self.next_index(model, len(available_containers))
+            dev_index = min(((start + i) % len(available_containers) for i in range(len(available_containers))),
+                            key=lambda i: self.stats[available_containers[i].container_id].in_flight)
+        elif self.policy == DispatchingPolicy.POWER_OF_TWO:
+            # select the container with less requests in flight between two random containers
+            if len(available_containers) == 1:
+                dev_index = 0
+            else:
+                first, second = random.sample(range(len(available_containers)), 2)
+                dev_index = first if self.stats[available_containers[first].container_id].in_flight <= \
+                    self.stats[available_containers[second].container_id].in_flight else second
+        elif self.policy == DispatchingPolicy.EWMA_LATENCY:
+            # select the container with the lowest expected response time, the ties are broken with round robin
+            start = self.next_index(model, len(available_containers))
+            dev_index = min(((start + i) % len(available_containers) for i in range(len(available_containers))),
+                            key=lambda i: self.stats[available_containers[i].container_id].expected_rt())
 
         # self.logger.info("Using: " + str(dev_index + 1) + "/" + str(len(available_containers)) + " | " + str(
-        #    available_containers[dev_index]) + " | for: " + str(req.id))
+        #    available_containers[dev_index]))
+
+        return available_containers[dev_index]
+
+    def next_index(self, model, num_containers):
+        with self.lock[model]:
+            self.dev_indexes[model] = (self.dev_indexes[model] + 1) % num_containers
+            return self.dev_indexes[model]
 
-        # set the req container and node
-        req.container = available_containers[dev_index].container
-        req.container_id = available_containers[dev_index].container_id
-        req.node = available_containers[dev_index].node
+    def set_container(self, reqs, container):
+        # set the reqs container and node, the requests are sent together
+        ts_wait = time.time()
+        for req in reqs:
+            self.assign_container(req, container)
+            req.set_waiting(ts_wait)
+
+    def assign_container(self, req, container):
+        req.container = container.container
+        req.container_id = container.container_id
+        req.node = container.node
         req.device = self.device
-        req.set_waiting()
 
-        # call the predict on the selected device
-        payload = {"instances": req.instances}
+    def deadline(self, reqs):
+        """
+        The requests must complete within deadline_sla_factor * SLA of the model from the arrival of the first one
+        Return the deadline timestamp or None if the requests have no deadline
+        """
+        sla = self.models_by_name[reqs[0].model].sla
+        if self.deadline_sla_factor <= 0 or sla is None:
+            return None
+        return min(req.ts_in for req in reqs) + self.deadline_sla_factor * sla
+
+    def drop_late(self, reqs):
+        """
+        Drop the requests that cannot complete within the SLA of the model: the profiled response time of the model
+        is over the remaining time
+        Return the other requests
+        """
+        model = self.models_by_name.get(reqs[0].model)
+        if model is None or model.sla is None or model.profiled_rt is None:
+            return reqs
+        latest_ts_in = time.time() + model.profiled_rt - model.sla
+        late = [req for req in reqs if req.ts_in < latest_ts_in]
+        if not late:
+            return reqs
+        self.count("dropped", len(late))
+        self.set_error(late, str(504) + "\nError: SLA deadline cannot be met")
+        return [req for req in reqs if req.ts_in >= latest_ts_in]
+
+    @staticmethod
+    def remaining(deadline):
+        return None if deadline is None else max(0, deadline - time.time())
+
+    def call_timeout(self, model, budget):
+        """
+        Return the timeout of a predict call: the request timeout of the model, at most the budget left to the deadline
+        """
+        return self.timeouts[model] if budget is None else min(self.timeouts[model], budget)
+
+    def hedge_at(self, model):
+        """
+        Return the timestamp when a hedged request is sent if the first one did not complete, None to not hedge
+        """
+        if self.hedge_percentile <= 0 or len(self.available_containers[model]) < 2:
+            return None
+        rts = sorted(self.model_rts[model])
+        if len(rts) < self.HEDGE_MIN_SAMPLES:
+            return None
+        return time.time() + rts[min(len(rts) - 1, int(len(rts) * self.hedge_percentile / 100))]
+
+    @staticmethod
+    def wait_time(deadline, hedge_at):
+        # wait for the first response until the hedging delay or the deadline
+        timestamps = [ts for ts in (deadline, hedge_at) if ts is not None]
+        return max(0, min(timestamps) - time.time()) if timestamps else None
+
+    def count(self, counter, n=1):
+        with self.counters_lock:
+            self.counters[counter] += n
+
+    def record_rt(self, container, model, rt, error=True):
+        self.stats[container.container_id].end(rt, error)
+        if rt is not None:
+            self.model_rts[model].append(rt)
+        if self.breaker_threshold > 0 and (rt is not None or error):
+            self.record_breaker(container, rt is None or self.is_outlier(model, rt))
+
+    def deadline_timeout(self, container, model, budget):
+        """
+        Return True if a predict call timed out because the budget left to the deadline was shorter than the request
+        timeout. The call is not an error of the container: it is a latency outlier of the breaker only if the budget
+        was at least the usual response time of the container.
+        """
+        if budget is None or budget >= self.timeouts[model]:
+            return False
+        ewma_rt = self.stats[container.container_id].ewma_rt
+        if self.breaker_threshold > 0 and self.breaker_latency_factor > 0 and ewma_rt is not None \
+                and budget >= ewma_rt:
+            self.record_breaker(container, True)
+        return True
+
+    @staticmethod
+    def predict_url(container, req: Req):
+        return container.endpoint + "/v" + str(req.version) + "/models/" + req.model + ":predict"
+
+    @staticmethod
+    def batch_instances(reqs):
+        if len(reqs) == 1:
+            return reqs[0].instances
+        return [instance for req in reqs for instance in req.instances]
+
+    @staticmethod
+    def set_completed(reqs, response):
+        """
+        Split the predictions of a batch between the requests, in the same order of the instances.
+        Only the status and the content of the response are kept, not the connection and the headers.
+        An error response is forwarded to every request, the requests of a successful response that cannot be split
+        are set in the error state: a request never gets the predictions of the others
+        """
+        ts_out = time.time()
+        response = Response(response.status_code, response.content)
+        if len(reqs) == 1 or response.status_code != 200:
+            for req in reqs:
+                req.set_completed(response, ts_out)
+            return
+
         try:
-            response = requests.post(available_containers[dev_index].endpoint + "/v"
-                                     + str(req.version) + "/models/" + req.model + ":predict",
-                                     json=payload)
-            # self.logger.info(response.text)
-            req.set_completed(response)
+            body = orjson.loads(response.content)
+        except orjson.JSONDecodeError:
+            body = None
+        predictions = body.get("predictions") if isinstance(body, dict) else None
+        if not isinstance(predictions, list) or len(predictions) != sum(len(req.instances) for req in reqs):
+            for req in reqs:
+                req.set_error(str(502) + "\nError: the predictions of the batch cannot be split")
             return
-        except Exception as e:
-            self.logger.warning("EXCEPTION %s", e)
-            req.set_error(str(400) + "\n" + str(e))
+
+        start = 0
+        for req in reqs:
+            end = start + len(req.instances)
+            req.set_completed(Response(response.status_code,
+                                       orjson.dumps({"predictions": predictions[start:end]})), ts_out)
+            start = end
+
+    @staticmethod
+    def set_error(reqs, error):
+        for req in reqs:
+            req.set_error(error)
+
+    def check_batch(self, reqs):
+        """
+        Check that the model of the requests can be served
+        Return the selected container or None (the requests are set in the error state)
+        """
+        model = reqs[0].model
+        if model not in self.dev_indexes:
+            # the model is not available
+            self.set_error(reqs, str(400) + "\nError: model not available")
+            return None
+
+        container = self.select_container(model)
+        if container is None:
+            # no available containers
+            self.set_error(reqs, str(400) + "\nError: no available container")
+            return None
+
+        self.set_container(reqs, container)
+        return container
+
+    def compute(self, req: Req):
+        self.compute_batch([req])
+
+    def compute_batch(self, reqs):
+        """
+        Forward the requests (same model and version) to a container with a single predict call
+        """
+        if len(reqs) > 1 and not all(isinstance(req.instances, list) for req in reqs):
+            # only lists of instances can be merged
+            for req in reqs:
+                self.compute(req)
             return
+
+        if self.drop_late_requests:
+            reqs = self.drop_late(reqs)
+            if not reqs:
+                return
+
+        container = self.check_batch(reqs)
+        if container is None:
+            return
+
+        model = reqs[0].model
+        deadline = self.deadline(reqs)
+        if deadline is not None and time.time() >= deadline:
+            # the requests waited in the queue beyond their deadline
+            self.count("deadline_exceeded")
+            self.set_error(reqs, str(504) + "\nError: deadline exceeded")
+            return
+
+        # call the predict on the selected device, the first good response is taken
+        payload = predict_body(self.batch_instances(reqs))
+        tried = [container]
+        hedges = []
+        attempts = {self.submit(container, reqs, payload, deadline): container}
+        hedge_at = self.hedge_at(model)
+        retries = 0
+        response = error = None
+        while attempts:
+            done, _ = wait(attempts, timeout=self.wait_time(deadline, hedge_at), return_when=FIRST_COMPLETED)
+            if not done:
+                if hedge_at is not None and time.time() >= hedge_at:
+                    # the response is late: send a hedged request to another container
+                    hedge_at = None
+                    hedge = self.select_container(model, tried)
+                    if hedge is not None:
+                        self.count("hedges")
+                        tried.append(hedge)
+                        hedges.append(hedge)
+                        attempts[self.submit(hedge, reqs, payload, deadline)] = hedge
+                    continue
+                if deadline is not None and time.time() >= deadline:
+                    # the requests in flight are abandoned, their responses are dropped
+                    self.count("deadline_exceeded")
+                    self.set_error(reqs, str(504) + "\nError: deadline exceeded")
+                    return
+                # woken before the hedging delay and the deadline
+                continue
+
+            future = done.pop()
+            container = attempts.pop(future)
+            try:
+                response, error = future.result(), None
+            except Exception as e:
+                self.logger.warning("EXCEPTION %s", e)
+                response, error = None, e
+            if response is not None and response.status_code < 500:
+                break
+
+            # the container failed: retry on another container within the deadline
+            if retries < self.max_retries and (deadline is None or time.time() < deadline):
+                retry = self.select_container(model, tried)
+                if retry is not None:
+                    retries += 1
+                    self.count("retries")
+                    tried.append(retry)
+                    attempts[self.submit(retry, reqs, payload, deadline)] = retry
+
+        if response is None and deadline is not None and time.time() >= deadline:
+            # the last call failed at the deadline
+            self.count("deadline_exceeded")
+            self.set_error(reqs, str(504) + "\nError: deadline exceeded")
+            return
+
+        if container in hedges:
+            self.count("hedge_wins")
+        for req in reqs:
+            self.assign_container(req, container)
+        if response is not None:
+            # self.logger.info(response.text)
+            self.set_completed(reqs, response)
+        else:
+            self.set_error(reqs, str(400) + "\n" + str(error))
+
+    def submit(self, container, reqs, payload, deadline):
+        """
+        Call the predict of the container in the attempts pool, return the future of the response.
+        Without the pool the predict is called by the consumer and the returned future is already done.
+        """
+        if self.attempts_pool is not None:
+            return self.attempts_pool.submit(self.post, container, reqs, payload, self.remaining(deadline))
+        future = Future()
+        try:
+            future.set_result(self.post(container, reqs, payload, self.remaining(deadline)))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def post(self, container, reqs, payload, budget=None):
+        """
+        Call the predict of the container, return the response.
+        budget is the time left to the deadline of the requests, None if they have no deadline.
+        """
+        self.stats[container.container_id].start()
+        rt = None
+        error = True
+        try:
+            start = time.perf_counter()
+            response = self.sessions[container.container_id].post(self.predict_url(container, reqs[0]), data=payload,
+                                                                  headers=JSON_HEADERS,
+                                                                  timeout=self.call_timeout(reqs[0].model, budget))
+            if response.status_code < 500:
+                rt = time.perf_counter() - start
+            return response
+        except requests.exceptions.Timeout:
+            error = not self.deadline_timeout(container, reqs[0].model, budget)
+            raise
+        finally:
+            self.record_rt(container, reqs[0].model, rt, error)
+
+    def metrics(self):
+        containers = {container_id: {**stats.to_json(), **self.breakers[container_id].to_json()}
+                      for container_id, stats in list(self.stats.items())}
+        with self.counters_lock:
+            counters = dict(self.counters)
+        return {"device": self.device,
+                "policy": self.policy,
+                **counters,
+                "in_flight": sum(stats["in_flight"] for stats in containers.values()),
+                "ejected": len(self.ejected),
+                "containers": containers}
@@ -0,0 +1,158 @@
+import asyncio
+import time
+
+import aiohttp
+
+from dispatcher import Dispatcher, Response, JSON_HEADERS
+from payloads import predict_body
+from models.req import Req
+
+
+class AsyncDispatcher(Dispatcher):
+    """
+    Dispatcher that forwards the requests with an asyncio HTTP client.
+    It must be created and used inside the event loop.
+    """
+
+    def create_session(self):
+        connector = aiohttp.TCPConnector(limit=self.pool_maxsize, limit_per_host=self.pool_maxsize)
+        return aiohttp.ClientSession(connector=connector)
+
+    @staticmethod
+    def create_attempts_pool(max_consumers):
+        # the predict calls are tasks of the event loop
+        return None
+
+    async def close(self):
+        for session in self.sessions.values():
+            await session.close()
+
+    async def compute(self, req: Req):
+        await self.compute_batch([req])
+
+    async def compute_batch(self, reqs):
+        """
+        Forward the requests (same model and version) to a container with a single predict call
+        """
+        if len(reqs) > 1 and not all(isinstance(req.instances, list) for req in reqs):
+            # only lists of instances can be merged
+            for req in reqs:
+                await self.compute(req)
+            return
+
+        if self.drop_late_requests:
+            reqs = self.drop_late(reqs)
+            if not reqs:
+                return
+
+        container = self.check_batch(reqs)
+        if container is None:
+            return
+
+        model = reqs[0].model
+        deadline = self.deadline(reqs)
+        if deadline is not None and time.time() >= deadline:
+            # the requests waited in the queue beyond their deadline
+            self.count("deadline_exceeded")
+            self.set_error(reqs, str(504) + "\nError: deadline exceeded")
+            return
+
+        # call the predict on the selected device, the first good response is taken
+        payload = predict_body(self.batch_instances(reqs))
+        tried = [container]
+        hedges = []
+        attempts = {asyncio.ensure_future(self.post(container, reqs, payload, self.remaining(deadline))): container}
+        hedge_at = self.hedge_at(model)
+        retries = 0
+        response = error = None
+        try:
+            while attempts:
+                done, _ = await asyncio.wait(attempts, timeout=self.wait_time(deadline, hedge_at),
+                                             return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    if hedge_at is not None and time.time() >= hedge_at:
+                        # the response is late: send a hedged request to another container
+                        hedge_at = None
+                        hedge = self.select_container(model, tried)
+                        if hedge is not None:
+                            self.count("hedges")
+                            tried.append(hedge)
+                            hedges.append(hedge)
+                            attempts[asyncio.ensure_future(self.post(hedge, reqs, payload,
+                                                                     self.remaining(deadline)))] = hedge
+                        continue
+                    if deadline is not None and time.time() >= deadline:
+                        self.count("deadline_exceeded")
+                        self.set_error(reqs, str(504) + "\nError: deadline exceeded")
+                        return
+                    # woken before the hedging delay and the deadline
+                    continue
+
+                task = done.pop()
+                container = attempts.pop(task)
+                try:
+                    response, error = task.result(), None
+                except Exception as e:
+                    self.logger.warning("EXCEPTION %s", e)
+                    response, error = None, e
+                if response is not None and response.status_code < 500:
+                    break
+
+                # the container failed: retry on another container within the deadline
+                if retries < self.max_retries and (deadline is None or time.time() < deadline):
+                    retry = self.select_container(model, tried)
+                    if retry is not None:
+                        retries += 1
+                        self.count("retries")
+                        tried.append(retry)
+                        attempts[asyncio.ensure_future(self.post(retry, reqs, payload,
+                                                                 self.remaining(deadline)))] = retry
+        finally:
+            # the requests still in flight are cancelled, their errors are not needed
+            for task in attempts:
+                task.cancel()
+                task.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+        if response is None and deadline is not None and time.time() >= deadline:
+            # the last call failed at the deadline
+            self.count("deadline_exceeded")
+            self.set_error(reqs, str(504) + "\nError: deadline exceeded")
+            return
+
+        if container in hedges:
+            self.count("hedge_wins")
+        for req in reqs:
+            self.assign_container(req, container)
+        if response is not None:
+            self.set_completed(reqs, response)
+        else:
+            self.set_error(reqs, str(400) + "\n" + str(error))
+
+    async def post(self, container, reqs, payload, budget=None):
+        """
+        Call the predict of the container, return the response.
+        budget is the time left to the deadline of the requests, None if they have no deadline.
+        """
+        self.stats[container.container_id].start()
+        rt = None
+        error = True
+        try:
+            start = time.perf_counter()
+            async with self.sessions[container.container_id].post(self.predict_url(container, reqs[0]),
+                                                                  data=payload, headers=JSON_HEADERS,
+                                                                  timeout=aiohttp.ClientTimeout(
+                                                                      total=self.call_timeout(reqs[0].model, budget))) \
+                    as response:
+                content = await response.read()
+            if response.status < 500:
+                rt = time.perf_counter() - start
+            return Response(response.status, content)
+        except asyncio.TimeoutError:
+            error = not self.deadline_timeout(container, reqs[0].model, budget)
+            raise
+        except asyncio.CancelledError:
+            # the response is not needed anymore
+            error = False
+            raise
+        finally:
+            self.record_rt(container, reqs[0].model, rt, error)
@@ -2,20 +2,26 @@ import os
 
 from dispatcher import Dispatcher
 from dispatcher import DispatchingPolicy
-from flask import Flask, jsonify, abort, request
-from models.req import Req
+from admission_control import AdmissionControl
+from payloads import parse_envelope, parse_sync
+from containers_watcher import ContainersWatcher
+from queues_scheduler import QueuesScheduler
+from requests_logger import RequestsLogger
+from flask import Flask, request, Response
+from models.req import Req, ReqState
 from models.model import Model
 from models.device import Device
 from models.container import Container
-from models.queues_policies import QueuesPolicies, QueuesPolicy
+from models.queues_policies import QueuesPolicies
 from concurrent.futures import ThreadPoolExecutor
+from threading import BoundedSemaphore, Event, Lock
 from models.configurations import DispatcherConfiguration
 from flask_cors import CORS
 import logging
 import requests
 import queue
+import random
 import coloredlogs
-import time
 import json
 
 app = Flask(__name__)
@@ -25,7 +31,14 @@ status = None
 active = False
 config = None
 reqs_queues = {}
-log_queue = queue.Queue()
+scheduler = None
+queues_policies = None
+admission_control = None
+containers_watcher = None
+dispatchers = {}
+consumers_lock = Lock()
+sync_reqs = {}
+requests_logger = None
 config_filename = 'config.json'
 
 
@@ -41,9 +54,12 @@ def predict(model):
     if not active and not configure():
         return {'error': 'component not configured'}
 
-    # the component is configured and active
-    data = request.get_json()
-    if not data:
+    # the component is configured and active, the instances are forwarded as they are
+    try:
+        data, instances = parse_envelope(request.get_data(), raw=config.max_batch_size <= 1)
+    except ValueError:
+        data = None
+    if not data or not isinstance(data, dict):
         return {'error': 'input not specified'}
     elif not model:
         return {'error': 'model not specified'}
@@ -52,47 +68,126 @@ def predict(model):
     elif 'instances' not in data.keys():
         return {'error': 'key instances not specified'}
 
+    # the caller waits for the response if sync is 1, at most timeout seconds
+    try:
+        timeout = parse_sync(request.args.get('sync'), request.args.get('timeout'), config.sync_timeout)
+    except ValueError as e:
+        return {'error': str(e)}, 400
+
     # app.logger.info("IN - REQ %s/V%s %s", model, data["version"], data["instances"])
 
     # Queue and log incoming request
-    req = Req(model, data["version"], data["instances"])
-    reqs_queues[model].put(req)
-    log_queue.put(req)
-
-    # Forward 200
-    return {"status": "ok",
-            "id": req.id}
-
-
-def log_consumer():
-    global config
-    while True:
-        payload = log_queue.get().to_json()
-        requests.post(config.requests_store_endpoint, json=payload)
-        time.sleep(0.1)
-
-
+    req = Req(model, data["version"], instances)
+    # a sample of the requests is logged with the instances and the response
+    req.keep_payloads = random.random() < config.log_payloads_sample
+    if timeout is not None:
+        # the caller waits for the response of the model
+        completed = Event()
+        sync_reqs[req.id] = completed
+    rejection = scheduler.put(model, req)
+    if rejection is not None:
+        # load shedding: the request is not queued, it is logged to count the rejected requests
+        sync_reqs.pop(req.id, None)
+        req.set_rejected(rejection.message)
+        req.release_payloads()
+        requests_logger.log(req)
+        return {"error": rejection.message, "id": req.id}, rejection.status_code
+    requests_logger.log(req)
+
+    if timeout is None:
+        # Forward 200
+        return {"status": "ok",
+                "id": req.id}
+
+    # Wait for the response or the timeout
+    if not completed.wait(timeout):
+        sync_reqs.pop(req.id, None)
+        return {"error": "timeout", "id": req.id}, 504
+    response = prediction_response(req)
+    req.release_payloads()
+    return response
+
+
+def prediction_response(req):
+    if req.state == ReqState.COMPLETED:
+        # forward the response of the model
+        return Response(req.response.content, status=req.response.status_code, mimetype='application/json')
+    else:
+        return {"error": req.response, "id": req.id}, 502
 
-def queues_pooling(dispatcher, policy, max_consumers):
-    # Create the pool of consumers
-    consumer_threads_poll = ThreadPoolExecutor(max_workers=max_consumers)
 
+def queues_pooling(dispatcher, policy, consumer_threads_pool, slots):
     while True:
-        selected_queue = policy()
-        if not reqs_queues[selected_queue].empty():
-            # Get next request
-            req = reqs_queues[selected_queue].get()
-            # Consume the request
-            consumer_threads_poll.submit(queue_consumer(dispatcher, req))
-        else:
-            time.sleep(0.001)
+        # Wait for a free consumer, when all the consumers are busy the requests are left in the queues
+        slots.acquire()
+        # Wait for the next requests selected by the policy
+        reqs = scheduler.get_batch(policy, config.max_batch_size, config.max_batch_wait)
+        # Consume the requests
+        future = consumer_threads_pool.submit(queue_consumer, dispatcher, reqs)
+        future.add_done_callback(lambda f: slots.release())
 
 
-def queue_consumer(dispatcher, req):
-    # Forward request (dispatcher)
+def queue_consumer(dispatcher, reqs):
+    # Forward requests (dispatcher)
     # logging.info("Consumer for %s sending to dispatcher...", dispatcher.device)
-    dispatcher.compute(req)
-    log_queue.put(req)
+    try:
+        dispatcher.compute_batch(reqs)
+    except Exception as e:
+        # the requests are completed anyway, so that the callers and the log get them
+        logging.exception("Batch not computed")
+        dispatcher.set_error([req for req in reqs if req.state <= ReqState.WAITING], str(500) + "\nError: " + str(e))
+    for req in reqs:
+        if req.state == ReqState.COMPLETED:
+            # the response times of the model are used by the queues policies
+            queues_policies.completed(req)
+        completed = sync_reqs.pop(req.id, None)
+        # the payloads are released as soon as the call returns, the response is kept for the waiting caller
+        req.release_payloads(response=completed is None)
+        if completed:
+            completed.set()
+        requests_logger.log(req)
+
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    if not active:
+        return {'error': 'component not configured'}
+
+    return {"queues": {model: reqs_queue.qsize() for model, reqs_queue in reqs_queues.items()},
+            "devices": [{**dispatcher.metrics(), "max_in_flight": max_in_flight}
+                        for dispatcher, max_in_flight in dispatchers.values()],
+            "rejected": admission_control.metrics(),
+            "containers": containers_watcher.metrics() if containers_watcher else None,
+            "log": requests_logger.metrics()}
+
+
+def update_containers(containers, devices):
+    # the containers changed on the containers manager
+    for dispatcher, _, _ in devices.values():
+        dispatcher.update_containers(containers)
+    admission_control.update_containers(containers)
+    start_consumers(containers, devices)
+
+
+def start_consumers(containers, devices):
+    """
+    Start the consumers of the types of device with active containers: the consumers of a type of device are started
+    with its first active container, also if it is activated after the configuration
+    """
+    with consumers_lock:
+        for device, (dispatcher, policy, max_consumers) in devices.items():
+            if device in dispatchers or not any(c.device == device and c.active for c in containers):
+                continue
+            logging.info("Start queues consumer threads for device: %s", device)
+            # consumers that forward the requests to the device, at most max_consumers requests are in flight
+            dispatchers[device] = (dispatcher, max_consumers)
+            slots = BoundedSemaphore(max_consumers)
+            consumer_threads_pool = ThreadPoolExecutor(max_workers=max_consumers)
+
+            # threads that pools from the apps queues and dispatch to the device
+            polling_threads_pool = ThreadPoolExecutor(max_workers=config.max_polling_threads)
+            for i in range(config.max_polling_threads):
+                polling_threads_pool.submit(queues_pooling, dispatcher, policy, consumer_threads_pool, slots)
 
 
 def get_data(url):
@@ -111,7 +206,14 @@ def post_configuration():
 
     # read from configuration
     data = request.get_json()
-    config = DispatcherConfiguration(json_data=data)
+    new_config = DispatcherConfiguration(json_data=data)
+    try:
+        Dispatcher.check_attempts(new_config.deadline_sla_factor, new_config.request_timeout,
+                                  new_config.hedge_percentile, new_config.max_retries)
+    except ValueError as e:
+        logging.warning(e)
+        return {'error': str(e)}, 400
+    config = new_config
 
     logging.info("configuration: " + str(config.__dict__))
 
@@ -152,7 +254,7 @@ def read_config_from_file():
 
 
 def configure():
-    global status, active, reqs_queues, config
+    global status, active, reqs_queues, scheduler, queues_policies, admission_control, containers_watcher, dispatchers, requests_logger, config
 
     if not config:
         logging.info("reading config from file")
@@ -182,11 +284,13 @@ def configure():
     logging.info("Found %d models and %d containers", len(models), len(containers))
 
     # init requests queues
-    reqs_queues = {model.name: queue.Queue() for model in models}
-    responses_list = {model.name: [] for model in models}
+    reqs_queues = {model.name: queue.Queue(maxsize=config.max_queue_size) for model in models}
+    admission_control = AdmissionControl(models, containers, config.admission_sla_factor)
+    logging.info("Max queue size: %d, admission SLA factor: %s", config.max_queue_size, config.admission_sla_factor)
 
     # init policy
-    queues_policies = QueuesPolicies(reqs_queues, responses_list, models, logging)
+    queues_policies = QueuesPolicies(reqs_queues, models, logging)
+    scheduler = QueuesScheduler(reqs_queues, admission_control, queues_policies)
     gpu_policy = queues_policies.policies.get(config.gpu_queues_policy)
     cpu_policy = queues_policies.policies.get(config.cpu_queues_policy)
     logging.info("Policy for GPUs: %s", config.gpu_queues_policy)
@@ -201,31 +305,44 @@ def configure():
     # init dispatchers
     status = "Init dispatchers"
     logging.info(status)
-    dispatcher_gpu = Dispatcher(app.logger, models, containers, DispatchingPolicy.ROUND_ROBIN, Device.GPU)
-    dispatcher_cpu = Dispatcher(app.logger, models, containers, DispatchingPolicy.ROUND_ROBIN, Device.CPU)
+    logging.info("Dispatching policy: %s", config.dispatching_policy)
+    dispatcher_gpu = Dispatcher(app.logger, models, containers, config.dispatching_policy, Device.GPU,
+                                config.max_consumers_gpu, config.pool_maxsize, config.pool_block,
+                                config.deadline_sla_factor, config.request_timeout, config.hedge_percentile,
+                                config.max_retries, config.breaker_threshold, config.breaker_open_time,
+                                config.breaker_latency_factor, config.drop_late_requests)
+    dispatcher_cpu = Dispatcher(app.logger, models, containers, config.dispatching_policy, Device.CPU,
+                                config.max_consumers_cpu, config.pool_maxsize, config.pool_block,
+                                config.deadline_sla_factor, config.request_timeout, config.hedge_percentile,
+                                config.max_retries, config.breaker_threshold, config.breaker_open_time,
+                                config.breaker_latency_factor, config.drop_late_requests)
+    devices = {Device.GPU: (dispatcher_gpu, gpu_policy, config.max_consumers_gpu),
+               Device.CPU: (dispatcher_cpu, cpu_policy, config.max_consumers_cpu)}
 
     # start the send requests thread
     status = "Start send reqs thread"
     logging.info(status)
+    requests_logger = RequestsLogger(config.requests_store_bulk_endpoint, config.log_batch_size,
+                                     config.log_flush_interval, config.log_max_pending, config.log_spill_file, logging)
     log_consumer_threads_pool = ThreadPoolExecutor(max_workers=config.max_log_consumers)
     for i in range(config.max_log_consumers):
-        log_consumer_threads_pool.submit(log_consumer)
+        log_consumer_threads_pool.submit(requests_logger.flush_loop)
 
     # start the queues consumer threads
     status = "Start queues consumer threads"
     logging.info(status)
 
-    if list(filter(lambda c: c.device == Device.GPU and c.active, containers)):
-        # threads that pools from the apps queues and dispatch to gpus
-        polling_gpu_threads_pool = ThreadPoolExecutor(max_workers=config.max_polling_threads)
-        for i in range(config.max_polling_threads):
-            polling_gpu_threads_pool.submit(queues_pooling, dispatcher_gpu, gpu_policy, config.max_consumers_gpu)
-
-    if list(filter(lambda c: c.device == Device.CPU and c.active, containers)):
-        # threads that pools from the apps queues and dispatch to cpus
-        pooling_cpu_threads_pool = ThreadPoolExecutor(max_workers=config.max_polling_threads)
-        for i in range(config.max_polling_threads):
-            pooling_cpu_threads_pool.submit(queues_pooling, dispatcher_cpu, cpu_policy, config.max_consumers_cpu)
+    start_consumers(containers, devices)
+
+    # start the containers watcher thread
+    if config.containers_refresh_interval > 0:
+        status = "Start containers watcher thread"
+        logging.info(status)
+        containers_watcher = ContainersWatcher(config.containers_endpoint, config.containers_refresh_interval,
+                                               lambda new_containers: update_containers(new_containers, devices),
+                                               logger=logging)
+        containers_watcher_threads_pool = ThreadPoolExecutor(max_workers=1)
+        containers_watcher_threads_pool.submit(containers_watcher.watch)
 
     status = "active"
     active = True
@@ -0,0 +1,401 @@
+"""
+Asyncio version of the dispatcher
+
+The routes are the same of the Flask version (main.py), but the requests are never bound to a thread:
+the HTTP server, the consumers of the applications queues and the calls to the containers are tasks of the
+same event loop.
+"""
+import os
+
+from dispatcher_aiohttp import AsyncDispatcher
+from admission_control import AdmissionControl
+from payloads import parse_envelope, parse_sync
+from containers_watcher import AsyncContainersWatcher
+from queues_scheduler import AsyncQueuesScheduler
+from requests_logger import RequestsLogger
+from aiohttp import web
+from models.req import Req, ReqState
+from models.model import Model
+from models.device import Device
+from models.container import Container
+from models.queues_policies import QueuesPolicies
+from models.configurations import DispatcherConfiguration
+from concurrent.futures import ThreadPoolExecutor
+import aiohttp
+import asyncio
+import logging
+import queue
+import random
+import coloredlogs
+import json
+
+routes = web.RouteTableDef()
+
+status = None
+active = False
+config = None
+configure_lock = None
+reqs_queues = {}
+scheduler = None
+queues_policies = None
+admission_control = None
+containers_watcher = None
+dispatchers = {}
+sync_reqs = {}
+requests_logger = None
+background_tasks = []
+config_filename = 'config.json'
+
+
+@routes.get('/')
+async def get_status(request):
+    await get_configuration(request)
+    return web.json_response({"status": status})
+
+
+@routes.post('/predict/{model}')
+async def predict(request):
+    model = request.match_info["model"]
+
+    # check if the component is active and the configuration file was loaded (lazy-load)
+    if not active and not await configure():
+        return web.json_response({'error': 'component not configured'})
+
+    # the component is configured and active, the instances are forwarded as they are
+    try:
+        data, instances = parse_envelope(await request.read(), raw=config.max_batch_size <= 1)
+    except ValueError:
+        data = None
+    if not data or not isinstance(data, dict):
+        return web.json_response({'error': 'input not specified'})
+    elif not model:
+        return web.json_response({'error': 'model not specified'})
+    elif 'version' not in data.keys():
+        return web.json_response({'error': 'key version not specified'})
+    elif 'instances' not in data.keys():
+        return web.json_response({'error': 'key instances not specified'})
+
+    # the caller waits for the response if sync is 1, at most timeout seconds
+    try:
+        timeout = parse_sync(request.query.get('sync'), request.query.get('timeout'), config.sync_timeout)
+    except ValueError as e:
+        return web.json_response({'error': str(e)}, status=400)
+
+    # Queue and log incoming request
+    req = Req(model, data["version"], instances)
+    # a sample of the requests is logged with the instances and the response
+    req.keep_payloads = random.random() < config.log_payloads_sample
+    if timeout is not None:
+        # the caller waits for the response of the model
+        completed = asyncio.get_event_loop().create_future()
+        sync_reqs[req.id] = completed
+    rejection = await scheduler.put(model, req)
+    if rejection is not None:
+        # load shedding: the request is not queued, it is logged to count the rejected requests
+        sync_reqs.pop(req.id, None)
+        req.set_rejected(rejection.message)
+        req.release_payloads()
+        requests_logger.log(req)
+        return web.json_response({"error": rejection.message, "id": str(req.id)}, status=rejection.status_code)
+    requests_logger.log(req)
+
+    if timeout is None:
+        # Forward 200
+        return web.json_response({"status": "ok",
+                                  "id": str(req.id)})
+
+    # Wait for the response or the timeout
+    try:
+        await asyncio.wait_for(completed, timeout)
+    except asyncio.TimeoutError:
+        sync_reqs.pop(req.id, None)
+        return web.json_response({"error": "timeout", "id": str(req.id)}, status=504)
+    response = prediction_response(req)
+    req.release_payloads()
+    return response
+
+
+def prediction_response(req):
+    if req.state == ReqState.COMPLETED:
+        # forward the response of the model
+        return web.Response(body=req.response.content, status=req.response.status_code,
+                            content_type='application/json')
+    else:
+        return web.json_response({"error": req.response, "id": str(req.id)}, status=502)
+
+
+async def queue_consumer(dispatcher, policy):
+    while True:
+        # Wait for the next requests selected by the policy
+        reqs = await scheduler.get_batch(policy, config.max_batch_size, config.max_batch_wait)
+        # Forward requests (dispatcher)
+        try:
+            await dispatcher.compute_batch(reqs)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # the requests are completed anyway and the consumer goes on
+            logging.exception("Batch not computed")
+            dispatcher.set_error([req for req in reqs if req.state <= ReqState.WAITING],
+                                 str(500) + "\nError: " + str(e))
+        for req in reqs:
+            if req.state == ReqState.COMPLETED:
+                # the response times of the model are used by the queues policies
+                queues_policies.completed(req)
+            completed = sync_reqs.pop(req.id, None)
+            waiting = completed is not None and not completed.done()
+            # the payloads are released as soon as the call returns, the response is kept for the waiting caller
+            req.release_payloads(response=not waiting)
+            if waiting:
+                completed.set_result(req)
+            requests_logger.log(req)
+
+
+@routes.get('/metrics')
+async def get_metrics(request):
+    if not active:
+        return web.json_response({'error': 'component not configured'})
+
+    return web.json_response({"queues": {model: reqs_queue.qsize() for model, reqs_queue in reqs_queues.items()},
+                              "devices": [{**dispatcher.metrics(), "max_in_flight": max_in_flight}
+                                          for dispatcher, max_in_flight in dispatchers.values()],
+                              "rejected": admission_control.metrics(),
+                              "containers": containers_watcher.metrics() if containers_watcher else None,
+                              "log": requests_logger.metrics()})
+
+
+def update_containers(containers, devices):
+    # the containers changed on the containers manager
+    for dispatcher, _, _ in devices.values():
+        dispatcher.update_containers(containers)
+    admission_control.update_containers(containers)
+    start_consumers(containers, devices)
+
+
+def start_consumers(containers, devices):
+    """
+    Start the consumers of the types of device with active containers: the consumers of a type of device are started
+    with its first active container, also if it is activated after the configuration
+    """
+    for device, (dispatcher, policy, max_consumers) in devices.items():
+        if device in dispatchers or not any(c.device == device and c.active for c in containers):
+            continue
+        logging.info("Start queues consumer tasks for device: %s", device)
+        # consumers that forward the requests to the device, at most max_consumers requests are in flight
+        dispatchers[device] = (dispatcher, max_consumers)
+        for i in range(max_consumers):
+            background_tasks.append(asyncio.ensure_future(queue_consumer(dispatcher, policy)))
+
+
+async def get_data(session, url):
+    try:
+        async with session.get(url) as response:
+            return await response.json()
+    except aiohttp.ClientError as e:
+        logging.warning(e)
+        return []
+
+
+@routes.post('/configuration')
+async def post_configuration(request):
+    global config, status
+    logging.info("saving configuration...")
+
+    # read from configuration
+    data = await request.json()
+    new_config = DispatcherConfiguration(json_data=data)
+    try:
+        AsyncDispatcher.check_attempts(new_config.deadline_sla_factor, new_config.request_timeout,
+                                       new_config.hedge_percentile, new_config.max_retries)
+    except ValueError as e:
+        logging.warning(e)
+        return web.json_response({'error': str(e)}, status=400)
+    config = new_config
+
+    logging.info("configuration: " + str(config.__dict__))
+
+    with open(config_filename, 'w') as config_file:
+        json.dump(config.__dict__, config_file)
+
+    status = "configured"
+    logging.info(status)
+
+    return web.json_response({"result": "ok"}, status=200)
+
+
+@routes.get('/configuration')
+async def get_configuration(request):
+    global config, status
+    logging.info("getting configuration started...")
+
+    # read from file
+    logging.info("read configuration from file")
+    if config or read_config_from_file():
+        status = "configured"
+        return web.json_response({"configuration": config.__dict__}, status=200)
+    else:
+        logging.warning("configuration not found")
+        return web.json_response({"configuration": "not found"}, status=404)
+
+
+def read_config_from_file():
+    global config
+    try:
+        with open(config_filename) as json_file:
+            data = json.load(json_file)
+            config = DispatcherConfiguration(json_data=data)
+            return True
+    except IOError as e:
+        logging.error("configuration error")
+        return False
+
+
+async def configure():
+    # the first requests can arrive together, only one of them configures the component
+    async with configure_lock:
+        if active:
+            return True
+        return await configure_component()
+
+
+async def configure_component():
+    global status, active, reqs_queues, scheduler, queues_policies, admission_control, containers_watcher, dispatchers, requests_logger, config
+
+    if not config:
+        logging.info("reading config from file")
+        if not read_config_from_file():
+            logging.error("configuration reading error")
+            return False
+        else:
+            logging.info("configuration read from file")
+
+    logging.info("configuration read: " + str(config.__dict__))
+    logging.info("Getting models from: %s", config.models_endpoint)
+    logging.info("Getting containers from: %s", config.containers_endpoint)
+
+    async with aiohttp.ClientSession() as session:
+        # init models
+        models = [Model(json_data=json_model) for json_model in await get_data(session, config.models_endpoint)]
+        if len(models) > 0:
+            logging.info("Models: %s", [model.to_json() for model in models])
+        else:
+            logging.warning("No models found")
+
+        # init containers
+        containers = [Container(json_data=json_container)
+                      for json_container in await get_data(session, config.containers_endpoint)]
+        if len(containers) > 0:
+            logging.info("Containers: %s", [container.to_json() for container in containers])
+        else:
+            logging.warning("No containers found")
+        logging.info("Found %d models and %d containers", len(models), len(containers))
+
+    # init requests queues
+    reqs_queues = {model.name: queue.Queue(maxsize=config.max_queue_size) for model in models}
+    admission_control = AdmissionControl(models, containers, config.admission_sla_factor)
+    logging.info("Max queue size: %d, admission SLA factor: %s", config.max_queue_size, config.admission_sla_factor)
+
+    # init policy
+    queues_policies = QueuesPolicies(reqs_queues, models, logging)
+    scheduler = AsyncQueuesScheduler(reqs_queues, admission_control, queues_policies)
+    gpu_policy = queues_policies.policies.get(config.gpu_queues_policy)
+    cpu_policy = queues_policies.policies.get(config.cpu_queues_policy)
+    logging.info("Policy for GPUs: %s", config.gpu_queues_policy)
+    logging.info("Policy for CPUs: %s", config.cpu_queues_policy)
+
+    # disable logging if verbose == 0
+    logging.info("Verbose: %d", config.verbose)
+    if config.verbose == 0:
+        logging.getLogger('aiohttp.access').setLevel(logging.WARNING)
+
+    # init dispatchers
+    status = "Init dispatchers"
+    logging.info(status)
+    logging.info("Dispatching policy: %s", config.dispatching_policy)
+    logger = logging.getLogger("dispatcher")
+    dispatcher_gpu = AsyncDispatcher(logger, models, containers, config.dispatching_policy, Device.GPU,
+                                     config.max_consumers_gpu, config.pool_maxsize, config.pool_block,
+                                     config.deadline_sla_factor, config.request_timeout, config.hedge_percentile,
+                                     config.max_retries, config.breaker_threshold, config.breaker_open_time,
+                                     config.breaker_latency_factor, config.drop_late_requests)
+    dispatcher_cpu = AsyncDispatcher(logger, models, containers, config.dispatching_policy, Device.CPU,
+                                     config.max_consumers_cpu, config.pool_maxsize, config.pool_block,
+                                     config.deadline_sla_factor, config.request_timeout, config.hedge_percentile,
+                                     config.max_retries, config.breaker_threshold, config.breaker_open_time,
+                                     config.breaker_latency_factor, config.drop_late_requests)
+    devices = {Device.GPU: (dispatcher_gpu, gpu_policy, config.max_consumers_gpu),
+               Device.CPU: (dispatcher_cpu, cpu_policy, config.max_consumers_cpu)}
+
+    # start the send requests threads, the requests store is called out of the event loop
+    status = "Start send reqs threads"
+    logging.info(status)
+    requests_logger = RequestsLogger(config.requests_store_bulk_endpoint, config.log_batch_size,
+                                     config.log_flush_interval, config.log_max_pending, config.log_spill_file, logging)
+    log_consumer_threads_pool = ThreadPoolExecutor(max_workers=config.max_log_consumers)
+    for i in range(config.max_log_consumers):
+        log_consumer_threads_pool.submit(requests_logger.flush_loop)
+
+    # start the queues consumer tasks
+    status = "Start queues consumer tasks"
+    logging.info(status)
+
+    start_consumers(containers, devices)
+
+    # start the containers watcher task
+    if config.containers_refresh_interval > 0:
+        status = "Start containers watcher task"
+        logging.info(status)
+        containers_watcher = AsyncContainersWatcher(config.containers_endpoint, config.containers_refresh_interval,
+                                                    lambda new_containers: update_containers(new_containers,
+                                                                                             devices),
+                                                    aiohttp.ClientSession(), logging)
+        background_tasks.append(asyncio.ensure_future(containers_watcher.watch()))
+
+    status = "active"
+    active = True
+    logging.info(status)
+    return True
+
+
+async def on_startup(app):
+    global configure_lock
+    configure_lock = asyncio.Lock()
+
+
+async def on_cleanup(app):
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+
+    for dispatcher, _ in dispatchers.values():
+        await dispatcher.close()
+    if containers_watcher:
+        await containers_watcher.session.close()
+
+
+def create_app(delete_config=False):
+    global status
+
+    # init log
+    coloredlogs.install(level='DEBUG', milliseconds=True)
+
+    # delete config file
+    if delete_config:
+        logging.info("deleting config file")
+        try:
+            os.remove(config_filename)
+        except FileNotFoundError as e:
+            logging.info("file not found")
+
+    status = "inactive"
+    logging.info(status)
+
+    app = web.Application()
+    app.add_routes(routes)
+    app.on_startup.append(on_startup)
+    app.on_cleanup.append(on_cleanup)
+    return app
+
+
+if __name__ == '__main__':
+    web.run_app(create_app(), port=8000)
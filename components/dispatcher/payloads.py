@@ -0,0 +1,75 @@
+import math
+import re
+
+import orjson
+
+# key of the instances in the body of a predict request
+INSTANCES_KEY = re.compile(rb'"instances"\s*:\s*')
+# a member of an object after an array or an object: found in the raw instances if they include the next members
+NEXT_MEMBER = re.compile(rb'[\]}]\s*,\s*"(?:[^"\\]|\\.)*"\s*:')
+# a member after a comma, searched before NEXT_MEMBER since the search of a literal is faster than of a character set
+MEMBER = re.compile(rb',\s*"(?:[^"\\]|\\.)*"\s*:')
+# candidate ends of the instances tried from the end of the body
+MAX_END_CANDIDATES = 8
+
+
+def parse_envelope(body, raw=True):
+    """
+    Parse the body of a predict request without parsing the instances.
+    The end of the instances is searched from the end of the body: the envelope, i.e. the body with null in place of
+    the instances, is parsed to check it and to read the other keys.
+    Return the envelope and the raw instances (bytes), or the parsed body and instances if the instances cannot be
+    separated or raw is False. Raise ValueError if the body is not valid JSON.
+    """
+    match = INSTANCES_KEY.search(body) if raw else None
+    if match is not None and body[match.end():match.end() + 1] in (b"[", b"{"):
+        start = match.end()
+        close = b"]" if body[start:start + 1] == b"[" else b"}"
+        end = len(body)
+        for _ in range(MAX_END_CANDIDATES):
+            end = body.rfind(close, start, end)
+            if end < 0:
+                break
+            try:
+                envelope = orjson.loads(b"".join((body[:start], b"null", body[end + 1:])))
+            except orjson.JSONDecodeError:
+                continue
+            if isinstance(envelope, dict) and "instances" in envelope and envelope["instances"] is None:
+                instances = body[start:end + 1]
+                if b'"' not in instances or MEMBER.search(instances) is None \
+                        or NEXT_MEMBER.search(instances) is None:
+                    return envelope, instances
+            break
+
+    data = orjson.loads(body)
+    return data, data.get("instances") if isinstance(data, dict) else None
+
+
+def parse_sync(sync, timeout, default_timeout):
+    """
+    Parse the query parameters of a predict request: sync (0 or 1) and, if sync is 1, timeout (seconds).
+    Return None if the caller does not wait for the response, the timeout otherwise.
+    Raise ValueError if a parameter is not valid
+    """
+    if sync is None or sync == "0":
+        return None
+    if sync != "1":
+        raise ValueError("sync must be 0 or 1")
+    if timeout is None:
+        return default_timeout
+    try:
+        timeout = float(timeout)
+    except ValueError:
+        timeout = math.nan
+    if not 0 < timeout < math.inf:
+        raise ValueError("timeout must be a positive number of seconds")
+    return timeout
+
+
+def predict_body(instances):
+    """
+    Return the body of the predict call, the raw instances are copied as they are
+    """
+    if isinstance(instances, (bytes, bytearray)):
+        return b"".join((b'{"instances":', instances, b"}"))
+    return orjson.dumps({"instances": instances})
@@ -0,0 +1,183 @@
+import asyncio
+import time
+from threading import Condition
+
+
+class QueuesScheduler:
+    """
+    Hands the requests of the applications queues to the consumers.
+    Producers signal every new request, consumers sleep until at least one queue has work
+    and then take the request from the queue selected by their queues policy.
+    If an admission control is given, the new requests are queued only when admitted.
+    If queues policies are given, their index of the queues is updated with every request put and taken.
+    """
+
+    def __init__(self, reqs_queues, admission_control=None, queues_policies=None) -> None:
+        self.reqs_queues = reqs_queues
+        self.admission_control = admission_control
+        self.queues_policies = queues_policies
+        self.condition = Condition()
+        self.pending = 0
+        self.batch_waiters = 0
+
+    def put(self, model, req):
+        """
+        Queue the request, return None if queued or the Rejection of the admission control
+        """
+        with self.condition:
+            if self.admission_control:
+                rejection = self.admission_control.check(model, self.reqs_queues[model])
+                if rejection is not None:
+                    return rejection
+            self.reqs_queues[model].put(req)
+            self.pending += 1
+            if self.queues_policies:
+                self.queues_policies.queued(req)
+            if self.batch_waiters > 0:
+                # the request can complete a batch: wake the consumers waiting for a batch too
+                self.condition.notify_all()
+            else:
+                self.condition.notify()
+            return None
+
+    def dequeued(self, req):
+        if self.queues_policies:
+            self.queues_policies.dequeued(req)
+        return req
+
+    def get(self, policy):
+        with self.condition:
+            return self._get(policy)
+
+    def _get(self, policy):
+        while self.pending == 0:
+            self.condition.wait()
+
+        # some queue has work: ask the policy until it selects a non empty queue
+        selected_queue = policy()
+        while self.reqs_queues[selected_queue].empty():
+            selected_queue = policy()
+
+        self.pending -= 1
+        return self.dequeued(self.reqs_queues[selected_queue].get_nowait())
+
+    def get_batch(self, policy, max_batch_size=1, max_batch_wait=0):
+        """
+        Take the request selected by the policy and the next requests of the same model and version,
+        waiting at most max_batch_wait seconds to fill the batch
+        """
+        with self.condition:
+            batch = [self._get(policy)]
+            reqs_queue = self.reqs_queues[batch[0].model]
+            deadline = time.time() + max_batch_wait
+
+            while len(batch) < max_batch_size:
+                if reqs_queue.empty():
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        break
+                    self.batch_waiters += 1
+                    self.condition.wait(remaining)
+                    self.batch_waiters -= 1
+                elif reqs_queue.queue[0].version != batch[0].version:
+                    break
+                else:
+                    batch.append(self.dequeued(reqs_queue.get_nowait()))
+                    self.pending -= 1
+
+            if len(batch) > 1 and self.queues_policies:
+                self.queues_policies.charge(policy, batch[0].model, len(batch) - 1)
+            return batch
+
+
+class AsyncQueuesScheduler:
+    """
+    Asyncio version of the QueuesScheduler, producers and consumers are tasks of the same event loop
+    """
+
+    def __init__(self, reqs_queues, admission_control=None, queues_policies=None) -> None:
+        self.reqs_queues = reqs_queues
+        self.admission_control = admission_control
+        self.queues_policies = queues_policies
+        self.condition = asyncio.Condition()
+        self.pending = 0
+        self.batch_waiters = 0
+
+    async def put(self, model, req):
+        """
+        Queue the request, return None if queued or the Rejection of the admission control
+        """
+        async with self.condition:
+            if self.admission_control:
+                rejection = self.admission_control.check(model, self.reqs_queues[model])
+                if rejection is not None:
+                    return rejection
+            self.reqs_queues[model].put_nowait(req)
+            self.pending += 1
+            if self.queues_policies:
+                self.queues_policies.queued(req)
+            if self.batch_waiters > 0:
+                # the request can complete a batch: wake the consumers waiting for a batch too
+                self.condition.notify_all()
+            else:
+                self.condition.notify()
+            return None
+
+    def dequeued(self, req):
+        if self.queues_policies:
+            self.queues_policies.dequeued(req)
+        return req
+
+    async def notify_all(self):
+        async with self.condition:
+            self.condition.notify_all()
+
+    async def get(self, policy):
+        async with self.condition:
+            return await self._get(policy)
+
+    async def _get(self, policy):
+        await self.condition.wait_for(lambda: self.pending > 0)
+
+        # some queue has work: ask the policy until it selects a non empty queue
+        selected_queue = policy()
+        while self.reqs_queues[selected_queue].empty():
+            selected_queue = policy()
+
+        self.pending -= 1
+        return self.dequeued(self.reqs_queues[selected_queue].get_nowait())
+
+    async def get_batch(self, policy, max_batch_size=1, max_batch_wait=0):
+        """
+        Take the request selected by the policy and the next requests of the same model and version,
+        waiting at most max_batch_wait seconds to fill the batch
+        """
+        async with self.condition:
+            batch = [await self._get(policy)]
+            reqs_queue = self.reqs_queues[batch[0].model]
+            deadline = time.time() + max_batch_wait
+
+            while len(batch) < max_batch_size:
+                if reqs_queue.empty():
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        break
+                    # woken by a notification at the end of the wait: on python 3.7 a wait cancelled by
+                    # wait_for can return before the lock is acquired again
+                    self.batch_waiters += 1
+                    timer = asyncio.get_event_loop().call_later(remaining,
+                                                                lambda: asyncio.ensure_future(self.notify_all()))
+                    try:
+                        await self.condition.wait()
+                    finally:
+                        timer.cancel()
+                    self.batch_waiters -= 1
+                elif reqs_queue.queue[0].version != batch[0].version:
+                    break
+                else:
+                    batch.append(self.dequeued(reqs_queue.get_nowait()))
+                    self.pending -= 1
+
+            if len(batch) > 1 and self.queues_policies:
+                self.queues_policies.charge(policy, batch[0].model, len(batch) - 1)
+            return batch
@@ -0,0 +1,160 @@
+import json
+import logging
+import os
+from collections import OrderedDict
+from threading import Condition, Lock
+
+import orjson
+import requests
+
+from dispatcher import JSON_HEADERS
+
+
+class RequestsLogger:
+    """
+    Sends the logged requests to the requests store in batches.
+
+    The events of a request (created, completed) are coalesced while they wait to be sent:
+    the request is serialized when the batch is flushed, so it is sent once with its last state.
+    A batch is flushed when it reaches batch_size requests or every flush_interval seconds.
+    At most max_pending requests are kept in memory, the others are dropped or, if a spill file is given,
+    appended to the spill file by the flushers and sent when the backlog is gone: log never writes files, so it
+    does not block the callers (the event loop of the asyncio dispatcher).
+    The requests are sent without the instances and the response, but the ones sampled to keep their payloads.
+    """
+
+    def __init__(self,
+                 endpoint,
+                 batch_size: int = 100,
+                 flush_interval: float = 1,
+                 max_pending: int = 100000,
+                 spill_file: str = None,
+                 logger=None) -> None:
+        self.endpoint = endpoint
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.spill_file = spill_file
+        self.logger = logger if logger else logging
+
+        self.pending = OrderedDict()
+        # the requests over max_pending, to write in the spill file
+        self.overflow = []
+        self.condition = Condition()
+        self.spill_lock = Lock()
+        self.replay_lock = Lock()
+        self.spilled_pending = 0
+        self.session = requests.Session()
+
+        # counters
+        self.sent = 0
+        self.failed = 0
+        self.dropped = 0
+        self.spilled = 0
+
+    def log(self, req):
+        with self.condition:
+            if req.id in self.pending:
+                # the request is already waiting to be sent, it will be sent with its last state
+                return
+
+            if len(self.pending) >= self.max_pending:
+                if self.spill_file:
+                    self.overflow.append(req)
+                    if len(self.overflow) >= self.batch_size:
+                        self.condition.notify()
+                else:
+                    self.dropped += 1
+                return
+
+            self.pending[req.id] = req
+            if len(self.pending) >= self.batch_size:
+                self.condition.notify()
+
+    def spill(self, reqs):
+        lines = "".join(json.dumps(self.to_json(req)) + "\n" for req in reqs)
+        with self.spill_lock:
+            with open(self.spill_file, 'a') as spill_file:
+                spill_file.write(lines)
+            self.spilled += len(reqs)
+            self.spilled_pending += len(reqs)
+
+    @staticmethod
+    def to_json(req):
+        if not req.keep_payloads:
+            return req.to_json()
+        req_json = req.to_json(verbose=True)
+        if isinstance(req.instances, (bytes, bytearray)):
+            # raw instances forwarded as they are
+            req_json["instances"] = json.loads(req.instances)
+        if hasattr(req.response, "content"):
+            # response of the model
+            try:
+                req_json["response"] = json.loads(req.response.content)
+            except ValueError:
+                req_json["response"] = req.response.content.decode(errors="replace")
+        return req_json
+
+    def flush_loop(self):
+        while True:
+            with self.condition:
+                if len(self.pending) < self.batch_size and len(self.overflow) < self.batch_size:
+                    self.condition.wait(self.flush_interval)
+                batch = [self.pending.popitem(last=False)[1]
+                         for _ in range(min(self.batch_size, len(self.pending)))]
+                overflow, self.overflow = self.overflow, []
+                backlog = len(self.pending)
+
+            if overflow:
+                self.spill(overflow)
+
+            if batch:
+                self.send([self.to_json(req) for req in batch])
+
+            if self.spilled_pending > 0 and backlog < self.batch_size:
+                self.replay_spill()
+
+    def replay_spill(self):
+        # only one flusher replays the spilled requests
+        if not self.replay_lock.acquire(blocking=False):
+            return
+        try:
+            # take the spilled requests, the new ones are written in a new spill file
+            with self.spill_lock:
+                if self.spilled_pending == 0:
+                    return
+                replay_file = self.spill_file + ".replay"
+                os.replace(self.spill_file, replay_file)
+                self.spilled_pending = 0
+
+            with open(replay_file) as spill_file:
+                batch = []
+                for line in spill_file:
+                    batch.append(json.loads(line))
+                    if len(batch) == self.batch_size:
+                        self.send(batch)
+                        batch = []
+                if batch:
+                    self.send(batch)
+            os.remove(replay_file)
+        finally:
+            self.replay_lock.release()
+
+    def send(self, payload):
+        try:
+            response = self.session.post(self.endpoint, data=orjson.dumps(payload), headers=JSON_HEADERS)
+            response.raise_for_status()
+            with self.condition:
+                self.sent += len(payload)
+        except Exception as e:
+            self.logger.warning("Requests not logged: %s", e)
+            with self.condition:
+                self.failed += len(payload)
+
+    def metrics(self):
+        return {"pending": len(self.pending),
+                "spilled_pending": self.spilled_pending,
+                "sent": self.sent,
+                "failed": self.failed,
+                "dropped": self.dropped,
+                "spilled": self.spilled}
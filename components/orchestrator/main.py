@@ -324,7 +324,16 @@ def configure():
     configs["containers_manager"] = ContainersManagerConfiguration(actuator_port=configs["k8s_config"].actuator_port,
                                                                    init_quota=data["containers_manager"]["init_quota"])
 
-    configs["requests_store"] = RequestsStoreConfiguration(containers_manager=configs["orchestrator"].containers_manager)
+    requests_store = data.get("requests_store", {})
+    configs["requests_store"] = RequestsStoreConfiguration(containers_manager=configs["orchestrator"].containers_manager,
+                                                           retention_time=requests_store.get("retention_time", 600),
+                                                           max_requests=requests_store.get("max_requests", 1000000),
+                                                           downsample_width=requests_store.get("downsample_width", 60),
+                                                           aggregates_retention_time=requests_store.get(
+                                                               "aggregates_retention_time", 86400),
+                                                           log_dir=requests_store.get("log_dir"),
+                                                           log_fsync_interval=requests_store.get(
+                                                               "log_fsync_interval", 1))
 
     configs["controller"] = ControllerConfiguration(containers_manager=configs["orchestrator"].containers_manager,
                                                     requests_store=configs["orchestrator"].requests_store,
@@ -342,7 +351,36 @@ def configure():
                                                     max_log_consumers=data["dispatcher"]["max_log_consumers"],
                                                     max_polling_threads=data["dispatcher"]["max_polling_threads"],
                                                     max_consumers_cpu=data["dispatcher"]["max_consumers_cpu"],
-                                                    max_consumers_gpu=data["dispatcher"]["max_consumers_gpu"])
+                                                    max_consumers_gpu=data["dispatcher"]["max_consumers_gpu"],
+                                                    pool_maxsize=data["dispatcher"].get("pool_maxsize"),
+                                                    pool_block=data["dispatcher"].get("pool_block", False),
+                                                    sync_timeout=data["dispatcher"].get("sync_timeout", 30),
+                                                    max_batch_size=data["dispatcher"].get("max_batch_size", 1),
+                                                    max_batch_wait=data["dispatcher"].get("max_batch_wait", 0),
+                                                    log_batch_size=data["dispatcher"].get("log_batch_size", 100),
+                                                    log_flush_interval=data["dispatcher"].get("log_flush_interval", 1),
+                                                    log_max_pending=data["dispatcher"].get("log_max_pending", 100000),
+                                                    log_spill_file=data["dispatcher"].get("log_spill_file"),
+                                                    log_payloads_sample=data["dispatcher"].get(
+                                                        "log_payloads_sample", 0),
+                                                    max_queue_size=data["dispatcher"].get("max_queue_size", 0),
+                                                    admission_sla_factor=data["dispatcher"].get(
+                                                        "admission_sla_factor", 0),
+                                                    dispatching_policy=data["dispatcher"].get(
+                                                        "dispatching_policy", 0),
+                                                    containers_refresh_interval=data["dispatcher"].get(
+                                                        "containers_refresh_interval", 5),
+                                                    deadline_sla_factor=data["dispatcher"].get(
+                                                        "deadline_sla_factor", 0),
+                                                    request_timeout=data["dispatcher"].get("request_timeout", 0),
+                                                    hedge_percentile=data["dispatcher"].get("hedge_percentile", 0),
+                                                    max_retries=data["dispatcher"].get("max_retries", 0),
+                                                    breaker_threshold=data["dispatcher"].get("breaker_threshold", 5),
+                                                    breaker_open_time=data["dispatcher"].get("breaker_open_time", 5),
+                                                    breaker_latency_factor=data["dispatcher"].get(
+                                                        "breaker_latency_factor", 0),
+                                                    drop_late_requests=data["dispatcher"].get(
+                                                        "drop_late_requests", False))
 
     status = "configured"
     logging.info(status)
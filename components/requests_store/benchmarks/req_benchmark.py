@@ -0,0 +1,106 @@
+"""
+Memory and serialization of the stored requests.
+
+The requests of a bulk are read and stored, then written back, compared with the previous request record:
+a dict backed object with an uuid id, that was stringified at every to_json, rebinding its dict to the json of the
+request, read and written with the json module.
+Measured: the memory of a stored request (tracemalloc), the requests read from a bulk and written per second.
+
+Run from the requests store folder:
+    python -m benchmarks.req_benchmark --requests 100000
+"""
+import argparse
+import json
+import logging
+import time
+import tracemalloc
+import uuid
+
+import orjson
+
+from models.req import Req, ReqState
+
+
+class DictReq:
+    # the previous request record
+    def __init__(self, model=None, version=None, instances=None, json_data=None):
+        if json_data:
+            self.__dict__ = json_data
+        else:
+            self.id = uuid.uuid4()
+            self.model = model
+            self.version = version
+            self.instances = instances
+            self.ts_in = time.time()
+            self.ts_wait = self.ts_in + 0.01
+            self.ts_out = self.ts_wait + 0.1
+            self.process_time = self.ts_out - self.ts_wait
+            self.resp_time = self.ts_out - self.ts_in
+            self.node = "node-1"
+            self.container = "container-1"
+            self.container_id = "8d2b7f0c4e1a"
+            self.device = 1
+            self.response = None
+            self.state = ReqState.COMPLETED
+
+    def to_json(self, verbose=False):
+        return {"id": str(self.id), "model": self.model, "version": self.version, "node": self.node,
+                "container": self.container, "container_id": self.container_id, "device": self.device,
+                "ts_in": self.ts_in, "ts_wait": self.ts_wait, "ts_out": self.ts_out,
+                "process_time": self.process_time, "resp_time": self.resp_time, "state": self.state}
+
+
+def bulk(num_requests):
+    # the body of a bulk of completed requests, as sent by the dispatcher
+    return json.dumps([DictReq("model-" + str(i % 10), 1).to_json() for i in range(num_requests)]).encode()
+
+
+def previous_read(body):
+    return [DictReq(json_data=req_json) for req_json in json.loads(body)]
+
+
+def previous_write(reqs):
+    return json.dumps([req.to_json() for req in reqs]).encode()
+
+
+def read(body):
+    return Req.from_json_list(orjson.loads(body))
+
+
+def write(reqs):
+    return orjson.dumps(Req.to_json_list(reqs))
+
+
+def bytes_per_request(read_function, body, num_requests):
+    # the memory left after the read: the stored requests and the values they reference
+    tracemalloc.start()
+    reqs = read_function(body)
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    assert len(reqs) == num_requests
+    return size / num_requests
+
+
+def per_second(function, arg, num_requests, repeat=3):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        function(arg)
+    return num_requests * repeat / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=100000)
+    args = parser.parse_args()
+
+    logging.basicConfig(level='INFO', format="%(message)s")
+
+    body = bulk(args.requests)
+    assert orjson.loads(write(read(body))) == json.loads(previous_write(previous_read(body)))
+    for name, read_function, write_function in (("previous", previous_read, previous_write),
+                                                ("slotted", read, write)):
+        size = bytes_per_request(read_function, body, args.requests)
+        reqs = read_function(body)
+        logging.info("%-8s bytes/request: %4.0f, read req/s: %9.0f, write req/s: %9.0f", name, size,
+                     per_second(read_function, body, args.requests),
+                     per_second(write_function, reqs, args.requests))
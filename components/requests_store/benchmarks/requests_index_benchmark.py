@@ -0,0 +1,112 @@
+"""
+Metrics of the requests store with many stored requests.
+
+The requests of the last --duration seconds are stored, spread over the containers and the models, then the
+metrics by container and model of the last --window seconds (the query of the controller) are computed:
+- summaries: merging the summaries of the buckets of the window, with the percentiles of the sketches
+- window: with Req.metrics on the requests of the window read from the index
+- scan: with Req.metrics, filtering all the requests for every container and model (the previous store)
+
+Run from the requests store folder:
+    python -m benchmarks.requests_index_benchmark --requests 10000000
+"""
+import argparse
+import logging
+import math
+import random
+import time
+
+from metrics_summary import MetricsSummary
+from models.req import Req
+from requests_index import RequestsIndex
+
+
+def fill(num_requests, duration, containers, models):
+    # all the requests are retained
+    reqs = RequestsIndex(retention_time=2 * duration, max_requests=num_requests)
+    now = time.time()
+    start = time.perf_counter()
+    for i in range(num_requests):
+        req = Req(random.choice(models), 1)
+        req.id = str(i)
+        req.ts_in = now - duration * (1 - i / num_requests)
+        if random.random() < 0.99:
+            req.container_id = random.choice(containers)
+            req.set_waiting(req.ts_in + random.uniform(0, 0.1))
+            req.set_completed(None, req.ts_wait + random.uniform(0.01, 0.5))
+        reqs.store(req)
+    logging.info("stored requests: %d, req/s: %.0f", num_requests, num_requests / (time.perf_counter() - start))
+    return reqs, now
+
+
+def scan_metrics(reqs_list, from_ts, containers, models):
+    # the previous metrics by container and model
+    metrics = {}
+    for container_id in containers:
+        container_reqs = list(filter(lambda r: r.container_id == container_id, list(reqs_list)))
+        metrics[container_id] = {model: Req.metrics(list(filter(lambda r: r.model == model, container_reqs)), from_ts)
+                                 for model in models}
+    return metrics
+
+
+def window_metrics(reqs, from_ts, containers, models):
+    return {container_id: {model: Req.metrics(reqs.window(from_ts, container_id, model), from_ts)
+                           for model in models}
+            for container_id in containers}
+
+
+def summaries_metrics(reqs, from_ts, containers, models):
+    return {container_id: {model: reqs.metrics(from_ts, container_id, model) for model in models}
+            for container_id in containers}
+
+
+def same(metrics, other):
+    # the means and the variances of the summaries are computed with running sums
+    return all(math.isclose(metrics[container_id][model][key], value, rel_tol=1e-9)
+               if isinstance(value, float) else metrics[container_id][model][key] == value
+               for container_id in other for model in other[container_id]
+               for key, value in other[container_id][model].items())
+
+
+def percentiles_error(metrics, reqs_list, from_ts):
+    # max relative error of the percentiles of the response time from the sketches
+    error = 0
+    for container_id in metrics:
+        for model in metrics[container_id]:
+            resp_times = sorted(req.resp_time for req in reqs_list if req.container_id == container_id
+                                and req.model == model and req.ts_out is not None and req.ts_out > from_ts)
+            for name, q in MetricsSummary.PERCENTILES:
+                exact = resp_times[int(q * (len(resp_times) - 1))]
+                error = max(error, abs(metrics[container_id][model][name] - exact) / exact)
+    return error
+
+
+def seconds(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return time.perf_counter() - start, result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=10000000)
+    parser.add_argument('--duration', type=float, default=10000)
+    parser.add_argument('--window', type=float, nargs='+', default=[10, 60, 600])
+    parser.add_argument('--containers', type=int, default=4)
+    parser.add_argument('--models', type=int, default=2)
+    args = parser.parse_args()
+
+    logging.basicConfig(level='INFO', format="%(message)s")
+
+    containers = ["container-" + str(i) for i in range(args.containers)]
+    models = ["model-" + str(i) for i in range(args.models)]
+    reqs, now = fill(args.requests, args.duration, containers, models)
+
+    for window in args.window:
+        summaries, metrics = seconds(summaries_metrics, reqs, now - window, containers, models)
+        indexed, window_result = seconds(window_metrics, reqs, now - window, containers, models)
+        scan, scan_result = seconds(scan_metrics, reqs.values(), now - window, containers, models)
+        assert window_result == scan_result and same(metrics, scan_result)
+        logging.info("window: %5.0f s, metrics by container and model ms summaries: %7.2f window: %8.2f "
+                     "scan: %9.2f, percentiles error: %.2f%%", window, summaries * 1000, indexed * 1000, scan * 1000,
+                     percentiles_error(metrics, reqs.values(), now - window) * 100)
@@ -0,0 +1,108 @@
+"""
+Ingest and cold start of the requests store with the log of the requests.
+
+The events of --requests requests (created, waiting and completed) are appended to a log in a temporary folder,
+compared with a log of json lines (orjson) written through a buffered file, then the requests are
+replayed as at the start of the store:
+- read: the records of the segments are decoded (mmap), or the lines are read and parsed
+- replay: the requests are decoded and stored in a new index
+Measured: the bytes of the log per event, the events appended per second and the seconds of the replay.
+
+Run from the requests store folder:
+    python -m benchmarks.requests_log_benchmark --requests 1000000
+"""
+import argparse
+import logging
+import os
+import random
+import tempfile
+import time
+
+import orjson
+
+from models.req import Req
+from requests_index import RequestsIndex
+from requests_log import RequestsLog
+
+
+def events(num_requests, duration):
+    # the events of the requests of the last duration seconds, as stored by the requests store
+    now = time.time()
+    for i in range(num_requests):
+        req = Req("model-" + str(i % 2), 1)
+        req.ts_in = now - duration * (1 - i / num_requests)
+        req.node = "192.168.99.103"
+        req.container = "tfserving-gpu-" + str(i % 4)
+        req.container_id = "8d2b7f0c4e1" + str(i % 4)
+        yield Req(json_data=req.to_json())
+        req.device = i % 2
+        req.set_waiting(req.ts_in + random.uniform(0, 0.1))
+        yield Req(json_data=req.to_json())
+        req.set_completed(None, req.ts_wait + random.uniform(0.01, 0.5))
+        yield req
+
+
+class JsonLinesLog:
+    # a log of json lines, to compare
+    def __init__(self, path) -> None:
+        self.path = path
+        self.file = open(path, "ab", buffering=2 ** 20)
+
+    def append(self, req):
+        self.file.write(orjson.dumps(req.to_json()) + b"\n")
+
+    def close(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.file.close()
+
+    def replay(self, store):
+        with open(self.path, "rb") as file:
+            for line in file:
+                store(Req(json_data=orjson.loads(line)))
+
+
+def ingest(log, reqs):
+    start = time.perf_counter()
+    for req in reqs:
+        log.append(req)
+    log.close()
+    return len(reqs) / (time.perf_counter() - start)
+
+
+def replay(log, store):
+    start = time.perf_counter()
+    log.replay(store)
+    seconds = time.perf_counter() - start
+    log.close()
+    return seconds
+
+
+def size(path):
+    if os.path.isdir(path):
+        return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+    return os.path.getsize(path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=1000000)
+    parser.add_argument('--duration', type=float, default=600)
+    args = parser.parse_args()
+
+    logging.basicConfig(level='INFO', format="%(message)s")
+
+    reqs = list(events(args.requests, args.duration))
+    with tempfile.TemporaryDirectory() as folder:
+        log_dir = os.path.join(folder, "log")
+        json_path = os.path.join(folder, "requests.jsonl")
+        logs = (("json lines", lambda: JsonLinesLog(json_path), json_path),
+                ("log", lambda: RequestsLog(log_dir, retention_time=2 * args.duration), log_dir))
+        for name, open_log, path in logs:
+            append_rate = ingest(open_log(), reqs)
+            read_time = replay(open_log(), lambda req: None)
+            index = RequestsIndex(retention_time=2 * args.duration, max_requests=args.requests)
+            replay_time = replay(open_log(), index.store)
+            assert len(index) == args.requests
+            logging.info("%-10s bytes/event: %4.0f, appended events/s: %9.0f, read s: %6.2f, replay s: %6.2f",
+                         name, size(path) / len(reqs), append_rate, read_time, replay_time)
@@ -1,10 +1,29 @@
 class RequestsStoreConfiguration:
+    retention_time = 600
+    max_requests = 1000000
+    downsample_width = 60
+    aggregates_retention_time = 86400
+    log_dir = None
+    log_fsync_interval = 1
+
     def __init__(self,
                  containers_manager=None,
+                 retention_time=600,
+                 max_requests=1000000,
+                 downsample_width=60,
+                 aggregates_retention_time=86400,
+                 log_dir=None,
+                 log_fsync_interval=1,
                  json_data=None):
         if json_data:
             self.__dict__ = json_data
         else:
             self.containers_manager = containers_manager
+            self.retention_time = retention_time
+            self.max_requests = max_requests
+            self.downsample_width = downsample_width
+            self.aggregates_retention_time = aggregates_retention_time
+            self.log_dir = log_dir
+            self.log_fsync_interval = log_fsync_interval
             self.models_endpoint = self.containers_manager + "/models"
             self.containers_endpoint = self.containers_manager + "/containers"
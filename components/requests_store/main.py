@@ -1,19 +1,25 @@
-from flask import Flask, jsonify
+from flask import Flask, jsonify, Response
 from flask import request
 from flask_cors import CORS
 import argparse
 import logging
+import os
+import orjson
 import requests
 from models.req import Req
 from models.model import Model
 from models.container import Container
 from configuration import RequestsStoreConfiguration
+from requests_index import RequestsIndex
+from requests_log import RequestsLog
 
 app = Flask(__name__)
 CORS(app)
 
 status = None
-reqs = {}
+reqs = RequestsIndex()
+# the log of the stored requests, if a log_dir is configured
+log = None
 config = None
 models = []
 containers = []
@@ -21,14 +27,26 @@ containers = []
 
 @app.route('/', methods=['GET'])
 def get_status():
-    return {"status": status}
+    return {"status": status,
+            "requests": {**reqs.status(), "rss_mb": rss_mb()},
+            "log": log.status() if log is not None else None}
+
+
+def rss_mb():
+    # resident memory of the process, None if not available
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except (OSError, ValueError):
+        return None
 
 
 @app.route('/requests', methods=['DELETE'])
 def delete_requests():
-    global reqs
-    reqs = {}
-    return jsonify(reqs)
+    reqs.clear()
+    if log is not None:
+        log.clear()
+    return jsonify({})
 
 
 @app.route('/requests', methods=['GET', 'POST'])
@@ -36,17 +54,29 @@ def get_requests():
     if request.method == 'GET':
         verbose = request.args.get('verbose')
         reqs_list = list(reqs.values())
-        if verbose is None or int(verbose) == 0:
-            return jsonify([req.to_json(verbose=False) for req in reqs_list])
-        else:
-            return jsonify([req.to_json(verbose=True) for req in reqs_list])
+        verbose = verbose is not None and int(verbose) != 0
+        return Response(orjson.dumps(Req.to_json_list(reqs_list, verbose)), mimetype='application/json')
     elif request.method == 'POST':
         rs = request.get_json()
-        reqs[rs["id"]] = Req(json_data=rs)
+        store_request(Req(json_data=rs))
         # app.logger.info("+ %s", rs)
         return jsonify(rs)
 
 
+@app.route('/requests/bulk', methods=['POST'])
+def post_requests_bulk():
+    reqs_list = Req.from_json_list(orjson.loads(request.get_data()))
+    for req in reqs_list:
+        store_request(req)
+    return {"stored": len(reqs_list)}
+
+
+def store_request(req):
+    # the events of a request can arrive out of order, keep the most advanced state
+    if reqs.store(req) and log is not None:
+        log.append(req)
+
+
 @app.route('/requests/<node>', methods=['GET'])
 def get_requests_by_node(node):
     reqs_list = list(reqs.values())
@@ -59,21 +89,20 @@ def get_metrics_by_model():
     from_ts = request.args.get('from_ts')
 
     for model in models:
-        # filter the reqs associated with the model
-        reqs_list = list(reqs.values())
-        model_reqs = list(filter(lambda r: r.model == model.name and r.version == model.version, reqs_list))
+        # merge the metrics of the buckets of the model
+        model_metrics = reqs.metrics(from_ts or 0, model=model.name, version=model.version)
         if from_ts is not None:
             # compute the metrics from ts
             metrics.append(
                 {"model": model.name,
                  "version": model.version,
-                 "metrics_from_ts": Req.metrics(model_reqs, from_ts)})
+                 "metrics_from_ts": model_metrics})
         else:
             # compute the metrics
             metrics.append(
                 {"model": model.name,
                  "version": model.version,
-                 "metrics": Req.metrics(model_reqs)})
+                 "metrics": model_metrics})
     return jsonify(metrics)
 
 
@@ -83,18 +112,17 @@ def get_metrics_by_container():
     from_ts = request.args.get('from_ts')
 
     for container in containers:
-        # filter the reqs associated with the container
-        reqs_list = list(reqs.values())
-        container_reqs = list(filter(lambda r: r.container_id == container.container_id, reqs_list))
+        # merge the metrics of the buckets of the container
+        container_metrics = reqs.metrics(from_ts or 0, container_id=container.container_id)
 
         if from_ts is not None:
             # compute the metrics from ts
             metrics.append({"container": container.to_json(),
-                            "metrics_from_ts": Req.metrics(container_reqs, from_ts)})
+                            "metrics_from_ts": container_metrics})
         else:
             # compute the metrics
             metrics.append({"container": container.to_json(),
-                            "metrics": Req.metrics(container_reqs)})
+                            "metrics": container_metrics})
     return jsonify(metrics)
 
 
@@ -108,15 +136,10 @@ def get_metrics_by_container_model():
         from_ts = float(from_ts)
 
     for container in containers:
-        # filter the reqs associated with the container
-        reqs_list = list(reqs.values())
-        container_reqs = list(filter(lambda r: r.container_id == container.container_id, reqs_list))
-
         reqs_by_model = {}
         for model in models:
-            reqs_model = list(filter(lambda r: r.model == model.name, container_reqs))
-            reqs_metrics = Req.metrics(reqs_model, from_ts)
-            reqs_by_model[model.name] = reqs_metrics
+            # merge the metrics of the buckets of the container and the model
+            reqs_by_model[model.name] = reqs.metrics(from_ts, container.container_id, model.name)
 
         # compute the metrics
         metrics[container.container_id] = reqs_by_model
@@ -174,13 +197,41 @@ def get_configuration():
 
 @app.route('/configuration', methods=['POST'])
 def configure():
-    global status, config
+    global status, config, reqs, log
 
     logging.info("configuration started...")
 
     # read data
     data = request.get_json()
     config = RequestsStoreConfiguration(json_data=data)
+    if reqs.downsample_width == config.downsample_width:
+        # the stored requests are kept, only the retention changes
+        reqs.set_retention(config.retention_time, config.max_requests, config.aggregates_retention_time)
+    else:
+        # the aggregates cannot change width: the stored requests are moved to a new index without them
+        logging.warning("downsample_width changed from %s to %s: the aggregates of the evicted requests are dropped",
+                        reqs.downsample_width, config.downsample_width)
+        with reqs.lock:
+            stored = list(reqs.values())
+        reqs = RequestsIndex(retention_time=config.retention_time,
+                             max_requests=config.max_requests,
+                             downsample_width=config.downsample_width,
+                             aggregates_retention_time=config.aggregates_retention_time)
+        for req in stored:
+            reqs.store(req)
+
+    if log is not None and log.log_dir != config.log_dir:
+        log.close()
+        log = None
+    if log is not None:
+        # same log, its requests are already stored
+        log.fsync_interval = config.log_fsync_interval
+        log.retention_time = config.retention_time
+    elif config.log_dir:
+        # rebuild the requests from the log
+        log = RequestsLog(config.log_dir, config.log_fsync_interval, config.retention_time)
+        replayed = log.replay(reqs.store)
+        logging.info("replayed %d requests from %s in %.2f s", replayed, config.log_dir, log.replay_time)
 
     logging.info("Getting models from: %s", config.models_endpoint)
     logging.info("Getting containers from: %s", config.containers_endpoint)
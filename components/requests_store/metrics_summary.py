@@ -0,0 +1,200 @@
+import math
+
+from models.device import Device
+from models.req import ReqState
+
+
+class RunningStats:
+    """
+    Count, mean, variance, min and max of a series, updated one value at a time (Welford) and mergeable (Chan)
+    """
+    __slots__ = ("count", "mean", "m2", "min", "max")
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def merge(self, other):
+        if other.count == 0:
+            return
+        if self.count == 0:
+            self.count, self.mean, self.m2, self.min, self.max = other.count, other.mean, other.m2, other.min, other.max
+            return
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta * delta * self.count * other.count / count
+        self.count = count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def variance(self):
+        return self.m2 / (self.count - 1)
+
+
+class QuantileSketch:
+    """
+    Quantiles of a series of values with a relative accuracy (DDSketch).
+
+    A value v is counted in the bin ceil(log(v) / log(gamma)), gamma = (1 + accuracy) / (1 - accuracy), and a bin
+    is estimated with the value at relative distance accuracy from its bounds: the quantiles are within accuracy of
+    the exact ones. The sketches are merged adding the counts of the bins. At most MAX_BINS bins are kept: over that
+    the lowest bins are collapsed, so only the lowest quantiles lose accuracy.
+    Values not greater than MIN_VALUE are counted as zero.
+    """
+    ACCURACY = 0.01
+    GAMMA = (1 + ACCURACY) / (1 - ACCURACY)
+    LOG_GAMMA = math.log(GAMMA)
+    MAX_BINS = 1024
+    MIN_VALUE = 1e-9
+    __slots__ = ("count", "zeros", "bins")
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.zeros = 0
+        self.bins = {}
+
+    def add(self, value):
+        self.count += 1
+        if value <= self.MIN_VALUE:
+            self.zeros += 1
+            return
+        key = math.ceil(math.log(value) / self.LOG_GAMMA)
+        self.bins[key] = self.bins.get(key, 0) + 1
+        if len(self.bins) > self.MAX_BINS:
+            self.collapse()
+
+    def merge(self, other):
+        if other.count == 0:
+            return
+        self.count += other.count
+        self.zeros += other.zeros
+        if not self.bins:
+            self.bins = dict(other.bins)
+            return
+        bins = self.bins
+        get = bins.get
+        for key, count in other.bins.items():
+            bins[key] = get(key, 0) + count
+        if len(bins) > self.MAX_BINS:
+            self.collapse()
+
+    def collapse(self):
+        # the lowest bins are counted in the lowest kept bin
+        keys = sorted(self.bins)
+        lowest = keys[-self.MAX_BINS]
+        self.bins[lowest] += sum(self.bins.pop(key) for key in keys[:-self.MAX_BINS])
+
+    def quantiles(self, qs):
+        """
+        Return the estimates of the values at ranks q * (count - 1) of the sorted values, for q in qs (ascending),
+        None if there are no values
+        """
+        if self.count == 0:
+            return [None] * len(qs)
+        values = []
+        seen = self.zeros
+        keys = iter(sorted(self.bins))
+        key = None
+        for q in qs:
+            # the first bin that includes the rank, the ranks below zeros are zero
+            rank = q * (self.count - 1)
+            while seen <= rank:
+                key = next(keys)
+                seen += self.bins[key]
+            values.append(0.0 if key is None else 2 * self.GAMMA ** key / (self.GAMMA + 1))
+        return values
+
+
+class MetricsSummary:
+    """
+    Metrics of a set of requests, updated with every request and mergeable with the summaries of other sets:
+    the created requests are added with add_created, the completed ones with add_completed, the metrics are the
+    same of Req.metrics
+    """
+    # quantiles of the response time and of the process time
+    PERCENTILES = (("p50", 0.5), ("p90", 0.9), ("p99", 0.99), ("p999", 0.999))
+    __slots__ = ("created", "rejected", "completed", "on_gpu", "on_cpu", "resp_time", "process_time",
+                 "resp_time_sketch", "process_time_sketch")
+
+    def __init__(self) -> None:
+        self.created = 0
+        self.rejected = 0
+        self.completed = 0
+        self.on_gpu = 0
+        self.on_cpu = 0
+        self.resp_time = RunningStats()
+        self.process_time = RunningStats()
+        self.resp_time_sketch = QuantileSketch()
+        self.process_time_sketch = QuantileSketch()
+
+    def add_created(self, req):
+        self.created += 1
+        if req.state == ReqState.REJECTED:
+            self.rejected += 1
+
+    def add_completed(self, req):
+        self.completed += 1
+        if req.device == Device.GPU:
+            self.on_gpu += 1
+        elif req.device == Device.CPU:
+            self.on_cpu += 1
+        self.resp_time.add(req.resp_time)
+        self.process_time.add(req.process_time)
+        self.resp_time_sketch.add(req.resp_time)
+        self.process_time_sketch.add(req.process_time)
+
+    def merge(self, other):
+        self.created += other.created
+        self.rejected += other.rejected
+        self.completed += other.completed
+        self.on_gpu += other.on_gpu
+        self.on_cpu += other.on_cpu
+        self.resp_time.merge(other.resp_time)
+        self.process_time.merge(other.process_time)
+        self.resp_time_sketch.merge(other.resp_time_sketch)
+        self.process_time_sketch.merge(other.process_time_sketch)
+
+    def to_json(self):
+        mean_resp_time = mean_process_time = min_t = max_t = dev_t = None
+        if self.completed > 0:
+            mean_resp_time = self.resp_time.mean
+            mean_process_time = self.process_time.mean
+            min_t = self.resp_time.min
+            max_t = self.resp_time.max
+
+            if self.completed > 1:
+                dev_t = self.resp_time.variance()
+
+        metrics = {
+            "completed": self.completed,
+            "created": self.created,
+            "rejected": self.rejected,
+            "on_gpu": self.on_gpu,
+            "on_cpu": self.on_cpu,
+            "avg": mean_resp_time,
+            "avg_process": mean_process_time,
+            "dev": dev_t,
+            "min": min_t,
+            "max": max_t
+        }
+        qs = [q for _, q in self.PERCENTILES]
+        resp_times = self.resp_time_sketch.quantiles(qs)
+        process_times = self.process_time_sketch.quantiles(qs)
+        for (name, _), resp_time, process_time in zip(self.PERCENTILES, resp_times, process_times):
+            metrics[name] = resp_time
+            metrics[name + "_process"] = process_time
+        return metrics
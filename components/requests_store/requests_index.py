@@ -0,0 +1,306 @@
+import bisect
+import time
+from threading import Lock
+
+from metrics_summary import MetricsSummary
+
+
+class Buckets:
+    """
+    Requests partitioned in time buckets by the timestamp ts (an attribute of the requests), kept sorted by time.
+    Every bucket has the summary of its requests, updated with summarize when a request is added and computed
+    again when it is read after a request was removed.
+    The evicted buckets are downsampled: their requests are dropped and their summaries are merged in coarse buckets
+    """
+
+    def __init__(self, ts, summarize) -> None:
+        self.ts = ts
+        self.summarize = summarize
+        self.buckets = {}
+        self.summaries = {}
+        self.times = []
+        self.coarse = {}
+        self.coarse_times = []
+
+    def add(self, bucket, req):
+        reqs = self.buckets.get(bucket)
+        if reqs is None:
+            reqs = self.buckets[bucket] = {}
+            self.summaries[bucket] = MetricsSummary()
+            bisect.insort(self.times, bucket)
+        reqs[req.id] = req
+        summary = self.summaries.get(bucket)
+        if summary is not None:
+            self.summarize(summary, req)
+
+    def remove(self, bucket, req):
+        reqs = self.buckets[bucket]
+        del reqs[req.id]
+        if not reqs:
+            del self.buckets[bucket]
+            del self.times[bisect.bisect_left(self.times, bucket)]
+        self.summaries.pop(bucket, None)
+
+    def summary(self, bucket):
+        summary = self.summaries.get(bucket)
+        if summary is None:
+            summary = self.summaries[bucket] = MetricsSummary()
+            for req in self.buckets[bucket].values():
+                self.summarize(summary, req)
+        return summary
+
+    def evict_before(self, bucket, coarse_bucket):
+        """
+        Evict the buckets before bucket, merging their summaries in the coarse buckets coarse_bucket(bucket).
+        Return the evicted requests
+        """
+        evicted = []
+        end = bisect.bisect_left(self.times, bucket)
+        for start in self.times[:end]:
+            summary = self.summary(start)
+            evicted.extend(self.buckets.pop(start).values())
+            del self.summaries[start]
+            coarse = coarse_bucket(start)
+            coarse_summary = self.coarse.get(coarse)
+            if coarse_summary is None:
+                coarse_summary = self.coarse[coarse] = MetricsSummary()
+                bisect.insort(self.coarse_times, coarse)
+            coarse_summary.merge(summary)
+        del self.times[:end]
+        return evicted
+
+    def drop_coarse_before(self, coarse_bucket):
+        """
+        Drop the coarse buckets before coarse_bucket, return the number of dropped buckets
+        """
+        end = bisect.bisect_left(self.coarse_times, coarse_bucket)
+        for start in self.coarse_times[:end]:
+            del self.coarse[start]
+        del self.coarse_times[:end]
+        return end
+
+    def since(self, bucket):
+        """
+        Iterate the requests of the buckets from bucket (included)
+        """
+        for start in self.times[bisect.bisect_left(self.times, bucket):]:
+            yield from self.buckets[start].values()
+
+    def summarize_since(self, from_ts, bucket, coarse_bucket, summary):
+        """
+        Add to summary the requests after from_ts, in bucket: the summaries of the buckets after bucket are merged,
+        the requests of bucket are filtered.
+        If coarse_bucket is not None, the summaries of the coarse buckets from coarse_bucket are merged too
+        """
+        if coarse_bucket is not None:
+            for start in self.coarse_times[bisect.bisect_left(self.coarse_times, coarse_bucket):]:
+                summary.merge(self.coarse[start])
+        for start in self.times[bisect.bisect_left(self.times, bucket):]:
+            if start == bucket:
+                for req in self.buckets[start].values():
+                    if getattr(req, self.ts) > from_ts:
+                        self.summarize(summary, req)
+            else:
+                summary.merge(self.summary(start))
+
+
+class RequestsIndex:
+    """
+    Requests of the requests store, indexed by time.
+
+    Every request is indexed by (container_id, model, version) in the time bucket of its arrival (ts_in) and,
+    once completed, in the bucket of its completion (ts_out): the requests created or completed after a timestamp
+    are read from the buckets after that timestamp, without scanning the other requests.
+    The requests not yet sent to a container are indexed with container_id None.
+    The metrics after a timestamp merge the summaries of the buckets after that timestamp, only the requests of the
+    bucket of the timestamp are read.
+
+    The requests are kept for retention_time seconds and at most max_requests requests are kept: the requests
+    of the older buckets are evicted and the summaries of their buckets are merged in buckets of downsample_width
+    seconds, kept for aggregates_retention_time seconds. The metrics from a timestamp before the evicted requests
+    merge the whole coarse bucket of the timestamp. The events of evicted requests are dropped.
+    """
+    # seconds between the evictions
+    EVICTION_INTERVAL = 1
+
+    def __init__(self,
+                 bucket_width: float = 1,
+                 retention_time: float = 600,
+                 max_requests: int = 1000000,
+                 downsample_width: float = 60,
+                 aggregates_retention_time: float = 86400) -> None:
+        self.bucket_width = bucket_width
+        self.retention_time = retention_time
+        self.max_requests = max_requests
+        self.downsample_width = downsample_width
+        self.aggregates_retention_time = aggregates_retention_time
+        self.lock = Lock()
+        self.reqs = {}
+        # (container_id, model, version) -> buckets by ts_in and buckets by ts_out
+        self.created = {}
+        self.completed = {}
+        # the requests of the buckets before evicted_until are evicted
+        self.evicted_until = None
+        self.next_eviction = 0
+
+        # counters
+        self.evicted = 0
+        self.late = 0
+        self.dropped_aggregates = 0
+
+    def __len__(self):
+        return len(self.reqs)
+
+    def values(self):
+        return self.reqs.values()
+
+    def bucket(self, ts):
+        return int(ts // self.bucket_width)
+
+    def coarse_bucket(self, bucket):
+        return int(bucket * self.bucket_width // self.downsample_width)
+
+    def store(self, req):
+        """
+        Store the request, replacing its previous state.
+        The events of a request can arrive out of order: return False if the stored state is more advanced
+        """
+        with self.lock:
+            if self.evicted_until is not None and self.bucket(req.ts_in) < self.evicted_until:
+                # the request was evicted
+                self.late += 1
+                return False
+            current = self.reqs.get(req.id)
+            if current is not None:
+                if req.state < current.state:
+                    return False
+                self.unindex(current)
+            self.reqs[req.id] = req
+            self.index(req)
+            if len(self.reqs) > self.max_requests or time.time() >= self.next_eviction:
+                self.evict()
+            return True
+
+    def index(self, req):
+        key = (req.container_id, req.model, req.version)
+        created = self.created.get(key)
+        if created is None:
+            created = self.created[key] = Buckets("ts_in", MetricsSummary.add_created)
+        created.add(self.bucket(req.ts_in), req)
+        if req.ts_out is not None:
+            completed = self.completed.get(key)
+            if completed is None:
+                completed = self.completed[key] = Buckets("ts_out", MetricsSummary.add_completed)
+            completed.add(self.bucket(req.ts_out), req)
+
+    def unindex(self, req):
+        key = (req.container_id, req.model, req.version)
+        self.created[key].remove(self.bucket(req.ts_in), req)
+        if req.ts_out is not None:
+            self.completed[key].remove(self.bucket(req.ts_out), req)
+
+    def evict(self):
+        """
+        Evict the requests older than retention_time and the oldest ones over max_requests,
+        drop the summaries older than aggregates_retention_time
+        """
+        now = time.time()
+        self.next_eviction = now + self.EVICTION_INTERVAL
+        until = self.bucket(now - self.retention_time)
+        if len(self.reqs) > self.max_requests:
+            # the oldest buckets are evicted until at most max_requests requests are kept
+            sizes = {}
+            for created in self.created.values():
+                for start, reqs in created.buckets.items():
+                    sizes[start] = sizes.get(start, 0) + len(reqs)
+            excess = len(self.reqs) - self.max_requests
+            for start in sorted(sizes):
+                if excess <= 0:
+                    break
+                until = max(until, start + 1)
+                excess -= sizes[start]
+
+        if self.evicted_until is None or until > self.evicted_until:
+            self.evicted_until = until
+            for created in self.created.values():
+                for req in created.evict_before(until, self.coarse_bucket):
+                    del self.reqs[req.id]
+                    self.evicted += 1
+            for completed in self.completed.values():
+                completed.evict_before(until, self.coarse_bucket)
+
+        coarse_until = self.coarse_bucket(self.bucket(now - self.aggregates_retention_time))
+        for buckets in list(self.created.values()) + list(self.completed.values()):
+            self.dropped_aggregates += buckets.drop_coarse_before(coarse_until)
+
+    def set_retention(self, retention_time, max_requests, aggregates_retention_time):
+        """
+        Change the retention of the stored requests, the requests are evicted with it at the next store
+        """
+        with self.lock:
+            self.retention_time = retention_time
+            self.max_requests = max_requests
+            self.aggregates_retention_time = aggregates_retention_time
+            self.next_eviction = 0
+
+    def clear(self):
+        with self.lock:
+            self.reqs = {}
+            self.created = {}
+            self.completed = {}
+            self.evicted_until = None
+
+    @staticmethod
+    def selected(buckets, container_id, model, version):
+        return [bucket for key, bucket in buckets.items()
+                if (container_id is None or key[0] == container_id) and (model is None or key[1] == model)
+                and (version is None or key[2] == version)]
+
+    def window(self, from_ts=0, container_id=None, model=None, version=None):
+        """
+        Return the requests created or completed after from_ts, of the container, model and version if given:
+        Req.metrics on these requests is the same as on all the requests
+        """
+        from_ts = float(from_ts)
+        bucket = self.bucket(from_ts)
+        reqs = []
+        with self.lock:
+            for created in self.selected(self.created, container_id, model, version):
+                reqs.extend(req for req in created.since(bucket) if req.ts_in > from_ts)
+            for completed in self.selected(self.completed, container_id, model, version):
+                # the requests created before from_ts, the others are already taken
+                reqs.extend(req for req in completed.since(bucket) if req.ts_out > from_ts >= req.ts_in)
+        return reqs
+
+    def metrics(self, from_ts=0, container_id=None, model=None, version=None):
+        """
+        Return the metrics of the requests after from_ts, of the container, model and version if given,
+        the same of Req.metrics
+        """
+        from_ts = float(from_ts)
+        bucket = self.bucket(from_ts)
+        summary = MetricsSummary()
+        with self.lock:
+            # the coarse buckets of the evicted requests are merged if from_ts is before the evicted requests
+            evicted = self.evicted_until is not None and bucket < self.evicted_until
+            coarse_bucket = self.coarse_bucket(bucket) if evicted else None
+            for created in self.selected(self.created, container_id, model, version):
+                created.summarize_since(from_ts, bucket, coarse_bucket, summary)
+            for completed in self.selected(self.completed, container_id, model, version):
+                completed.summarize_since(from_ts, bucket, coarse_bucket, summary)
+        return summary.to_json()
+
+    def status(self):
+        with self.lock:
+            buckets = list(self.created.values()) + list(self.completed.values())
+            return {"requests": len(self.reqs),
+                    "buckets": sum(len(bucket.times) for bucket in buckets),
+                    "aggregates": sum(len(bucket.coarse_times) for bucket in buckets),
+                    "sketch_bins": sum(len(summary.resp_time_sketch.bins) + len(summary.process_time_sketch.bins)
+                                       for bucket in buckets
+                                       for summaries in (bucket.summaries, bucket.coarse)
+                                       for summary in summaries.values()),
+                    "evicted_until": None if self.evicted_until is None else self.evicted_until * self.bucket_width,
+                    "evicted": self.evicted,
+                    "late": self.late,
+                    "dropped_aggregates": self.dropped_aggregates}
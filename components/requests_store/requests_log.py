@@ -0,0 +1,256 @@
+import logging
+import math
+import mmap
+import operator
+import os
+import re
+import struct
+import time
+import zlib
+from array import array
+from threading import Event, Lock, Thread
+
+import orjson
+
+from models.req import Req
+
+
+class RequestsLog:
+    """
+    Append-only log of the stored requests, in segment files of about SEGMENT_SIZE bytes in log_dir.
+
+    The events of the requests are written in blocks of at most BLOCK_SIZE events, by column: the crc32, the size
+    and the number of events of the block, the times (NaN if None, in native byte order), the states, the codes of
+    the values of the other fields in the dictionaries of the block, then the ids and the dictionaries in json.
+    The block of the pending events is written and the segment is synced to the disk every fsync_interval
+    seconds, so only the events of the last interval are lost if the host fails.
+    The segments are replayed through mmap to rebuild the requests at the start: only the last event of a request
+    in a block is stored, a torn block at the end of a segment stops the replay of that segment. Every start
+    appends to a new segment, the segments older than retention_time are deleted.
+    The events that cannot be encoded are rejected by append, so that they never reach a block.
+    """
+    SEGMENT_SIZE = 64 * 2 ** 20
+    BLOCK_SIZE = 4096
+    # crc32, size and number of events of a block
+    HEADER = struct.Struct("<III")
+    # the fields of the columns: ids, coded fields, times and states
+    CODED = ("model", "version", "node", "container", "container_id", "device")
+    TIMES = ("ts_in", "ts_wait", "ts_out", "process_time", "resp_time")
+    FIELDS = ("id",) + CODED + TIMES + ("state",)
+    SEGMENT = re.compile(r"requests-(\d+)\.log$")
+
+    # the getters of the fields, a column is read without a tuple for every event
+    getters = tuple(map(operator.attrgetter, FIELDS))
+
+    def __init__(self, log_dir, fsync_interval: float = 1, retention_time: float = 600) -> None:
+        self.log_dir = log_dir
+        self.fsync_interval = fsync_interval
+        self.retention_time = retention_time
+        self.lock = Lock()
+        os.makedirs(log_dir, exist_ok=True)
+        # path -> time of the last append of the closed segments
+        self.segments = {path: os.path.getmtime(path) for path in self.list_segments()}
+        self.sequence = max((self.sequence_of(path) for path in self.segments), default=0)
+        self.path = None
+        self.file = None
+        # the requests of the events not yet written
+        self.pending = []
+
+        # counters
+        self.appended = 0
+        self.replayed = 0
+        self.torn = 0
+        self.rejected = 0
+        self.dropped = 0
+        self.replay_time = None
+
+        self.closed = Event()
+        self.syncer = Thread(target=self.sync_loop, daemon=True)
+        self.syncer.start()
+
+    def list_segments(self):
+        return sorted((os.path.join(self.log_dir, name) for name in os.listdir(self.log_dir)
+                       if self.SEGMENT.match(name)), key=self.sequence_of)
+
+    def sequence_of(self, path):
+        return int(self.SEGMENT.search(path).group(1))
+
+    @classmethod
+    def encode(cls, reqs):
+        """
+        Return the block of the events of the requests
+        """
+        columns = [list(map(getter, reqs)) for getter in cls.getters]
+        times = array('d', [math.nan if value is None else value
+                            for column in columns[1 + len(cls.CODED):-1] for value in column])
+        states = bytes(columns[-1])
+        codes = array('H')
+        dictionaries = []
+        for column in columns[1:1 + len(cls.CODED)]:
+            dictionary = list(dict.fromkeys(column))
+            codes.extend(map({value: code for code, value in enumerate(dictionary)}.__getitem__, column))
+            dictionaries.append(dictionary)
+        payload = times.tobytes() + states + codes.tobytes() + orjson.dumps([columns[0]] + dictionaries)
+        return cls.HEADER.pack(zlib.crc32(payload), len(payload), len(reqs)) + payload
+
+    def decode(self, buffer):
+        """
+        Iterate the blocks in buffer as the columns of FIELDS, stop at the first torn block
+        """
+        offset = 0
+        while offset + self.HEADER.size <= len(buffer):
+            crc, size, count = self.HEADER.unpack_from(buffer, offset)
+            start = offset + self.HEADER.size
+            offset = start + size
+            payload = buffer[start:offset]
+            if len(payload) < size or zlib.crc32(payload) != crc:
+                self.torn += 1
+                return
+            times = array('d')
+            end = len(self.TIMES) * count * times.itemsize
+            times.frombytes(payload[:end])
+            states = payload[end:end + count]
+            end += count
+            codes = array('H')
+            codes.frombytes(payload[end:end + len(self.CODED) * count * codes.itemsize])
+            end += len(self.CODED) * count * codes.itemsize
+            ids, *dictionaries = orjson.loads(payload[end:])
+            coded = [list(map(dictionary.__getitem__, codes[i * count:(i + 1) * count]))
+                     for i, dictionary in enumerate(dictionaries)]
+            times = times.tolist()
+            yield [ids, *coded, *[times[i * count:(i + 1) * count] for i in range(len(self.TIMES))], list(states)]
+
+    def replay(self, store):
+        """
+        Call store with the requests of the segments, in the order they were appended: the requests in the last
+        state of a block. Return the number of replayed requests
+        """
+        start = time.perf_counter()
+        replayed = 0
+        for path in list(self.segments):
+            with open(path, "rb") as segment:
+                if os.fstat(segment.fileno()).st_size == 0:
+                    continue
+                with mmap.mmap(segment.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+                    for columns in self.decode(buffer):
+                        # the last of the most advanced events of every request, as kept by store
+                        ids, states = columns[0], columns[-1]
+                        last = {}
+                        for position, req_id in enumerate(ids):
+                            current = last.get(req_id)
+                            if current is None or states[position] >= states[current]:
+                                last[req_id] = position
+                        for position in last.values():
+                            req_json = {name: column[position] for name, column in zip(self.FIELDS, columns)}
+                            for name in self.TIMES:
+                                if math.isnan(req_json[name]):
+                                    req_json[name] = None
+                            store(Req(json_data=req_json))
+                        replayed += len(last)
+        self.replayed += replayed
+        self.replay_time = time.perf_counter() - start
+        return replayed
+
+    def append(self, req):
+        """
+        Append the event of the request, the request is not changed until it is written.
+        Return False if the event cannot be encoded
+        """
+        try:
+            self.encode([req])
+        except (TypeError, ValueError, OverflowError) as e:
+            logging.warning("rejected the event of the request %s: %s", getattr(req, "id", None), e)
+            with self.lock:
+                self.rejected += 1
+            return False
+        with self.lock:
+            self.pending.append(req)
+            self.appended += 1
+            if len(self.pending) >= self.BLOCK_SIZE:
+                self.write()
+        return True
+
+    def write(self):
+        # the pending events are written in a block, a block that cannot be encoded is dropped
+        if not self.pending:
+            return
+        try:
+            block = self.encode(self.pending)
+        except Exception as e:
+            logging.warning("dropped a block of %d events: %s", len(self.pending), e)
+            self.dropped += len(self.pending)
+            self.pending = []
+            return
+        if self.file is None or self.file.tell() >= self.SEGMENT_SIZE:
+            self.rotate()
+        self.file.write(block)
+        self.pending = []
+
+    def rotate(self):
+        # the current segment is closed, a new one is opened
+        self.close_segment()
+        self.sequence += 1
+        self.path = os.path.join(self.log_dir, "requests-%020d.log" % self.sequence)
+        self.file = open(self.path, "ab")
+
+    def close_segment(self):
+        if self.file is not None:
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.file.close()
+            self.segments[self.path] = time.time()
+            self.file = None
+
+    def sync(self):
+        """
+        Write the pending events to the disk, delete the segments older than retention_time
+        """
+        with self.lock:
+            self.write()
+            if self.file is not None:
+                self.file.flush()
+                os.fsync(self.file.fileno())
+            expired = [path for path, last_append in self.segments.items()
+                       if last_append < time.time() - self.retention_time]
+            for path in expired:
+                os.remove(path)
+                del self.segments[path]
+
+    def sync_loop(self):
+        while not self.closed.wait(self.fsync_interval):
+            try:
+                self.sync()
+            except Exception as e:
+                # the syncer runs until the log is closed
+                logging.warning(e)
+
+    def clear(self):
+        # the requests of the log are deleted
+        with self.lock:
+            self.pending = []
+            self.close_segment()
+            for path in self.segments:
+                os.remove(path)
+            self.segments = {}
+
+    def close(self):
+        self.closed.set()
+        self.syncer.join()
+        with self.lock:
+            self.write()
+            self.close_segment()
+
+    def status(self):
+        with self.lock:
+            size = sum(os.path.getsize(path) for path in self.segments)
+            if self.file is not None:
+                size += self.file.tell()
+            return {"segments": len(self.segments) + (self.file is not None),
+                    "bytes": size,
+                    "pending": len(self.pending),
+                    "appended": self.appended,
+                    "replayed": self.replayed,
+                    "torn": self.torn,
+                    "rejected": self.rejected,
+                    "dropped": self.dropped,
+                    "replay_time": self.replay_time}
@@ -1,5 +1,6 @@
 from models.queues_policies import QueuesPolicies, QueuesPolicy
 from models.model import Model
+import argparse
 import logging
 import random
 import threading
@@ -15,6 +16,7 @@ STDEV = [0.6, 1]  # standard deviation, min max
 ARRIVAL_RATES = {"m1": 50, "m2": 100}  # arrival rate [req/s]
 SIM_DURATION = 5  # simulation duration [s]
 QUEUES_POLICY = QueuesPolicy.HEURISTIC_1
+DROP_LATE = False  # drop the requests that cannot meet the SLA with the profiled response time
 
 
 class Req:
@@ -45,6 +47,7 @@ def produce(model):
         logger.info("ADDING req to %s", model)
         req = Req(model)
         in_queues[model].put(req)
+        queues_policies.queued(req)
 
         time.sleep(producer_sleep)
 
@@ -66,6 +69,12 @@ def consume(gpu):
 
         if not in_queues[selected_model].empty():
             req = in_queues[selected_model].get()
+            queues_policies.dequeued(req)
+
+            model = models[selected_model]
+            if DROP_LATE and time.time() + model.profiled_rt > req.ts_in + model.sla:
+                dropped[selected_model].append(req)
+                continue
 
             response_time = random.uniform(AVG_RESPONSE_TIME[selected_model] * STDEV[0],
                                            AVG_RESPONSE_TIME[selected_model] * STDEV[1])
@@ -74,6 +83,7 @@ def consume(gpu):
             req.ts_out = time.time()
 
             out_queues[selected_model].append(req)
+            queues_policies.completed(req)
 
     logger.info("STOPPING consumer %d", gpu)
 
@@ -100,8 +110,29 @@ def measurement():
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--policy', type=int, default=QUEUES_POLICY)
+    parser.add_argument('--drop-late', action='store_true', default=DROP_LATE)
+    parser.add_argument('--load', type=float, default=1, help="multiplier of the arrival rates")
+    parser.add_argument('--duration', type=float, default=SIM_DURATION)
+    parser.add_argument('--sla', type=float, nargs=len(MODELS), default=[model.sla for model in MODELS],
+                        help="SLA of the models [s]")
+    parser.add_argument('--no-plots', action='store_true')
+    args = parser.parse_args()
+    QUEUES_POLICY = QueuesPolicy(args.policy)
+    DROP_LATE = args.drop_late
+    SIM_DURATION = args.duration
+    ARRIVAL_RATES = {model: rate * args.load for model, rate in ARRIVAL_RATES.items()}
+    for model, sla in zip(MODELS, args.sla):
+        model.sla = sla
+        if DROP_LATE:
+            # the late requests are found with the profiled response time, not used by the default run
+            model.profiled_rt = AVG_RESPONSE_TIME[model.name]
+    models = {model.name: model for model in MODELS}
+
     in_queues = {}
     out_queues = {}
+    dropped = {}
     gpus_threads = []
     producer_threads = []
     time_m = []
@@ -114,7 +145,7 @@ if __name__ == "__main__":
     # logger.setLevel(level=logging.DEBUG)
 
     # init policy
-    queues_policies = QueuesPolicies(in_queues, out_queues, MODELS)
+    queues_policies = QueuesPolicies(in_queues, MODELS)
     policy = queues_policies.policies.get(QUEUES_POLICY)
     logger.info("Policy: %s", QUEUES_POLICY)
 
@@ -122,6 +153,7 @@ if __name__ == "__main__":
         in_queues[model.name] = queue.Queue()
         queues_lenghts_m[model.name] = []
         out_queues[model.name] = []
+        dropped[model.name] = []
 
     producers_running = True
     simulation_running = True
@@ -151,13 +183,21 @@ if __name__ == "__main__":
     logger.info("Load < Max throughput: %.2f < %d",
                 sum([AVG_RESPONSE_TIME[model.name] * STDEV[1] * ARRIVAL_RATES[model.name] for model in MODELS]),
                 sum(GPUS))
+    sla_met = sum(1 for model in MODELS for req in out_queues[model.name] if req.ts_out - req.ts_in <= model.sla)
+    logger.info("Policy: %s, drop late: %r, SLA met throughput: %.1f req / s, dropped: %d",
+                QUEUES_POLICY.name, DROP_LATE, sla_met / SIM_DURATION, sum(len(reqs) for reqs in dropped.values()))
 
     # Response Time
     for model in MODELS:
         response_times = [req.ts_out - req.ts_in for req in out_queues[model.name]]
+        if not response_times:
+            logger.info("MODEL: %s\nCONSUMED: 0\nDROPPED: %d", model.name, len(dropped[model.name]))
+            continue
         avg_responses_time = statistics.mean(response_times)
         logger.info("MODEL: %s"
                     "\nCONSUMED: %d "
+                    "\nDROPPED: %d "
+                    "\nSLA MET: %d "
                     "\nAVG RT: %f"
                     "\nMAX RT: %f"
                     "\nMIN RT: %f"
@@ -165,6 +205,8 @@ if __name__ == "__main__":
                     "\nSLA respected: %r",
                     model.name,
                     len(out_queues[model.name]),
+                    len(dropped[model.name]),
+                    sum(1 for rt in response_times if rt <= model.sla),
                     avg_responses_time,
                     max(response_times),
                     min(response_times),
@@ -174,6 +216,8 @@ if __name__ == "__main__":
         plt.plot(range(len(response_times)), response_times, label="RT " + model.name)
         plt.plot(range(len(response_times)), [avg_responses_time] * len(response_times), '--', label="AVG RT " + model.name)
         plt.plot(range(len(response_times)), [model.sla] * len(response_times), label="SLA " + model.name)
+    if args.no_plots:
+        exit(0)
     plt.xlabel("Req")
     plt.ylabel("Time [s]")
     plt.legend()
@@ -1,6 +1,8 @@
+import heapq
+import math
 import random
-import statistics
 import time
+from collections import deque
 from enum import IntEnum
 from threading import Lock
 
@@ -11,90 +13,244 @@ class QueuesPolicy(IntEnum):
     ROUND_ROBIN = 1
     LONGEST_QUEUE = 2
     HEURISTIC_1 = 3
+    EARLIEST_DEADLINE = 4
+    WEIGHTED_FAIR = 5
 
 
 class QueuesPolicies:
+    """
+    Policies that select the application queue served by a consumer.
+
+    The policies do not scan the queues: who puts and gets the requests calls queued and dequeued, that keep
+    an index of the queue lengths (models bucketed by length) and of the non empty queues,
+    so that a pick costs O(1) with any number of models.
+    The completed requests are passed to completed: the last MAX_SAMPLE_SIZE response times of every model are
+    kept for the heuristic.
+    The sums of the timestamps and response times are integers (nanoseconds), so they are exact with any number
+    of updates.
+    The deadline of a request is its arrival plus the SLA of its model: the requests of a queue are in deadline
+    order, so the deadlines of the first requests of the queues are kept in a priority queue of the models.
+    The cost of a request is the process time of its model: the moving average of the completed requests or,
+    before the first one, the profiled response time. A model without them costs the mean of the known costs, so
+    that it is on the scale of the others (DEFAULT_COST if no cost is known).
+    """
     MAX_SAMPLE_SIZE = 50
+    PROCESS_TIME_ALPHA = 0.2
+    DEFAULT_COST = 1
 
     def __init__(self,
                  reqs_queues,
-                 responses_list=None,
                  models=None,
                  logger=None) -> None:
         self.policies = {QueuesPolicy.RANDOM: self.policy_random,
                          QueuesPolicy.ROUND_ROBIN: self.policy_round_robin,
                          QueuesPolicy.LONGEST_QUEUE: self.policy_longest_queue,
-                         QueuesPolicy.HEURISTIC_1: self.policy_heuristic_1}
+                         QueuesPolicy.HEURISTIC_1: self.policy_heuristic_1,
+                         QueuesPolicy.EARLIEST_DEADLINE: self.policy_earliest_deadline,
+                         QueuesPolicy.WEIGHTED_FAIR: self.policy_weighted_fair}
         self.reqs_queues = reqs_queues
-        self.responses_list = responses_list
         self.models = {model.name: model for model in models}
         self.logger = logger
         self.lock = Lock()
         self.queue_index = 0
 
-    def policy_round_robin(self) -> str:
+        # index of the queues
+        self.models_names = list(self.models)
+        self.models_order = {model: i for i, model in enumerate(self.models_names)}
+        self.queue_lengths = {model: 0 for model in self.models_names}
+        # models by queue length, the models of a length are in the order they reached it
+        self.length_buckets = {0: dict.fromkeys(self.models_names)}
+        self.max_length = 0
+        # non empty queues, with the position of every queue for the removal
+        self.non_empty = []
+        self.non_empty_positions = {}
+
+        # running sums for the heuristic: arrival timestamps of the queued requests and last response times
+        self.ts_in_sums = {model: 0 for model in self.models_names}
+        self.response_times = {model: deque(maxlen=self.MAX_SAMPLE_SIZE) for model in self.models_names}
+        self.response_times_sums = {model: 0 for model in self.models_names}
+
+        # deadline of the first request of every non empty queue and priority queue of the models by that deadline,
+        # the entries of the heap with an old deadline are skipped
+        self.head_deadlines = {}
+        self.deadlines_heap = []
+
+        # deficit round robin: the queue that has the turn, its position in the non empty queues and the deficits
+        for model in self.models.values():
+            if model.weight <= 0:
+                raise ValueError("The weight of the model " + model.name + " must be positive")
+        self.process_times = {}
+        # the positive known costs of the models and their sum in nanoseconds
+        self.known_costs = {}
+        self.known_costs_sum = 0
+        # the quantum is the max cost of a request, it follows the known costs
+        self.drr_quantum = self.DEFAULT_COST
+        for model in self.models.values():
+            self._set_cost(model.name, model.profiled_rt)
+        self.drr_model = None
+        self.drr_index = 0
+        self.deficits = {model: 0 for model in self.models_names}
+
+    def queued(self, req):
+        """
+        Update the index after a request is put in its queue
+        """
         with self.lock:
-            self.queue_index = (self.queue_index + 1) % len(self.models)
+            self._update_index(req.model, 1)
+            self.ts_in_sums[req.model] += self.nanoseconds(req.ts_in)
+            if self.queue_lengths[req.model] == 1:
+                self._set_head_deadline(req.model, self.deadline(req))
 
-        selected_model = list(self.reqs_queues.keys())[self.queue_index]
-        return selected_model
+    def dequeued(self, req):
+        """
+        Update the index after a request is taken from its queue
+        """
+        with self.lock:
+            self._update_index(req.model, -1)
+            self.ts_in_sums[req.model] -= self.nanoseconds(req.ts_in)
+            reqs_queue = self.reqs_queues[req.model].queue
+            self._set_head_deadline(req.model, self.deadline(reqs_queue[0]) if reqs_queue else None)
 
-    def policy_random(self) -> str:
-        return random.choice(list(self.reqs_queues.keys()))
+    def completed(self, req):
+        """
+        Record the response time of a completed request
+        """
+        if req.model not in self.response_times:
+            return
+        response_time = self.nanoseconds(req.ts_out - req.ts_in)
+        with self.lock:
+            response_times = self.response_times[req.model]
+            if len(response_times) == response_times.maxlen:
+                self.response_times_sums[req.model] -= response_times[0]
+            response_times.append(response_time)
+            self.response_times_sums[req.model] += response_time
 
-    def policy_longest_queue(self) -> str:
-        max_length = -1
-        selected_model = list(self.reqs_queues.keys())[0]
+            process_time = getattr(req, "process_time", None)
+            if process_time is not None:
+                last = self.process_times.get(req.model)
+                self.process_times[req.model] = process_time if last is None else \
+                    self.PROCESS_TIME_ALPHA * process_time + (1 - self.PROCESS_TIME_ALPHA) * last
+                self._set_cost(req.model, self.process_times[req.model])
+
+    @staticmethod
+    def nanoseconds(seconds):
+        return round(seconds * 1e9)
 
-        # compute the max
-        for model in self.reqs_queues:
-            if self.reqs_queues[model].qsize() > max_length:
-                max_length = self.reqs_queues[model].qsize()
-                selected_model = model
+    def cost(self, model):
+        cost = self.known_costs.get(model)
+        if cost is not None:
+            return cost
+        if self.known_costs:
+            return self.known_costs_sum / len(self.known_costs) / 1e9
+        return self.DEFAULT_COST
 
-        return selected_model
+    def _set_cost(self, model, cost):
+        # only the positive costs are known, the quantum is the max known cost
+        was_empty = not self.known_costs
+        last = self.known_costs.pop(model, None)
+        if last is not None:
+            self.known_costs_sum -= self.nanoseconds(last)
+        if cost is not None and cost > 0:
+            self.known_costs[model] = cost
+            self.known_costs_sum += self.nanoseconds(cost)
+        if was_empty or (last is not None and last >= self.drr_quantum):
+            # the max cost can be lower
+            self.drr_quantum = max(self.known_costs.values(), default=self.DEFAULT_COST)
+        elif model in self.known_costs:
+            self.drr_quantum = max(self.drr_quantum, cost)
 
+    def charge(self, policy, model, n):
         """
-        # return a random queue between the ones with the same size
-        queues_same_length = []
-        for model in reqs_queues:
-            print(reqs_queues[model].qsize())
-            if reqs_queues[model].qsize() == max_length:
-                queues_same_length.append(model)
-            print(reqs_queues[model].qsize())
-
-        return random.choice(queues_same_length)
+        Charge the n requests of the model taken in a batch with the one selected by the policy: the deficit round
+        robin charges every request of a batch
         """
+        if policy != self.policy_weighted_fair:
+            return
+        with self.lock:
+            self.deficits[model] -= n * self.cost(model)
 
-    def policy_heuristic_1(self) -> str:
-        queue_lengths = {}
-        avg_response_times = {}
-        needs = {}
-        total_queues_length = 0
-
-        for model in self.reqs_queues:
-            queue_lengths[model] = (self.reqs_queues[model].qsize())
-            total_queues_length += queue_lengths[model]
-
-            if queue_lengths[model] == 0:
-                avg_response_times[model] = 0
-                needs[model] = 0
-            else:
-                if self.models[model].profiled_rt is not None:
-                    response_times = [time.time() - req.ts_in + self.models[model].profiled_rt
-                                      for req in list(self.reqs_queues[model].queue)]
-                else:
-                    response_times = [time.time() - req.ts_in for req in list(self.reqs_queues[model].queue)]
+    def deadline(self, req):
+        sla = self.models[req.model].sla
+        return req.ts_in + sla if sla is not None else math.inf
 
-                log_response_time = [req.ts_out - req.ts_in
-                                     for req in self.responses_list[model][-self.MAX_SAMPLE_SIZE:]]
+    def _set_head_deadline(self, model, deadline):
+        if deadline is None:
+            self.head_deadlines.pop(model, None)
+            return
+        self.head_deadlines[model] = deadline
+        heapq.heappush(self.deadlines_heap, (deadline, self.models_order[model], model))
+        if len(self.deadlines_heap) > 2 * len(self.models_names) + 64:
+            # drop the old entries left by the other policies
+            self.deadlines_heap = [(deadline, self.models_order[model], model)
+                                   for model, deadline in self.head_deadlines.items()]
+            heapq.heapify(self.deadlines_heap)
 
-                if not log_response_time:
-                    avg_response_time = statistics.mean(response_times)
-                else:
-                    avg_response_time = statistics.mean(response_times) * 0.5 + statistics.mean(log_response_time) * 0.5
+    def _update_index(self, model, delta):
+        length = self.queue_lengths[model]
+        new_length = length + delta
+        self.queue_lengths[model] = new_length
+
+        # move the model to the bucket of the new length, the max length changes at most by one
+        bucket = self.length_buckets[length]
+        del bucket[model]
+        if not bucket:
+            del self.length_buckets[length]
+        self.length_buckets.setdefault(new_length, {})[model] = None
+        if new_length > self.max_length or (length == self.max_length and length not in self.length_buckets):
+            self.max_length = new_length
+
+        if length == 0:
+            self.non_empty_positions[model] = len(self.non_empty)
+            self.non_empty.append(model)
+        elif new_length == 0:
+            # an empty queue does not keep its credit
+            self.deficits[model] = min(0, self.deficits[model])
+            # move the last queue to the position of the removed one
+            position = self.non_empty_positions.pop(model)
+            last = self.non_empty.pop()
+            if last != model:
+                self.non_empty[position] = last
+                self.non_empty_positions[last] = position
 
-                avg_response_times[model] = avg_response_time
+    def policy_round_robin(self) -> str:
+        # the empty queues are skipped
+        with self.lock:
+            queues = self.non_empty if self.non_empty else self.models_names
+            self.queue_index = (self.queue_index + 1) % len(queues)
+            return queues[self.queue_index]
+
+    def policy_random(self) -> str:
+        # random non empty queue
+        with self.lock:
+            return random.choice(self.non_empty if self.non_empty else self.models_names)
+
+    def policy_longest_queue(self) -> str:
+        # the ties are broken with the queue that reached the length first
+        with self.lock:
+            return next(iter(self.length_buckets[self.max_length]))
+
+    def policy_heuristic_1(self) -> str:
+        """
+        Select the queue of the model that most needs to be served to meet its SLA.
+        The response time of a model is the mean of the waiting time of its queued requests (plus the profiled
+        response time) and of the last MAX_SAMPLE_SIZE completed requests, computed from the running sums.
+        """
+        with self.lock:
+            # if every model has empty queue -> choose randomly
+            if not self.non_empty:
+                return random.choice(self.models_names)
+
+            now = time.time()
+            needs = {}
+            for model in self.non_empty:
+                queue_length = self.queue_lengths[model]
+                avg_response_time = now - self.ts_in_sums[model] / queue_length / 1e9
+                if self.models[model].profiled_rt is not None:
+                    avg_response_time += self.models[model].profiled_rt
+
+                if self.response_times[model]:
+                    avg_response_time = avg_response_time * 0.5 + \
+                                        self.response_times_sums[model] / len(self.response_times[model]) / 1e9 * 0.5
 
                 sla = self.models[model].sla
                 alpha = self.models[model].alpha
@@ -103,15 +259,42 @@ class QueuesPolicies:
                 else:
                     needs[model] = avg_response_time - sla + (alpha * sla)
 
-        # if every model has empty queue -> choose randomly
-        if total_queues_length == 0:
-            selected = random.choice(list(self.reqs_queues.keys()))
-        else:
-            # if every model has need == 0 -> choose longest queue
+            # the ties are broken with the order of the models
             if max(needs.values()) == 0:
-                # select the longest queue
-                selected = max(queue_lengths, key=queue_lengths.get)
-            else:
-                # select the model with the higher need
-                selected = max(needs, key=needs.get)
-        return selected
+                # if every model has need == 0 -> choose longest queue
+                return max(self.non_empty, key=lambda m: (self.queue_lengths[m], -self.models_order[m]))
+            # select the model with the higher need
+            return max(self.non_empty, key=lambda m: (needs[m], -self.models_order[m]))
+
+    def policy_earliest_deadline(self) -> str:
+        # the queue of the request with the earliest deadline, the ties are broken with the order of the models
+        with self.lock:
+            while self.deadlines_heap:
+                deadline, _, model = self.deadlines_heap[0]
+                if self.head_deadlines.get(model) == deadline:
+                    return model
+                heapq.heappop(self.deadlines_heap)
+            return random.choice(self.models_names)
+
+    def policy_weighted_fair(self) -> str:
+        """
+        Deficit round robin between the non empty queues.
+        At its turn a queue gets a quantum proportional to the weight of its model and it is served while its deficit
+        is positive, every request is charged the cost of its model: the models share the consumers time by weight,
+        whatever the number and the cost of their requests.
+        With the quantum at the max cost, a queue with weight 1 is served at least once every turn.
+        """
+        with self.lock:
+            if not self.non_empty:
+                return random.choice(self.models_names)
+
+            model = self.drr_model
+            while model not in self.non_empty_positions or self.deficits[model] <= 0:
+                # the turn passes to the next non empty queue
+                self.drr_index = (self.drr_index + 1) % len(self.non_empty)
+                model = self.non_empty[self.drr_index]
+                self.deficits[model] += self.models[model].weight * self.drr_quantum
+            self.drr_model = model
+
+            self.deficits[model] -= self.cost(model)
+            return model
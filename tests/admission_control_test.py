@@ -0,0 +1,50 @@
+import queue
+
+from admission_control import AdmissionControl, Rejection
+from models.container import Container
+from models.device import Device
+from models.model import Model
+
+MODELS = [Model("m1", 1, sla=1, profiled_rt=0.1), Model("m2", 1, sla=1)]
+
+
+def filled_queue(size, maxsize=0):
+    reqs_queue = queue.Queue(maxsize=maxsize)
+    for i in range(size):
+        reqs_queue.put(i)
+    return reqs_queue
+
+
+def test_full_queue_rejected():
+    admission_control = AdmissionControl(MODELS, [])
+    assert admission_control.check("m1", filled_queue(2, maxsize=3)) is None
+    assert admission_control.check("m1", filled_queue(3, maxsize=3)) == Rejection.QUEUE_FULL
+    assert Rejection.QUEUE_FULL.status_code == 503
+    assert admission_control.metrics()["m1"] == {"queue_full": 1, "sla": 0}
+
+
+def test_predicted_response_time_over_the_sla_rejected():
+    admission_control = AdmissionControl(MODELS, [], sla_factor=1)
+    # (9 queued / 1 container + 1) * 0.1 s = 1 s
+    assert admission_control.check("m1", filled_queue(9)) is None
+    assert admission_control.check("m1", filled_queue(10)) == Rejection.SLA
+    assert Rejection.SLA.status_code == 429
+    # a model without profiled response time is not predicted
+    assert admission_control.check("m2", filled_queue(1000)) is None
+    assert admission_control.metrics() == {"m1": {"queue_full": 0, "sla": 1}, "m2": {"queue_full": 0, "sla": 0}}
+
+
+def test_queued_requests_shared_by_the_containers():
+    containers = [Container("m1", 1, True, "cpu-0", device=Device.CPU),
+                  Container("m2", 1, True, "cpu-1", device=Device.CPU),
+                  Container("all", 1, True, "gpu-0", device=Device.GPU),
+                  Container("m1", 1, False, "cpu-2", device=Device.CPU)]
+    admission_control = AdmissionControl(MODELS, containers, sla_factor=1)
+    assert admission_control.servers == {"m1": 2, "m2": 2}
+    assert admission_control.predicted_rt("m1", 10) == (10 / 2 + 1) * 0.1
+    assert admission_control.check("m1", filled_queue(18)) is None
+
+    # the active containers are read again when they change
+    admission_control.update_containers(containers[:1])
+    assert admission_control.servers == {"m1": 1, "m2": 1}
+    assert admission_control.check("m1", filled_queue(18)) == Rejection.SLA
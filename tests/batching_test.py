@@ -0,0 +1,81 @@
+import asyncio
+import queue
+import time
+
+import orjson
+import pytest
+
+from dispatcher import Dispatcher, Response
+from models.req import Req, ReqState
+from queues_scheduler import AsyncQueuesScheduler, QueuesScheduler
+
+
+def waiting_batch(*sizes):
+    reqs = [Req("m1", 1, list(range(size))) for size in sizes]
+    for req in reqs:
+        req.set_waiting()
+    return reqs
+
+
+def test_predictions_split_between_requests():
+    reqs = waiting_batch(1, 2, 1)
+    Dispatcher.set_completed(reqs, Response(200, orjson.dumps({"predictions": [[0], [1], [2], [3]]})))
+    assert [req.state for req in reqs] == [ReqState.COMPLETED] * 3
+    assert [orjson.loads(req.response.content) for req in reqs] == \
+        [{"predictions": [[0]]}, {"predictions": [[1], [2]]}, {"predictions": [[3]]}]
+
+
+@pytest.mark.parametrize("content", [orjson.dumps({"predictions": [[0], [1]]}),
+                                     orjson.dumps([[0], [1], [2]]),
+                                     orjson.dumps({"outputs": [[0], [1], [2]]}),
+                                     b"not json"])
+def test_predictions_not_split_fail_the_batch(content):
+    reqs = waiting_batch(1, 2)
+    Dispatcher.set_completed(reqs, Response(200, content))
+    for req in reqs:
+        assert req.state == ReqState.ERROR
+        assert req.response.startswith("502\n")
+
+
+def test_error_response_forwarded_to_the_batch():
+    reqs = waiting_batch(1, 2)
+    Dispatcher.set_completed(reqs, Response(400, b'{"error": "bad input"}'))
+    for req in reqs:
+        assert req.state == ReqState.COMPLETED
+        assert req.response == Response(400, b'{"error": "bad input"}')
+
+
+def scheduler_with(scheduler_class, versions):
+    reqs_queues = {"m1": queue.Queue(), "m2": queue.Queue()}
+    scheduler = scheduler_class(reqs_queues)
+    return scheduler, [Req("m1", version, [0]) for version in versions]
+
+
+def test_batch_of_the_same_model_and_version():
+    scheduler, reqs = scheduler_with(QueuesScheduler, [1, 1, 1, 2, 2])
+    for req in reqs:
+        scheduler.put("m1", req)
+    assert scheduler.get_batch(lambda: "m1", max_batch_size=2) == reqs[:2]
+    # the batch stops at the next version
+    assert scheduler.get_batch(lambda: "m1", max_batch_size=4) == reqs[2:3]
+    assert scheduler.get_batch(lambda: "m1", max_batch_size=4) == reqs[3:]
+    assert scheduler.pending == 0
+
+
+def test_async_batch_wait():
+    async def run():
+        scheduler, reqs = scheduler_with(AsyncQueuesScheduler, [1, 1, 1])
+        await scheduler.put("m1", reqs[0])
+        # a request that arrives within max_batch_wait joins the batch
+        asyncio.get_event_loop().call_later(0.02, lambda: asyncio.ensure_future(scheduler.put("m1", reqs[1])))
+        start = time.time()
+        batch = await scheduler.get_batch(lambda: "m1", max_batch_size=3, max_batch_wait=0.1)
+        assert batch == reqs[:2]
+        assert time.time() - start >= 0.09
+        # the lock is released at the end of the wait
+        assert not scheduler.condition.locked()
+        await scheduler.put("m1", reqs[2])
+        assert await scheduler.get_batch(lambda: "m1", max_batch_size=2, max_batch_wait=0.01) == reqs[2:]
+        assert scheduler.batch_waiters == 0
+
+    asyncio.run(run())
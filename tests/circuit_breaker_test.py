@@ -0,0 +1,86 @@
+import pytest
+
+import circuit_breaker
+from circuit_breaker import BreakerState, CircuitBreaker
+
+
+class Clock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(circuit_breaker.time, "time", clock)
+    return clock
+
+
+def test_opens_after_threshold_consecutive_failures(clock):
+    breaker = CircuitBreaker(threshold=3, open_time=5)
+    assert not breaker.record(True)
+    assert not breaker.record(True)
+    # a success resets the consecutive failures
+    assert not breaker.record(False)
+    assert not breaker.record(True)
+    assert not breaker.record(True)
+    assert breaker.state == BreakerState.CLOSED
+    assert breaker.record(True)
+    assert breaker.state == BreakerState.OPEN
+    assert breaker.ejections == 1
+    # more failures of the requests in flight do not eject it again
+    assert not breaker.record(True)
+    assert breaker.ejections == 1
+
+
+def test_probe_after_open_time(clock):
+    breaker = CircuitBreaker(threshold=1, open_time=5)
+    assert not breaker.try_probe()
+    breaker.record(True)
+    assert not breaker.try_probe()
+    clock.now += 5
+    assert breaker.try_probe()
+    assert breaker.state == BreakerState.HALF_OPEN
+    # a single probe at a time
+    assert not breaker.try_probe()
+
+
+def test_probe_success_readmits(clock):
+    breaker = CircuitBreaker(threshold=1, open_time=5)
+    breaker.record(True)
+    clock.now += 5
+    breaker.try_probe()
+    assert breaker.record(False)
+    assert breaker.state == BreakerState.CLOSED
+    assert breaker.to_json() == {"breaker": "closed", "ejections": 1}
+    # the open time is back to open_time
+    breaker.record(True)
+    clock.now += 5
+    assert breaker.try_probe()
+
+
+def test_probe_failure_doubles_open_time(clock):
+    breaker = CircuitBreaker(threshold=1, open_time=5, max_open_time=12)
+    breaker.record(True)
+    for open_time in (10, 12, 12):
+        clock.now += breaker.current_open_time
+        assert breaker.try_probe()
+        assert breaker.record(True)
+        assert breaker.state == BreakerState.OPEN
+        assert breaker.current_open_time == open_time
+        clock.now += open_time - 1
+        assert not breaker.try_probe()
+        clock.now -= open_time - 1
+
+
+def test_lost_probe_replaced(clock):
+    breaker = CircuitBreaker(threshold=1, open_time=5)
+    breaker.record(True)
+    clock.now += 5
+    assert breaker.try_probe()
+    # the probe did not complete within the open time
+    clock.now += 5
+    assert breaker.try_probe()
@@ -0,0 +1,8 @@
+import os
+import sys
+
+# the modules of the components import their packages (models, ...) from the folder of the component,
+# the models are the same copies of components/common in every component
+COMPONENTS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "components")
+for component in ("requests_store", "dispatcher"):
+    sys.path.insert(0, os.path.join(COMPONENTS, component))
@@ -0,0 +1,89 @@
+import importlib.util
+import os
+
+import pytest
+
+from containers_watcher import ContainersWatcher
+from models.container import Container
+from models.device import Device
+
+MAIN = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "components", "containers_manager", "main.py")
+
+
+def start_containers_manager():
+    # a new start of the containers manager, with its containers
+    spec = importlib.util.spec_from_file_location("containers_manager_main", MAIN)
+    containers_manager = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(containers_manager)
+    container = Container("m1", 1, True, "cpu-0", "127.0.0.1", 8501, Device.CPU, 1)
+    container.container_id = "8d2b7f0c4e1a"
+    containers_manager.containers = [container]
+    containers_manager.containers_changed()
+    return containers_manager
+
+
+@pytest.fixture
+def containers_manager():
+    return start_containers_manager()
+
+
+def test_not_modified_while_the_containers_do_not_change(containers_manager):
+    client = containers_manager.app.test_client()
+    response = client.get("/containers")
+    assert response.status_code == 200
+    etag = response.headers["ETag"]
+    assert response.get_json()[0]["container_id"] == "8d2b7f0c4e1a"
+
+    response = client.get("/containers", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.data == b""
+
+    client.patch("/containers", json={"container_id": "8d2b7f0c4e1a", "cpu_quota": 2})
+    response = client.get("/containers", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+    assert response.get_json()[0]["quota"] == 2
+
+
+def test_version_unique_to_every_start(containers_manager):
+    etag = containers_manager.app.test_client().get("/containers").headers["ETag"]
+    restarted = start_containers_manager()
+    assert restarted.containers_version == containers_manager.containers_version
+    response = restarted.app.test_client().get("/containers", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+
+
+class Response:
+    # the response of the containers manager, as read by the watcher
+    def __init__(self, response) -> None:
+        self.status_code = response.status_code
+        self.headers = response.headers
+        self.json = response.get_json
+
+    def raise_for_status(self):
+        assert self.status_code == 200
+
+
+class Session:
+    # the containers manager answering the watcher
+    def __init__(self, containers_manager) -> None:
+        self.client = containers_manager.app.test_client()
+
+    def get(self, endpoint, headers, timeout):
+        return Response(self.client.get(endpoint, headers=headers))
+
+
+def test_watcher_updates_only_the_changed_containers(containers_manager):
+    updates = []
+    session = Session(containers_manager)
+    watcher = ContainersWatcher("/containers", 1, updates.append, session=session)
+    assert watcher.poll()
+    assert not watcher.poll()
+    assert not watcher.poll()
+    assert len(updates) == 1 and updates[0][0].quota == 1
+
+    containers_manager.containers[0].quota = 2
+    containers_manager.containers_changed()
+    assert watcher.poll()
+    assert updates[-1][0].quota == 2
+    assert watcher.metrics() == {"version": watcher.etag, "polls": 4, "updates": 2, "errors": 0}
@@ -0,0 +1,76 @@
+import logging
+import time
+
+import pytest
+
+import dispatcher as dispatcher_module
+from dispatcher import Dispatcher, Response
+from models.container import Container
+from models.device import Device
+from models.model import Model
+from models.req import Req, ReqState
+
+
+def containers(n):
+    result = []
+    for i in range(n):
+        container = Container("m1", 1, True, "cpu-" + str(i), "127.0.0.1", 8501 + i, Device.CPU, 1)
+        container.container_id = "cpu-" + str(i)
+        result.append(container)
+    return result
+
+
+def early_wakeup(monkeypatch):
+    # the first wait returns before any call completed, as after a jump of the wall clock
+    wait = dispatcher_module.wait
+    wakeups = []
+
+    def first_wait_early(fs, timeout=None, return_when=None):
+        if not wakeups:
+            wakeups.append(timeout)
+            return set(), set(fs)
+        return wait(fs, timeout=timeout, return_when=return_when)
+
+    monkeypatch.setattr(dispatcher_module, "wait", first_wait_early)
+    return wakeups
+
+
+@pytest.mark.parametrize("deadline_sla_factor", [0, 10])
+def test_early_wakeup_waits_again(monkeypatch, deadline_sla_factor):
+    wakeups = early_wakeup(monkeypatch)
+    dispatcher = Dispatcher(logging, [Model("m1", 1, sla=1)], containers(2), device=Device.CPU, max_consumers=1,
+                            deadline_sla_factor=deadline_sla_factor, request_timeout=1, max_retries=1)
+
+    def post(container, reqs, payload, budget=None):
+        time.sleep(0.05)
+        return Response(200, b'{"predictions": [[1]]}')
+
+    dispatcher.post = post
+    req = Req("m1", 1, [[0]])
+    dispatcher.compute(req)
+    assert wakeups
+    assert req.state == ReqState.COMPLETED
+    assert dispatcher.counters["deadline_exceeded"] == 0
+
+
+def test_deadline_exceeded(monkeypatch):
+    dispatcher = Dispatcher(logging, [Model("m1", 1, sla=0.01)], containers(2), device=Device.CPU, max_consumers=1,
+                            deadline_sla_factor=5, max_retries=1)
+
+    def post(container, reqs, payload, budget=None):
+        time.sleep(0.2)
+        return Response(200, b'{"predictions": [[1]]}')
+
+    dispatcher.post = post
+    req = Req("m1", 1, [[0]])
+    dispatcher.compute(req)
+    assert req.state == ReqState.ERROR and req.response.startswith("504\n")
+    assert dispatcher.counters["deadline_exceeded"] == 1
+
+
+def test_hedging_needs_a_deadline_or_a_timeout():
+    with pytest.raises(ValueError):
+        Dispatcher(logging, [Model("m1", 1, sla=1)], containers(2), hedge_percentile=95)
+    with pytest.raises(ValueError):
+        Dispatcher(logging, [Model("m1", 1, sla=1)], containers(2), max_retries=1)
+    Dispatcher(logging, [Model("m1", 1, sla=1)], containers(2), hedge_percentile=95, request_timeout=1)
@@ -0,0 +1,55 @@
+import orjson
+import pytest
+
+from payloads import parse_envelope, parse_sync, predict_body
+
+BODIES = [
+    b'{"instances": [[1.0, 2.0], [3.0, 4.0]]}',
+    b'{"instances":[1,2,3],"key":"value"}',
+    b'{"signature_name": "serving_default", "instances": [{"b64": "aGVsbG8="}, {"b64": "d29ybGQ="}]}',
+    b'{"instances": [{"a": [1, 2], "b": {"c": "]"}}], "options": {"x": [1]}}',
+    b'{"instances": [["a", "b"]], "text": "contains \\"instances\\": [] and ] , \\"k\\":"}',
+    b'{"instances": ["x\\"], \\"y\\": ["], "z": 1}',
+    b'{"instances": {"inputs": [1, 2]}, "n": 2}',
+    b' { "instances" : [ 1 , 2 ] , "n" : [ 3 ] } ',
+    b'{"instances": []}',
+    b'{"instances": "not a list"}',
+    b'{"n": 1}',
+    b'[1, 2]',
+]
+
+
+@pytest.mark.parametrize("body", BODIES)
+def test_parse_envelope_round_trip(body):
+    data = orjson.loads(body)
+    envelope, instances = parse_envelope(body)
+    if isinstance(instances, (bytes, bytearray)):
+        # the raw instances are the instances of the body, the envelope has the other keys
+        assert orjson.loads(instances) == data["instances"]
+        assert envelope == {**data, "instances": None}
+        assert orjson.loads(predict_body(instances)) == {"instances": data["instances"]}
+    else:
+        assert envelope == data
+        assert instances == (data.get("instances") if isinstance(data, dict) else None)
+
+
+@pytest.mark.parametrize("body", BODIES)
+def test_parse_envelope_not_raw(body):
+    data = orjson.loads(body)
+    assert parse_envelope(body, raw=False) == (data, data.get("instances") if isinstance(data, dict) else None)
+
+
+@pytest.mark.parametrize("body", [b'{"instances": [1, 2}', b'{"instances": [1, 2]', b''])
+def test_parse_envelope_invalid(body):
+    with pytest.raises(ValueError):
+        parse_envelope(body)
+
+
+def test_parse_sync():
+    assert parse_sync(None, None, 30) is None
+    assert parse_sync("0", "5", 30) is None
+    assert parse_sync("1", None, 30) == 30
+    assert parse_sync("1", "2.5", 30) == 2.5
+    for sync, timeout in (("2", None), ("1", "0"), ("1", "-1"), ("1", "nan"), ("1", "inf"), ("1", "x")):
+        with pytest.raises(ValueError):
+            parse_sync(sync, timeout, 30)
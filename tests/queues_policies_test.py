@@ -0,0 +1,239 @@
+import queue
+import random
+import statistics
+
+import pytest
+
+from models import queues_policies as queues_policies_module
+from models.model import Model
+from models.queues_policies import QueuesPolicies
+from models.req import Req
+
+NOW = 1000.0
+MAX_SAMPLE_SIZE = QueuesPolicies.MAX_SAMPLE_SIZE
+
+
+def create_policies(models):
+    reqs_queues = {model.name: queue.Queue() for model in models}
+    return QueuesPolicies(reqs_queues, models), reqs_queues
+
+
+def put(policies, reqs_queues, model, ts_in=NOW):
+    req = Req(model, 1)
+    req.ts_in = ts_in
+    reqs_queues[model].put(req)
+    policies.queued(req)
+    return req
+
+
+def get(policies, reqs_queues, model):
+    req = reqs_queues[model].get()
+    policies.dequeued(req)
+    return req
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_length_index_same_as_the_queues(seed):
+    random.seed(seed)
+    models = [Model("m" + str(i), 1, sla=1) for i in range(random.randint(1, 8))]
+    policies, reqs_queues = create_policies(models)
+    for _ in range(500):
+        model = random.choice(models).name
+        if random.random() < 0.55:
+            put(policies, reqs_queues, model)
+        elif not reqs_queues[model].empty():
+            get(policies, reqs_queues, model)
+
+        lengths = {name: reqs_queue.qsize() for name, reqs_queue in reqs_queues.items()}
+        assert policies.queue_lengths == lengths
+        assert policies.max_length == max(lengths.values())
+        assert {length: set(bucket) for length, bucket in policies.length_buckets.items()} == \
+            {length: {name for name in lengths if lengths[name] == length} for length in set(lengths.values())}
+        assert sorted(policies.non_empty) == sorted(name for name, length in lengths.items() if length > 0)
+        assert all(policies.non_empty[position] == name for name, position in policies.non_empty_positions.items())
+        if policies.max_length > 0:
+            assert lengths[policies.policy_longest_queue()] == policies.max_length
+            assert lengths[policies.policy_round_robin()] > 0
+            assert lengths[policies.policy_random()] > 0
+
+
+def test_longest_queue_ties_broken_by_first_reached():
+    policies, reqs_queues = create_policies([Model("m1", 1, sla=1), Model("m2", 1, sla=1)])
+    put(policies, reqs_queues, "m2")
+    put(policies, reqs_queues, "m1")
+    assert policies.policy_longest_queue() == "m2"
+    put(policies, reqs_queues, "m1")
+    assert policies.policy_longest_queue() == "m1"
+    get(policies, reqs_queues, "m1")
+    assert policies.policy_longest_queue() == "m2"
+
+
+def scan_heuristic_1(reqs_queues, models, responses_list):
+    # the heuristic 1 computed scanning the queues and the completed requests
+    queue_lengths = {}
+    needs = {}
+    for model in reqs_queues:
+        queue_lengths[model] = reqs_queues[model].qsize()
+        if queue_lengths[model] == 0:
+            needs[model] = 0
+            continue
+        profiled_rt = models[model].profiled_rt or 0
+        response_times = [NOW - req.ts_in + profiled_rt for req in list(reqs_queues[model].queue)]
+        log_response_time = [req.ts_out - req.ts_in for req in responses_list[model][-MAX_SAMPLE_SIZE:]]
+        if not log_response_time:
+            avg_response_time = statistics.mean(response_times)
+        else:
+            avg_response_time = statistics.mean(response_times) * 0.5 + statistics.mean(log_response_time) * 0.5
+
+        sla = models[model].sla
+        alpha = models[model].alpha
+        if avg_response_time < sla * (1 - alpha):
+            needs[model] = 0
+        else:
+            needs[model] = avg_response_time - sla + (alpha * sla)
+
+    if max(needs.values()) == 0:
+        return max(queue_lengths, key=queue_lengths.get)
+    return max(needs, key=needs.get)
+
+
+@pytest.fixture
+def frozen_time(monkeypatch):
+    monkeypatch.setattr(queues_policies_module.time, "time", lambda: NOW)
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_heuristic_1_same_as_scan(frozen_time, seed):
+    random.seed(seed)
+    models = {}
+    for i in range(random.randint(2, 6)):
+        name = "m" + str(i)
+        models[name] = Model(name, 1, sla=random.uniform(0.1, 1), alpha=random.uniform(0, 1),
+                             profiled_rt=random.choice([None, random.uniform(0.01, 0.2)]))
+    policies, reqs_queues = create_policies(list(models.values()))
+    responses_list = {name: [] for name in models}
+
+    for _ in range(random.randint(1, 300)):
+        name = random.choice(list(models))
+        action = random.random()
+        if action < 0.6:
+            put(policies, reqs_queues, name, NOW - random.uniform(0, 2))
+        elif action < 0.8 and not reqs_queues[name].empty():
+            get(policies, reqs_queues, name)
+        else:
+            req = Req(name, 1)
+            req.ts_in = NOW - random.uniform(0, 3)
+            req.ts_out = req.ts_in + random.uniform(0.01, 1)
+            responses_list[name].append(req)
+            policies.completed(req)
+
+        if any(not reqs_queue.empty() for reqs_queue in reqs_queues.values()):
+            assert policies.policy_heuristic_1() == scan_heuristic_1(reqs_queues, models, responses_list)
+
+
+def test_heuristic_1_empty_queues():
+    policies, _ = create_policies([Model("m1", 1, sla=0.5), Model("m2", 1, sla=0.5)])
+    assert policies.policy_heuristic_1() in ("m1", "m2")
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_earliest_deadline_order(seed):
+    random.seed(seed)
+    models = [Model("m" + str(i), 1, sla=random.uniform(0.05, 1)) for i in range(5)] + [Model("none", 1)]
+    slas = {model.name: model.sla for model in models}
+    policies, reqs_queues = create_policies(models)
+    ts_in = NOW
+    for _ in range(300):
+        ts_in += random.uniform(0, 0.01)
+        put(policies, reqs_queues, random.choice(models).name, ts_in)
+
+    # the requests are served by deadline, the requests without SLA at the end
+    deadlines = []
+    while any(not reqs_queue.empty() for reqs_queue in reqs_queues.values()):
+        req = get(policies, reqs_queues, policies.policy_earliest_deadline())
+        sla = slas[req.model]
+        deadlines.append(req.ts_in + sla if sla is not None else float("inf"))
+    assert len(deadlines) == 300
+    assert deadlines == sorted(deadlines)
+
+
+def test_earliest_deadline_ties_broken_by_the_order_of_the_models():
+    policies, reqs_queues = create_policies([Model("m1", 1, sla=0.5), Model("m2", 1, sla=0.25)])
+    put(policies, reqs_queues, "m2", NOW + 0.25)
+    put(policies, reqs_queues, "m1", NOW)
+    assert policies.policy_earliest_deadline() == "m1"
+    get(policies, reqs_queues, "m1")
+    assert policies.policy_earliest_deadline() == "m2"
+
+
+def completed(policies, model, process_time):
+    req = Req(model, 1)
+    req.ts_in = NOW
+    req.ts_out = NOW + process_time
+    req.process_time = process_time
+    policies.completed(req)
+
+
+def test_weighted_fair_time_shared_by_weight():
+    models = [Model("m1", 1, profiled_rt=0.01, weight=2), Model("m2", 1, profiled_rt=0.03),
+              Model("m3", 1, profiled_rt=0.01)]
+    policies, reqs_queues = create_policies(models)
+    for model in models:
+        for _ in range(3):
+            put(policies, reqs_queues, model.name)
+
+    times = {model.name: 0 for model in models}
+    for _ in range(4000):
+        model = policies.policy_weighted_fair()
+        get(policies, reqs_queues, model)
+        put(policies, reqs_queues, model)
+        times[model] += policies.cost(model)
+    total = sum(times.values())
+    assert times["m1"] / total == pytest.approx(0.5, abs=0.01)
+    assert times["m2"] / total == pytest.approx(0.25, abs=0.01)
+    assert times["m3"] / total == pytest.approx(0.25, abs=0.01)
+
+
+def test_weighted_fair_charges_the_batches():
+    policies, reqs_queues = create_policies([Model("m1", 1, profiled_rt=0.01), Model("m2", 1, profiled_rt=0.01)])
+    put(policies, reqs_queues, "m1")
+    put(policies, reqs_queues, "m2")
+    model = policies.policy_weighted_fair()
+    deficit = policies.deficits[model]
+    policies.charge(policies.policy_weighted_fair, model, 4)
+    assert policies.deficits[model] == pytest.approx(deficit - 4 * 0.01)
+    # only the deficit round robin charges
+    policies.charge(policies.policy_round_robin, model, 4)
+    assert policies.deficits[model] == pytest.approx(deficit - 4 * 0.01)
+    # the other queue is served while the batch is paid
+    other = "m2" if model == "m1" else "m1"
+    assert [policies.policy_weighted_fair() for _ in range(4)] == [other] * 4
+
+
+def test_weighted_fair_costs_without_profiled_rt():
+    policies, reqs_queues = create_policies([Model("m1", 1, profiled_rt=0), Model("m2", 1)])
+    assert policies.cost("m1") == QueuesPolicies.DEFAULT_COST
+    assert policies.drr_quantum == QueuesPolicies.DEFAULT_COST
+    put(policies, reqs_queues, "m1")
+    put(policies, reqs_queues, "m2")
+    assert policies.policy_weighted_fair() in ("m1", "m2")
+
+    # a model without cost is on the scale of the known costs
+    completed(policies, "m1", 0.01)
+    assert policies.drr_quantum == pytest.approx(0.01)
+    assert policies.cost("m2") == pytest.approx(0.01)
+    completed(policies, "m2", 0.03)
+    assert policies.drr_quantum == pytest.approx(0.03)
+
+
+def test_weighted_fair_quantum_follows_the_costs():
+    policies, _ = create_policies([Model("m1", 1, profiled_rt=1), Model("m2", 1, profiled_rt=0.01),
+                                   Model("m3", 1)])
+    assert policies.drr_quantum == 1
+    assert policies.cost("m3") == pytest.approx((1 + 0.01) / 2)
+    # the quantum shrinks when the max cost decreases
+    completed(policies, "m1", 0.02)
+    assert policies.drr_quantum == pytest.approx(0.02)
+    assert policies.cost("m3") == pytest.approx((0.02 + 0.01) / 2)
+    completed(policies, "m2", 0.5)
+    assert policies.drr_quantum == pytest.approx(0.5)
@@ -0,0 +1,159 @@
+import random
+import time
+
+import pytest
+
+from models.device import Device
+from models.req import Req
+import requests_index as requests_index_module
+from requests_index import RequestsIndex
+
+CONTAINERS = ["tfserving-gpu-0", "tfserving-cpu-0", "tfserving-cpu-1"]
+MODELS = ["m1", "m2"]
+DURATION = 60
+
+
+def requests(num_requests, now):
+    # requests of the last DURATION seconds: completed, waiting, rejected and just created
+    random.seed(7)
+    reqs = []
+    for i in range(num_requests):
+        req = Req(random.choice(MODELS), 1)
+        req.ts_in = now - DURATION + random.uniform(0, DURATION - 1)
+        draw = random.random()
+        if draw < 0.05:
+            req.set_rejected("429")
+        elif draw < 0.9:
+            req.container_id = random.choice(CONTAINERS)
+            req.device = Device.GPU if "gpu" in req.container_id else Device.CPU
+            req.set_waiting(req.ts_in + random.uniform(0, 0.1))
+            if draw < 0.8:
+                req.set_completed(None, req.ts_wait + random.uniform(0.01, 0.5))
+        reqs.append(req)
+    return reqs
+
+
+@pytest.fixture(scope="module")
+def stored():
+    now = time.time()
+    reqs = requests(5000, now)
+    index = RequestsIndex(bucket_width=1, retention_time=2 * DURATION)
+    for req in reqs:
+        index.store(req)
+    return index, reqs, now
+
+
+def assert_same_metrics(metrics, expected):
+    for key, value in expected.items():
+        if isinstance(value, float):
+            assert metrics[key] == pytest.approx(value, rel=1e-9, abs=1e-12), key
+        else:
+            assert metrics[key] == value, key
+
+
+@pytest.mark.parametrize("ago", [DURATION + 10, DURATION / 2, 10.5, 0.25, 0])
+def test_metrics_same_as_req_metrics(stored, ago):
+    index, reqs, now = stored
+    from_ts = now - ago
+    assert_same_metrics(index.metrics(from_ts), Req.metrics(reqs, from_ts))
+
+
+@pytest.mark.parametrize("container_id", CONTAINERS + [None])
+@pytest.mark.parametrize("model", MODELS + [None])
+def test_metrics_by_container_and_model(stored, container_id, model):
+    index, reqs, now = stored
+    selected = [req for req in reqs if (container_id is None or req.container_id == container_id)
+                and (model is None or req.model == model)]
+    for from_ts in (0, now - 30.3, now - 5):
+        assert_same_metrics(index.metrics(from_ts, container_id, model), Req.metrics(selected, from_ts))
+
+
+def test_stored_state_replaced():
+    index = RequestsIndex()
+    req = Req("m1", 1)
+    req.ts_in = time.time()
+    index.store(Req(json_data=req.to_json()))
+    req.container_id = CONTAINERS[0]
+    req.device = Device.GPU
+    req.set_waiting()
+    req.set_completed(None, req.ts_wait + 0.1)
+    index.store(req)
+    # an event older than the stored state is ignored
+    assert not index.store(Req(json_data={**req.to_json(), "state": 0}))
+    assert len(index) == 1
+    assert_same_metrics(index.metrics(0, CONTAINERS[0]), Req.metrics([req]))
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    # the time of the index, moved by the tests
+    clock = {"now": 100000.0}
+    monkeypatch.setattr(requests_index_module.time, "time", lambda: clock["now"])
+    return clock
+
+
+def store_in_order(index, reqs, clock):
+    # the requests stored at their arrival
+    for req in sorted(reqs, key=lambda req: req.ts_in):
+        clock["now"] = req.ts_in
+        index.store(req)
+
+
+def test_evicted_over_max_requests(clock):
+    reqs = requests(2000, clock["now"])
+    index = RequestsIndex(bucket_width=1, retention_time=2 * DURATION, max_requests=500, downsample_width=10)
+    store_in_order(index, reqs, clock)
+    assert len(index) <= 500
+    assert index.evicted == len(reqs) - len(index)
+    evicted_until = index.evicted_until
+    assert sorted(req.id for req in index.values()) == \
+        sorted(req.id for req in reqs if index.bucket(req.ts_in) >= evicted_until)
+
+    # the metrics of the evicted requests are kept in the coarse buckets
+    assert_same_metrics(index.metrics(0), Req.metrics(reqs, 0))
+    from_ts = (evicted_until - 15) * index.bucket_width + 0.5
+    coarse_from_ts = index.coarse_bucket(index.bucket(from_ts)) * index.downsample_width
+    assert_same_metrics(index.metrics(from_ts), Req.metrics(reqs, coarse_from_ts))
+    assert_same_metrics(index.metrics(evicted_until), Req.metrics(reqs, evicted_until))
+
+    # the events of the evicted requests are dropped
+    evicted = next(req for req in reqs if index.bucket(req.ts_in) < evicted_until)
+    assert not index.store(Req(json_data=evicted.to_json()))
+    assert index.late == 1
+    assert evicted.id not in index.reqs
+
+
+def test_evicted_after_retention_time(clock):
+    reqs = requests(1000, clock["now"])
+    index = RequestsIndex(bucket_width=1, retention_time=DURATION / 2, downsample_width=10,
+                          aggregates_retention_time=2 * DURATION)
+    store_in_order(index, reqs, clock)
+    now = clock["now"]
+    # the requests are evicted every EVICTION_INTERVAL seconds
+    oldest = now - DURATION / 2 - RequestsIndex.EVICTION_INTERVAL
+    assert index.bucket(oldest) <= index.evicted_until <= index.bucket(now - DURATION / 2)
+    assert all(req.ts_in >= oldest - 1 for req in index.values())
+    assert index.evicted == len(reqs) - len(index) > 0
+    assert index.late == 0
+    assert_same_metrics(index.metrics(0), Req.metrics(reqs, 0))
+
+    # the coarse buckets are dropped after aggregates_retention_time
+    assert index.status()["aggregates"] > 0
+    clock["now"] += 3 * DURATION
+    index.store(requests(1, clock["now"])[0])
+    assert index.status()["aggregates"] == 0
+    assert index.dropped_aggregates > 0
+    assert index.status()["requests"] == 1
+
+
+def test_retention_changed(clock):
+    reqs = requests(1000, clock["now"])
+    index = RequestsIndex(bucket_width=1, retention_time=2 * DURATION)
+    store_in_order(index, reqs, clock)
+    assert len(index) == len(reqs)
+
+    index.set_retention(DURATION / 4, 100, 2 * DURATION)
+    index.store(reqs[0])
+    assert len(index) <= 100
+    assert all(req.ts_in >= clock["now"] - DURATION / 4 - 1 for req in index.values())
+    assert index.status()["evicted"] == len(reqs) - len(index)
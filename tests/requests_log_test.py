@@ -0,0 +1,100 @@
+import os
+
+import pytest
+
+from models.device import Device
+from models.req import Req
+from requests_log import RequestsLog
+
+
+def completed_req(i):
+    req = Req("m" + str(i % 2), 1)
+    req.container_id = "cpu-" + str(i % 3)
+    req.device = Device.CPU
+    req.set_waiting(req.ts_in + 0.01)
+    req.set_completed(None, req.ts_wait + 0.1)
+    return req
+
+
+def replayed(log_dir):
+    stored = {}
+    log = RequestsLog(log_dir, fsync_interval=60)
+    log.replay(lambda req: stored.__setitem__(req.id, req.to_json()))
+    log.close()
+    return log, stored
+
+
+def test_replay_the_last_state(tmp_path):
+    log_dir = str(tmp_path)
+    log = RequestsLog(log_dir, fsync_interval=60)
+    reqs = [Req("m1", 1) for _ in range(3)]
+    for req in reqs:
+        log.append(Req(json_data=req.to_json()))
+    reqs.append(completed_req(0))
+    log.append(reqs[-1])
+    # the most advanced state of a request in a block is replayed
+    req = Req(json_data=reqs[0].to_json())
+    req.set_waiting()
+    log.append(req)
+    log.append(Req(json_data=reqs[0].to_json()))
+    reqs[0] = req
+    log.close()
+
+    log, stored = replayed(log_dir)
+    assert log.replayed == len(reqs) and log.torn == 0
+    assert stored == {req.id: req.to_json() for req in reqs}
+
+
+def test_replay_stops_at_a_torn_block(tmp_path):
+    log_dir = str(tmp_path)
+    log = RequestsLog(log_dir, fsync_interval=60)
+    first = [completed_req(i) for i in range(10)]
+    for req in first:
+        log.append(req)
+    log.sync()
+    for i in range(10):
+        log.append(completed_req(i))
+    log.close()
+
+    # the host failed while writing the last block
+    path = log.path
+    with open(path, "r+b") as segment:
+        segment.truncate(os.path.getsize(path) - 5)
+    log, stored = replayed(log_dir)
+    assert log.torn == 1
+    assert stored == {req.id: req.to_json() for req in first}
+
+
+@pytest.mark.parametrize("field, value", [("state", None), ("ts_in", "x"), ("version", [1]), ("ts_out", 10 ** 400)],
+                         ids=["state", "ts_in", "version", "ts_out"])
+def test_invalid_event_rejected(tmp_path, field, value):
+    log_dir = str(tmp_path)
+    log = RequestsLog(log_dir, fsync_interval=0.01)
+    invalid = completed_req(0)
+    setattr(invalid, field, value)
+    assert not log.append(invalid)
+    reqs = [completed_req(i) for i in range(3)]
+    for req in reqs:
+        assert log.append(req)
+    log.sync()
+    log.close()
+    assert log.status()["rejected"] == 1 and log.status()["pending"] == 0
+
+    log, stored = replayed(log_dir)
+    assert stored == {req.id: req.to_json() for req in reqs}
+
+
+def test_block_not_encoded_dropped(tmp_path):
+    log = RequestsLog(str(tmp_path), fsync_interval=0.01)
+    req = completed_req(0)
+    assert log.append(req)
+    # the request changed before it was written
+    req.state = None
+    log.sync()
+    assert log.dropped == 1 and not log.pending
+    req = completed_req(1)
+    assert log.append(req)
+    log.close()
+
+    log, stored = replayed(str(tmp_path))
+    assert stored == {req.id: req.to_json()}
@@ -0,0 +1,65 @@
+import os
+import threading
+import time
+
+from models.req import Req, ReqState
+from requests_logger import RequestsLogger
+
+
+def start(logger):
+    # the sent requests, the flusher runs until the end of the tests
+    sent = []
+    logger.send = sent.extend
+    threading.Thread(target=logger.flush_loop, daemon=True).start()
+    return sent
+
+
+def wait_for(condition, timeout=5):
+    end = time.time() + timeout
+    while not condition() and time.time() < end:
+        time.sleep(0.01)
+    assert condition()
+
+
+def test_events_coalesced():
+    logger = RequestsLogger("http://requests-store/requests", batch_size=10, flush_interval=0.05)
+    req = Req("m1", 1, [0])
+    logger.log(req)
+    req.set_waiting()
+    logger.log(req)
+    req.set_completed(None)
+    logger.log(req)
+    assert len(logger.pending) == 1
+
+    sent = start(logger)
+    wait_for(lambda: sent)
+    # the request is sent once with its last state
+    time.sleep(0.1)
+    assert len(sent) == 1
+    assert sent[0]["id"] == req.id and sent[0]["state"] == ReqState.COMPLETED
+
+
+def test_over_max_pending_dropped():
+    logger = RequestsLogger("http://requests-store/requests", batch_size=10, max_pending=2)
+    for _ in range(5):
+        logger.log(Req("m1", 1, [0]))
+    assert len(logger.pending) == 2
+    assert logger.dropped == 3
+
+
+def test_over_max_pending_spilled_and_replayed(tmp_path):
+    spill_file = str(tmp_path / "spill.jsonl")
+    logger = RequestsLogger("http://requests-store/requests", batch_size=2, flush_interval=0.05, max_pending=1,
+                            spill_file=spill_file)
+    reqs = [Req("m1", 1, [0]) for _ in range(5)]
+    for req in reqs:
+        logger.log(req)
+    # log does not write the spill file
+    assert len(logger.overflow) == 4
+    assert not os.path.exists(spill_file)
+
+    sent = start(logger)
+    wait_for(lambda: len(sent) == len(reqs))
+    assert sorted(req_json["id"] for req_json in sent) == sorted(req.id for req in reqs)
+    assert logger.spilled == 4
+    wait_for(lambda: logger.spilled_pending == 0 and not os.path.exists(spill_file + ".replay"))